@@ -0,0 +1,148 @@
+"""
+Compares :func:`eventum.lib.text.truncate_html` with the implementation it
+replaced, on large generated blog posts.
+
+Run it from the root of the repository::
+
+    python benchmarks/truncate_html.py
+
+Each case is timed for both implementations, and their output is checked to
+be identical, including when the new implementation is given the post in
+chunks.
+"""
+
+from __future__ import print_function
+
+import random
+import re
+import timeit
+
+from eventum.lib.text import truncate_html
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua '
+         'AT&amp;T caf&eacute;').split()
+
+
+def legacy_truncate_html(text, truncate_len, truncate_text):
+    """The implementation of :func:`truncate_html` before it was rewritten
+    to stream, kept for comparison.
+    """
+    re_words = re.compile(r'<.*?>|((?:\w[-\w]*|&.*?;)+)', re.U | re.S)
+    re_tag = re.compile(r'<(/)?([^ ]+?)(?:(\s*/)| .*?)?>', re.S)
+
+    length = truncate_len
+
+    if length <= 0:
+        return ''
+
+    html4_singlets = (
+        'br', 'col', 'link', 'base', 'img',
+        'param', 'area', 'hr', 'input'
+    )
+
+    # Count non-HTML chars/words and keep note of open tags
+    pos = 0
+    end_text_pos = 0
+    current_len = 0
+    open_tags = []
+
+    while current_len <= length:
+        m = re_words.search(text, pos)
+        if not m:
+            # Checked through whole string
+            break
+        pos = m.end(0)
+        if m.group(1):
+            # It's an actual non-HTML word or char
+            current_len += 1
+            if current_len == truncate_len:
+                end_text_pos = pos
+            continue
+        # Check for tag
+        tag = re_tag.match(m.group(0))
+        if not tag or current_len >= truncate_len:
+            # Don't worry about non tags or tags after our truncate point
+            continue
+        closing_tag, tagname, self_closing = tag.groups()
+        # Element names are always case-insensitive
+        tagname = tagname.lower()
+        if self_closing or tagname in html4_singlets:
+            pass
+        elif closing_tag:
+            # Check for match in open tags list
+            try:
+                i = open_tags.index(tagname)
+            except ValueError:
+                pass
+            else:
+                # SGML: An end tag closes, back to the matching start tag,
+                # all unclosed intervening start tags with omitted end tags
+                open_tags = open_tags[i + 1:]
+        else:
+            # Add it to the start of the open tags list
+            open_tags.insert(0, tagname)
+
+    if current_len <= length:
+        return text
+    out = text[:end_text_pos]
+    if truncate_text:
+        out += truncate_text
+    # Close any tags still open
+    for tag in open_tags:
+        out += '</{}>'.format(tag)
+    # Return string
+    return out
+
+
+def paragraphs(count, seed=0):
+    """Returns a post of ``count`` paragraphs of markup-heavy HTML."""
+    rand = random.Random(seed)
+    html = []
+    for i in range(count):
+        words = [rand.choice(WORDS) for _ in range(rand.randint(20, 80))]
+        words[rand.randrange(len(words))] = '<em>%s</em>' % rand.choice(WORDS)
+        words[rand.randrange(len(words))] = '<a href="/p/%d">link</a>' % i
+        html.append('<p>%s<br/>\n<img src="%d.png" /></p>' %
+                    (' '.join(words), i))
+    return '\n'.join(html)
+
+
+def nested(depth):
+    """Returns ``depth`` nested ``<div>`` tags, each with one word in it."""
+    return '<div>word ' * depth + '</div>' * depth
+
+
+def chunks(text, size=4096):
+    """Yields ``text`` in pieces of ``size`` characters."""
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+CASES = [
+    ('100 words of a 2,000 paragraph post', paragraphs(2000), 100),
+    ('all of a 2,000 paragraph post', paragraphs(2000), 10 ** 6),
+    ('all of 5,000 nested divs', nested(5000), 10 ** 6),
+]
+
+
+def main(number=5):
+    print('%-40s %12s %12s %8s' % ('case', 'legacy (ms)', 'new (ms)',
+                                   'speedup'))
+    for name, html, length in CASES:
+        expected = legacy_truncate_html(html, length, '...')
+        assert truncate_html(html, length, '...') == expected
+        assert truncate_html(chunks(html), length, '...') == expected
+
+        legacy = min(timeit.repeat(
+            lambda: legacy_truncate_html(html, length, '...'),
+            number=number, repeat=3)) / number
+        new = min(timeit.repeat(
+            lambda: truncate_html(chunks(html), length, '...'),
+            number=number, repeat=3)) / number
+        print('%-40s %12.2f %12.2f %7.1fx' % (name, legacy * 1000,
+                                              new * 1000, legacy / new))
+
+
+if __name__ == '__main__':
+    main()
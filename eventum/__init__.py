@@ -17,12 +17,18 @@ class Eventum(object):
         self._assets = None
         self.db = None
         self._gcal_client = None
+        self._gcal_outbox = None
+        self._response_cache = None
+        self._file_maintenance = None
         if app is not None:
             self.init_app(app)
 
     def init_app(self, app):
+        from eventum.lib.file_maintenance import FileMaintenance
         from eventum.lib.google_calendar import GoogleCalendarAPIClient
+        from eventum.lib.google_calendar_outbox import GoogleCalendarOutbox
         from eventum.lib.google_web_server_auth import set_web_server_client_id
+        from eventum.lib.response_cache import ResponseCache
         from eventum.routes.base import configure_routing
 
         # Register ourselves as a Flask extension.
@@ -44,6 +50,9 @@ class Eventum(object):
         self.db = MongoEngine(app)
         self.register_delete_rules()
 
+        # Server-side cache of rendered responses.
+        self._response_cache = ResponseCache(app)
+
         # Blueprints
         self.register_blueprints()
         # before_request, after_request, context_processor
@@ -55,6 +64,14 @@ class Eventum(object):
         # Google Calendar API Client
         self._gcal_client = GoogleCalendarAPIClient(app)
 
+        # Google Calendar outbox, and its background worker.
+        self._gcal_outbox = GoogleCalendarOutbox(app, self._gcal_client)
+        app.before_request(self._gcal_outbox.ensure_worker)
+
+        # Moving and cleaning up uploaded files, in the background.
+        self._file_maintenance = FileMaintenance(app)
+        app.before_request(self._file_maintenance.ensure_worker)
+
         # Google Web Server Application Setup
         set_web_server_client_id(app)
 
@@ -65,6 +82,18 @@ class Eventum(object):
     def gcal_client(cls):
         return current_app.extensions[cls.EXTENSION_NAME]._gcal_client
 
+    @classmethod
+    def gcal_outbox(cls):
+        return current_app.extensions[cls.EXTENSION_NAME]._gcal_outbox
+
+    @classmethod
+    def response_cache(cls):
+        return current_app.extensions[cls.EXTENSION_NAME]._response_cache
+
+    @classmethod
+    def file_maintenance(cls):
+        return current_app.extensions[cls.EXTENSION_NAME]._file_maintenance
+
     def _normalize_client_settings(self):
         if 'EVENTUM_SETTINGS' in self.app.config:
             # Eventum settings provided as a dictionary.
@@ -86,7 +115,8 @@ class Eventum(object):
             self.app.config.setdefault(attr, getattr(eventum_config, attr))
 
     def register_blueprints(self):
-        from eventum.routes.base import register_error_handlers
+        from eventum.routes.base import (register_cache_policy,
+                                         register_error_handlers)
         from eventum.routes import (admin, auth, events, media, posts, users,
                                     whitelist, api, eventum)
         admin_blueprints = [admin, auth, events, media, posts, users,
@@ -96,6 +126,7 @@ class Eventum(object):
         static_path = self.app.config['EVENTUM_STATIC_FOLDER']
         for bp in admin_blueprints:
             register_error_handlers(bp)
+            register_cache_policy(bp)
             self.app.register_blueprint(bp,
                                         url_prefix=url_prefix,
                                         static_path=static_path)
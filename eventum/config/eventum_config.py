@@ -38,6 +38,18 @@ EVENTUM_URL_PREFIX = '/admin'
 # File extensions that are allowed to be uploaded via the Media tab.
 EVENTUM_ALLOWED_UPLOAD_EXTENSIONS = set(['.png', '.jpg', '.jpeg', '.gif'])
 
+# The largest file that can be uploaded through the Media tab, in bytes.
+EVENTUM_MAX_UPLOAD_SIZE = 16 * 1024 * 1024
+
+# How uploaded images are served.  None to send them from Eventum, or
+# "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd) to have the web
+# server in front of Eventum send them.
+EVENTUM_MEDIA_OFFLOAD = None
+
+# The internal nginx location that maps to EVENTUM_UPLOAD_FOLDER, used when
+# EVENTUM_MEDIA_OFFLOAD is "x-accel-redirect".
+EVENTUM_MEDIA_ACCEL_PREFIX = '/eventum-uploads/'
+
 # The Eventum base path. If you're not sure what this is, don't mess with it.
 EVENTUM_BASEDIR = eventum.__path__[0]
 
@@ -50,6 +62,118 @@ EVENTUM_SCSS_FOLDER = path.join(EVENTUM_STATIC_FOLDER, 'eventum_scss/')
 # Eventum templates folder
 EVENTUM_TEMPLATE_FOLDER = path.join(EVENTUM_BASEDIR, 'templates/')
 
+# Whether or not changes to events should be queued in Mongo and synced to
+# Google Calendar in the background.  If not, they are synced during the
+# request.
+EVENTUM_GCAL_OUTBOX_ENABLED = True
+
+# Whether or not the web app should run the Google Calendar outbox worker in a
+# background thread.  Set to False to run the worker in a separate process.
+EVENTUM_GCAL_OUTBOX_WORKER = True
+
+# Seconds the outbox worker waits between checks when the queue is empty.
+EVENTUM_GCAL_OUTBOX_POLL_INTERVAL = 5
+
+# The number of times an outbox operation is tried before giving up.
+EVENTUM_GCAL_OUTBOX_MAX_ATTEMPTS = 8
+
+# Seconds to wait before retrying an outbox operation the first time.  The
+# delay doubles after every failure, up to EVENTUM_GCAL_OUTBOX_MAX_BACKOFF.
+EVENTUM_GCAL_OUTBOX_BACKOFF = 2
+EVENTUM_GCAL_OUTBOX_MAX_BACKOFF = 3600
+
+# Seconds after which an outbox operation that is still running is assumed to
+# have been abandoned, and is queued again.
+EVENTUM_GCAL_OUTBOX_STALLED_AFTER = 600
+
+# The number of pending outbox operations the worker looks at each pass.
+EVENTUM_GCAL_OUTBOX_SCAN_LIMIT = 500
+
+# The number of seconds the logged in user is cached for between requests.
+# Set to 0 to look the user up on every request.
+EVENTUM_USER_CACHE_TTL = 60
+
+# The Cache-Control header to send for each endpoint (like ``"media.file"``),
+# blueprint (like ``"api"``), or ``"static"`` file.  ``"fingerprinted"`` is
+# used for static files and images whose URL changes with their content,
+# ``"private"`` for responses that are only meant for the logged in user (like
+# unpublished events), and ``"default"`` for everything else.  Set this in
+# ``EVENTUM_SETTINGS`` to override individual policies.  They only apply to
+# Eventum's routes.
+EVENTUM_CACHE_POLICIES = {
+    'default': 'public, max-age=0',
+    'fingerprinted': 'public, max-age=31536000, immutable',
+    'private': 'private, no-cache',
+    'static': 'public, max-age=3600',
+    'media.file': 'public, max-age=3600',
+    'api': 'public, max-age=60'
+}
+
+# Where rendered pages are cached: "lru" for an in-process cache, "redis" for
+# a Redis server at EVENTUM_RESPONSE_CACHE_REDIS_URL, or None to disable.
+# Changes only invalidate the "lru" cache of the process that made them, so it
+# is only correct when the app runs in a single process.  With several worker
+# processes, or a separate Google Calendar outbox worker, use "redis".
+EVENTUM_RESPONSE_CACHE = None
+
+# The number of responses kept by the "lru" response cache.
+EVENTUM_RESPONSE_CACHE_SIZE = 256
+
+# The longest a response is cached for, in seconds.  Responses are also
+# dropped as soon as the documents they show change.
+EVENTUM_RESPONSE_CACHE_TIMEOUT = 300
+
+# The Redis server used when EVENTUM_RESPONSE_CACHE is "redis".
+EVENTUM_RESPONSE_CACHE_REDIS_URL = 'redis://localhost:6379/0'
+
+# The smaller versions of uploaded images to generate, by name, and the
+# largest width and height of each, in pixels.  Requires Pillow.
+EVENTUM_IMAGE_VARIANTS = {
+    'thumbnail': 300,
+    'medium': 1024
+}
+
+# Whether to also generate a WebP copy of each image variant.
+EVENTUM_IMAGE_WEBP = True
+
+# The number of background threads that generate image variants.
+EVENTUM_IMAGE_VARIANT_WORKERS = 2
+
+# Whether or not the web app should move the files of deleted images, collect
+# orphaned uploads and purge old deleted files in a background thread.  If
+# not, files are moved during the request, and sweeps must be run from a
+# separate process.
+EVENTUM_FILE_MAINTENANCE_WORKER = True
+
+# Seconds between sweeps for orphaned uploads and expired deleted files.
+EVENTUM_FILE_MAINTENANCE_SWEEP_INTERVAL = 3600
+
+# The number of times moving a deleted file is tried before giving up.
+EVENTUM_FILE_MAINTENANCE_MAX_ATTEMPTS = 5
+
+# Seconds to wait before retrying a move the first time.  The delay doubles
+# after every failure, up to EVENTUM_FILE_MAINTENANCE_MAX_BACKOFF.
+EVENTUM_FILE_MAINTENANCE_BACKOFF = 1
+EVENTUM_FILE_MAINTENANCE_MAX_BACKOFF = 300
+
+# Seconds an uploaded file may go without an image referring to it before it
+# is moved to EVENTUM_DELETE_FOLDER, like 24 * 60 * 60.  Set to None to leave
+# files that no image refers to alone.
+EVENTUM_ORPHAN_GRACE_PERIOD = None
+
+# Days that files are kept in EVENTUM_DELETE_FOLDER before they are removed
+# for good, like 30.  Set to None to keep them forever.
+EVENTUM_DELETE_RETENTION_DAYS = None
+
+# The snippets of each blog post that are made when it is saved, as keyword
+# arguments to BlogPost.snippet(), so that listings don't have to load the
+# posts' content.  Other snippets are made from the content each time.  Posts
+# saved before snippets were stored get them the next time they are saved.
+EVENTUM_POST_SNIPPETS = [
+    {'length': 40, 'newlines': False, 'tags': False},
+    {}
+]
+
 ######################
 # Must be overridden #
 ######################
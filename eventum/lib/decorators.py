@@ -73,8 +73,6 @@ class requires_privilege(object):
         :returns: The parameter function ``f``, but with checks for login.
         :rtype: func
         """
-        from eventum.routes.base import lookup_current_user
-
         @login_required
         @wraps(f)
         def decorated_function(*args, **kwargs):
@@ -83,7 +81,7 @@ class requires_privilege(object):
             :param args: Arguments for ``f``.
             :params kwargs: Keyword arguments for ``f``.
             """
-            lookup_current_user()
+            # ``login_required`` has already looked up ``g.user``.
             try:
                 if not g.user.can(self.privilege):
                     return abort(401)
@@ -144,3 +142,82 @@ def skip_and_return_if_auth_disabled(f):
         return f(self, *args, **kwargs)
 
     return decorated_function
+
+
+def cached(*tags):
+    """A decorator that caches the response of a ``GET`` route in the
+    :class:`~app.lib.response_cache.ResponseCache`, until one of ``tags`` is
+    invalidated.
+
+    Responses are cached per user, session (through its CSRF token), and query
+    string.  Requests with flashed messages waiting to be shown are never
+    cached.  Use this below :func:`login_required` or
+    :class:`requires_privilege`, so that permissions are still checked::
+
+        @admin.route('/home')
+        @login_required
+        @cached('events', 'posts')
+        def index():
+            ...
+
+    :param tags: The kinds of documents (like ``"events"``) that the response
+        is rendered from.
+    :type tags: list of str
+    :returns: The decorator.
+    :rtype: func
+    """
+    from eventum import Eventum
+    from eventum.routes.base import apply_cache_validators
+
+    def decorator(f):
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            """The decorated version of ``f`` (see :func:`cached`).
+
+            :param args: Arguments for ``f``.
+            :params kwargs: Keyword arguments for ``f``.
+            """
+            cache = Eventum.response_cache()
+            if (not cache.enabled or request.method != 'GET' or
+                    '_flashes' in session):
+                return f(*args, **kwargs)
+
+            cached_response = cache.get(_cache_name(), tags)
+            if cached_response is not None:
+                body, status, headers = cached_response
+                return current_app.response_class(body, status, headers)
+
+            response = current_app.make_response(f(*args, **kwargs))
+            # Store the validators with the response, because the view won't
+            # be run to set them again when it is served from the cache.
+            apply_cache_validators(response)
+            if (response.status_code == 200 and
+                    not response.is_streamed and
+                    '_flashes' not in session):
+                headers = [(k, v) for k, v in response.headers
+                           if k.lower() not in ('set-cookie',
+                                                'content-length')]
+                # Rendering may have created the CSRF token, so the name is
+                # made again.
+                cache.set(_cache_name(), tags,
+                          (response.get_data(), response.status_code,
+                           headers))
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
+def _cache_name():
+    """Returns the name that the response to the current request is cached
+    under by :func:`cached`.
+
+    :rtype: str
+    """
+    user = getattr(g, 'user', None)
+    return '|'.join([request.endpoint,
+                     request.full_path,
+                     str(user.id) if user is not None else '',
+                     session.get('csrf_token', '')])
@@ -64,6 +64,7 @@ import re
 
 HTTP_OK = 200
 HTTP_BAD_REQUEST = 400
+HTTP_REQUEST_ENTITY_TOO_LARGE = 413
 HTTP_INTERNAL_SERVER_ERROR = 500
 
 # Dictionary of:
@@ -129,7 +130,53 @@ _ERROR_DATA = {
                 'A series should either end on a specific date, or after a '
                 'specific number of occurences.  Series.ends_on and ends_after'
                 ' are both false.',
-                660, HTTP_BAD_REQUEST, {})
+                660, HTTP_BAD_REQUEST, {}),
+
+            'HttpError': (
+                'Google Calendar returned an error.',
+                670, HTTP_INTERNAL_SERVER_ERROR, {
+
+                    'BadRequest': (
+                        'Google Calendar rejected the request as invalid.',
+                        671, HTTP_INTERNAL_SERVER_ERROR, {}),
+
+                    'Unauthorized': (
+                        'Google Calendar rejected our credentials.',
+                        672, HTTP_INTERNAL_SERVER_ERROR, {}),
+
+                    'Forbidden': (
+                        'Google Calendar denied access to the calendar.',
+                        673, HTTP_INTERNAL_SERVER_ERROR, {}),
+
+                    'Conflict': (
+                        'The request conflicted with the event on Google '
+                        'Calendar.',
+                        674, HTTP_INTERNAL_SERVER_ERROR, {}),
+
+                    'RateLimited': (
+                        'Google Calendar rate limited the request.',
+                        675, HTTP_INTERNAL_SERVER_ERROR, {}),
+
+                    'ServerError': (
+                        'Google Calendar failed to handle the request.',
+                        676, HTTP_INTERNAL_SERVER_ERROR, {}),
+                }),
+        }),
+
+    ###########################
+    # 7XX: File Upload Errors #
+    ###########################
+    'Upload': (
+        'The file could not be uploaded.',
+        700, HTTP_BAD_REQUEST, {
+
+            'TooLarge': (
+                'Files can be at most %s bytes.',
+                710, HTTP_REQUEST_ENTITY_TOO_LARGE, {}),
+
+            'WrongType': (
+                'The file is not a valid %s image.',
+                720, HTTP_BAD_REQUEST, {}),
         }),
 }
 
@@ -83,10 +83,12 @@ These data structures include:
     }
 """
 
+from bson import ObjectId
 from eventum.models import Event, EventSeries, Image
 from eventum.forms import EditEventForm
-from datetime import timedelta
+from datetime import datetime, timedelta
 from eventum import Eventum as e
+from eventum.lib.response_cache import invalidate
 
 
 class EventsHelper(object):
@@ -152,8 +154,8 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
         if form.is_recurring.data:
@@ -182,8 +184,8 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
         # Determine if the event should be moved between calendars
@@ -226,8 +228,8 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
         if event.is_recurring:
@@ -257,8 +259,8 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
         # Generate the event and date data
@@ -271,8 +273,8 @@ class EventsHelper(object):
         event = Event(**event_and_date_data)
         event.save()
 
-        # Return the Google Calendar response
-        return e.gcal_client().create_event(event)
+        # Return the queued Google Calendar operation
+        return e.gcal_outbox().create_event(event)
 
     @classmethod
     def create_series(cls, form, creator):
@@ -289,8 +291,8 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
         event_data = DataBuilder.event_data_from_form(form, creator=creator)
@@ -303,15 +305,14 @@ class EventsHelper(object):
         event_data['parent_series'] = series
 
         # Make the individual Event objects in the series
-        while cls._more_events(series, date_data):
-            ev = cls._make_event(event_data, date_data)
-            series.events.append(ev)
-            cls._increment_date_data(series, date_data)
+        cls._make_events(series, event_data, date_data)
 
         series.save()
 
-        # Return the Google Calendar response
-        return e.gcal_client().create_event(series.events[0])
+        # The whole series is one recurring event on Google Calendar, so this
+        # is a single operation.  It isn't wrapped in ``client.batch()``: the
+        # outbox worker already sends it in a batch with other events' writes.
+        return e.gcal_outbox().create_event(series.events[0])
 
     @classmethod
     def update_single_event(cls, event, form, move_to=None):
@@ -329,8 +330,8 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
         event_and_date_data = DataBuilder.event_and_date_data_from_form(form)
@@ -339,12 +340,12 @@ class EventsHelper(object):
 
         # Update the event in Google Calendar and publish it as necessary
         if move_to == cls.PUBLIC:
-            response = e.gcal_client().publish_event(event)
+            response = e.gcal_outbox().publish_event(event)
         elif move_to == cls.PRIVATE:
-            response = e.gcal_client().unpublish_event(event)
-        response = e.gcal_client().update_event(event)
+            response = e.gcal_outbox().unpublish_event(event)
+        response = e.gcal_outbox().update_event(event)
 
-        # Return the Google Calendar response
+        # Return the queued Google Calendar operation
         return response
 
     @classmethod
@@ -362,8 +363,8 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
         # Build the event, date, and series data, validating the series data.
@@ -375,10 +376,8 @@ class EventsHelper(object):
         if cls._changes_are_easy(event, series_data, date_data):
             # If changes are easy, then we can make them on the Event objects
             # that already exist.
-            for ev in event.parent_series.events:
-                # the date data isn't changing, so pass in {}
-                cls._update_event(ev, event_data, {})
             series = event.parent_series
+            cls._update_series_events(series, event, event_data)
         else:
             # Otherwise, they changes are hard, and we have to create fresh
             # Events.
@@ -398,21 +397,22 @@ class EventsHelper(object):
             event_data['creator'] = shared_creator
 
             # Make the individual Event objects in the series
-            while cls._more_events(series, date_data):
-                ev = cls._make_event(event_data, date_data)
-                series.events.append(ev)
-                cls._increment_date_data(series, date_data)
+            cls._make_events(series, event_data, date_data)
 
             series.save()
 
-        # Update the event in Google Calendar and publish it as necessary
+        # Update the event in Google Calendar and publish it as necessary.
+        # These can't share a ``client.batch()``, because Google may run the
+        # calls in a batch in any order and the update has to follow the
+        # move.  The outbox sends operations on one series in the order they
+        # were queued, one batch at a time, batched with other events' writes.
         if move_to == cls.PUBLIC:
-            response = e.gcal_client().publish_event(series.events[0])
+            response = e.gcal_outbox().publish_event(series.events[0])
         elif move_to == cls.PRIVATE:
-            response = e.gcal_client().unpublish_event(series.events[0])
-        response = e.gcal_client().update_event(series.events[0])
+            response = e.gcal_outbox().unpublish_event(series.events[0])
+        response = e.gcal_outbox().update_event(series.events[0])
 
-        # Return Google Calendar response
+        # Return the queued Google Calendar operation
         return response
 
     @classmethod
@@ -431,16 +431,16 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
         event_and_date_data = DataBuilder.event_and_date_data_from_form(form)
         event_and_date_data = cls._remove_none_fields(event_and_date_data)
         cls._update_event(event, event_and_date_data)
 
-        # Return Google Calendar response
-        return e.gcal_client().update_event(event, as_exception=True)
+        # Return the queued Google Calendar operation
+        return e.gcal_outbox().update_event(event, as_exception=True)
 
     @classmethod
     def convert_to_series(cls, event, form, move_to=None):
@@ -458,8 +458,8 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
         event_data = DataBuilder.event_data_from_form(form)
@@ -473,20 +473,17 @@ class EventsHelper(object):
         event_data['creator'] = event.creator
         event_data['gcal_id'] = event.gcal_id
 
-        cls._update_event(event, event_data, date_data)
+        cls._update_event(event, event_data, date_data, {'occurrence': 0})
         series.events.append(event)
         cls._increment_date_data(series, date_data)
 
         # Make the individual Event objects in the series
-        while cls._more_events(series, date_data):
-            ev = cls._make_event(event_data, date_data)
-            series.events.append(ev)
-            cls._increment_date_data(series, date_data)
+        cls._make_events(series, event_data, date_data)
 
         series.save()
 
-        # Return the Google Calendar response
-        return e.gcal_client().update_event(series.events[0])
+        # Return the queued Google Calendar operation
+        return e.gcal_outbox().update_event(series.events[0])
 
     @classmethod
     def convert_to_single_event(cls, event, form, move_to=None):
@@ -504,8 +501,8 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
         event_data = DataBuilder.event_data_from_form(form)
@@ -513,9 +510,12 @@ class EventsHelper(object):
 
         event.parent_series.delete_all_except(event)
         cls._update_event(event, date_data, event_data)
+        event.update(unset__occurrence=True)
+        # Updates don't send signals (see response_cache).
+        invalidate('events')
 
         # Delete the series and create a single event
-        return e.gcal_client().update_event(event)
+        return e.gcal_outbox().update_event(event)
 
     @classmethod
     def delete_single_event(cls, event):
@@ -527,18 +527,20 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
-        # We have to delete on Google Calendar first, but we should delete the
-        # event from MongoEngine even if Google Calendar throws an error.
+        # The delete has to be queued first, because it copies the event, but
+        # we should delete the event from MongoEngine even if that fails.
         try:
-            response = e.gcal_client().delete_event(event)
+            response = e.gcal_outbox().delete_event(event)
         finally:
             event.delete()
+            # Events don't send delete signals (see response_cache).
+            invalidate('events')
 
-        # Return the Google Calendar response
+        # Return the queued Google Calendar operation
         return response
 
     @classmethod
@@ -551,19 +553,19 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
-        # We have to delete on Google Calendar first, but we should delete the
-        # event from MongoEngine even if Google Calendar throws an error.
+        # The delete has to be queued first, because it copies the event, but
+        # we should delete the event from MongoEngine even if that fails.
         try:
             # Cancel the series on Google Calendar
-            response = e.gcal_client().delete_event(event, as_exception=True)
+            response = e.gcal_outbox().delete_event(event, as_exception=True)
         finally:
             event.parent_series.delete_one(event)
 
-        # Return the Google Calendar response
+        # Return the queued Google Calendar operation
         return response
 
     @classmethod
@@ -575,18 +577,21 @@ class EventsHelper(object):
 
         :raises: :class:`GoogleCalendarAPIError` and it's subclasses
 
-        :returns: Response from the Google Calendar API.
-        :rtype: dict
+        :returns: The queued Google Calendar operation.
+        :rtype: :class:`~app.models.CalendarOperation`
         """
 
-        # We have to delete on Google Calendar first, but we should delete the
-        # event from MongoEngine even if Google Calendar throws an error.
+        # The delete has to be queued first, because it copies the event, but
+        # we should delete the event from MongoEngine even if that fails.
+        # Deleting the recurring event on Google Calendar deletes every
+        # occurrence, so there is only one call to make; the outbox worker
+        # batches it with other events' writes, so no ``client.batch()`` here.
         try:
-            response = e.gcal_client().delete_event(event)
+            response = e.gcal_outbox().delete_event(event)
         finally:
             event.parent_series.delete_all()
 
-        # Return the Google Calendar response
+        # Return the queued Google Calendar operation
         return response
 
     ###########################################################################
@@ -686,19 +691,95 @@ class EventsHelper(object):
         return True
 
     @classmethod
-    def _make_event(cls, e_data, d_data):
-        """Create a new :class:`Event` object and save it to Mongoengine.
+    def _make_events(cls, series, e_data, d_data):
+        """Create the remaining :class:`Event` s in ``series``, starting on
+        the date in ``d_data``, and insert them into Mongoengine at once.
+
+        The markdown descriptions are rendered once and shared by every event,
+        and the events are validated without running :func:`Event.clean`.
+
+        :param series: The series to add events to.
+        :type series: :class:`EventSeries`
+        :param dict e_data: The event data shared by every event.
+        :param dict d_data: The date data for the first new event.  It is
+            incremented past the last event in the series.
+
+        :raises: :class:`mongoengine.ValidationError`
+
+        :returns: The new events.
+        :rtype: list of :class:`Event`
+        """
+        e_data = cls._with_rendered_markdown(e_data)
+
+        events = []
+        while cls._more_events(series, d_data):
+            params = cls._remove_none_fields(dict(e_data.items() +
+                                                  d_data.items()))
+            # Assign IDs up front, so that the series can reference the
+            # events before they are inserted.
+            event = Event(id=ObjectId(), occurrence=len(series.events),
+                          **params)
+            event.validate(clean=False)
+            event.validate_dates()
+            events.append(event)
+            series.events.append(event)
+            cls._increment_date_data(series, d_data)
+
+        if events:
+            Event.objects.insert(events, load_bulk=False)
+            invalidate('events')
+        return events
+
+    @classmethod
+    def _update_series_events(cls, series, event, e_data):
+        """Updates every :class:`Event` in ``series`` with ``e_data`` in a
+        single multi-document update, rendering the markdown once.
 
-        The event is created by unpacking non-None fields of ``e_data`` and
-        ``d_data`` in the constructor for :class:`Event`.
+        The update doesn't run :func:`Event.clean` or validate the events, so
+        ``e_data`` is applied to ``event`` first and validated there.  The
+        changes are easy (see :func:`_changes_are_easy`), so the dates of the
+        events don't change, and what is valid for ``event`` is valid for
+        every event in the series.
 
-        :param dict e_data: The event data for this event.
-        :param dict d_data: The date data for this event.
+        :param series: The series whose events should be updated.
+        :type series: :class:`EventSeries`
+        :param event: An event in ``series``.  It is updated in memory too.
+        :type event: :class:`Event`
+        :param dict e_data: The event data to apply to every event.
+
+        :raises: :class:`mongoengine.ValidationError`
         """
-        params = cls._remove_none_fields(dict(e_data.items() + d_data.items()))
-        event = Event(**params)
-        event.save()
-        return event
+        d = cls._with_rendered_markdown(e_data)
+        d['date_modified'] = datetime.now()
+        for k, v in d.iteritems():
+            setattr(event, k, v)
+        event.validate(clean=False)
+        event.validate_dates()
+
+        d = dict(("set__" + k, v) for k, v in d.iteritems())
+        Event.objects(parent_series=series).update(**d)
+        # Updates don't send signals (see response_cache).
+        invalidate('events')
+
+    @classmethod
+    def _with_rendered_markdown(cls, e_data):
+        """Returns the non-None fields of ``e_data``, with the HTML rendered
+        from its markdown descriptions added.
+
+        :param dict e_data: The event data to render.
+
+        :returns: The event data, ready to be shared by several events.
+        :rtype: dict
+        """
+        e_data = cls._remove_none_fields(e_data)
+        prototype = Event(**e_data)
+        prototype.render_markdown()
+        for field in ('short_description', 'long_description'):
+            if getattr(prototype, field + '_markdown'):
+                e_data[field] = getattr(prototype, field)
+                e_data[field + '_digest'] = getattr(prototype,
+                                                    field + '_digest')
+        return e_data
 
     @classmethod
     def _make_series(cls, form, **kwargs):
@@ -0,0 +1,421 @@
+"""
+.. module:: file_maintenance
+    :synopsis: Moves the files of deleted images out of the upload folder in
+        the background, and cleans up files that are no longer needed.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+
+When an :class:`~app.models.Image` is deleted, its file and variants are
+queued with :func:`FileMaintenance.delete_files`, and a background thread
+moves them into ``EVENTUM_DELETE_FOLDER``.  Moves that fail are retried with
+exponential backoff, until they have been tried
+``EVENTUM_FILE_MAINTENANCE_MAX_ATTEMPTS`` times.
+
+Every ``EVENTUM_FILE_MAINTENANCE_SWEEP_INTERVAL`` seconds, the same thread
+also runs :func:`FileMaintenance.sweep`, which:
+
+- Moves uploaded files that no image refers to into the delete folder, once
+  they are older than ``EVENTUM_ORPHAN_GRACE_PERIOD``.  This also catches the
+  files of moves that were given up on, or lost when a process exited.
+- Removes files that have been in the delete folder for longer than
+  ``EVENTUM_DELETE_RETENTION_DAYS``, and reports how many bytes that freed.
+
+Both are off unless their setting is configured.  The time each file was
+deleted is written to a hidden file next to it, because a deleted file may be
+hard linked to an upload that is still in use, so its own modification time
+can't be changed.
+
+To sweep from a separate process instead, set
+``EVENTUM_FILE_MAINTENANCE_WORKER`` to ``False`` in the web app (files are then
+moved during the request), and call :func:`FileMaintenance.sweep` from a
+script::
+
+    from eventum import Eventum
+
+    with app.app_context():
+        Eventum.file_maintenance().sweep()
+"""
+
+import errno
+import os
+import stat
+import threading
+from time import time
+
+from eventum.lib.retry import backoff
+from eventum.models import Image
+
+# WebP variants are generated even though WebP can't be uploaded.
+_VARIANT_EXTENSIONS = set(['.webp'])
+
+# The suffix of the hidden files that record when a file was deleted.
+_DELETED_AT_SUFFIX = '.deleted-at'
+
+
+class FileMove(object):
+    """A file waiting to be moved into the delete folder.
+
+    :ivar str path: The path to the file.
+    :ivar int attempts: The number of times the move has been tried.
+    :ivar float next_attempt: The earliest time the move may be tried again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.attempts = 0
+        self.next_attempt = 0
+
+    def __repr__(self):
+        return 'FileMove(path=%r, attempts=%r)' % (self.path, self.attempts)
+
+
+class FileMaintenance(object):
+    """Moves and cleans up uploaded files on a background thread.
+
+    :ivar app: :class:`flask.Flask` - The app whose folders are maintained.
+    """
+
+    def __init__(self, app):
+        """Create the file maintenance worker for ``app``.  The worker is not
+        started until it is needed.
+
+        :param app: The Flask app.
+        :type app: :class:`flask.Flask`
+        """
+        self.app = app
+        self._moves = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._last_sweep = 0
+        self._counters = dict.fromkeys(('moved', 'retried', 'failed',
+                                        'orphans', 'purged',
+                                        'reclaimed_bytes'), 0)
+
+    @property
+    def worker_enabled(self):
+        """True if files should be moved and swept in a background thread."""
+        return self.app.config['EVENTUM_FILE_MAINTENANCE_WORKER']
+
+    def delete_files(self, paths):
+        """Move the files at ``paths`` into ``EVENTUM_DELETE_FOLDER``, in the
+        background if the worker is enabled.
+
+        :param paths: The paths to the files.
+        :type paths: list of str
+        """
+        if not self.worker_enabled:
+            for path in paths:
+                self._finish(FileMove(path), self._move(path))
+            return
+
+        with self._lock:
+            self._moves.extend(FileMove(path) for path in paths)
+        self.ensure_worker()
+
+    def stats(self):
+        """Returns the counters for this worker.
+
+        :returns: The number of files moved, retried and given up on, the
+            number of orphaned files collected, the number of deleted files
+            purged and the bytes that freed, and the number of moves waiting.
+        :rtype: dict
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending'] = len(self._moves)
+        return stats
+
+    ###########################################################################
+    # Running the worker
+    ###########################################################################
+
+    def ensure_worker(self):
+        """Start the worker thread, unless it is disabled or already running
+        in this process.  This is safe to call on every request.
+        """
+        if not self.worker_enabled:
+            return
+
+        with self._lock:
+            # Threads don't survive a fork, so check that the worker belongs
+            # to this process.
+            if (self._thread is not None and self._thread.is_alive() and
+                    self._pid == os.getpid()):
+                if self._moves:
+                    self._wake.set()
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever,
+                                            name='file-maintenance')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the worker thread, waiting for it to finish the file it is
+        currently working on.
+
+        :param float timeout: The longest to wait, in seconds.
+        """
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def run_forever(self):
+        """Move queued files and sweep the folders until :func:`stop` is
+        called, sleeping until there is something to do.
+        """
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception:
+                self.app.logger.exception('[FILE_MAINTENANCE]: Worker failed')
+
+            self._wake.wait(self._seconds_until_next_run())
+            self._wake.clear()
+
+    def run_once(self):
+        """Try every move that is due, and sweep the folders if it is time
+        to.  Must be called inside an app context.
+
+        :returns: The number of moves tried.
+        :rtype: int
+        """
+        at = time()
+        with self._lock:
+            due = [move for move in self._moves if move.next_attempt <= at]
+            self._moves = [move for move in self._moves
+                           if move.next_attempt > at]
+
+        for move in due:
+            self._finish(move, self._move(move.path))
+
+        interval = self.app.config['EVENTUM_FILE_MAINTENANCE_SWEEP_INTERVAL']
+        if time() - self._last_sweep >= interval:
+            self.sweep()
+        return len(due)
+
+    def _seconds_until_next_run(self):
+        """Returns how long the worker can sleep for.
+
+        :rtype: float
+        """
+        next_run = (self._last_sweep +
+                    self.app.config['EVENTUM_FILE_MAINTENANCE_SWEEP_INTERVAL'])
+        with self._lock:
+            for move in self._moves:
+                next_run = min(next_run, move.next_attempt)
+        return max(next_run - time(), 0)
+
+    def _move(self, path):
+        """Move the file at ``path`` into the delete folder.
+
+        :param str path: The path to the file.
+
+        :returns: The error, or ``None`` if the file was moved or is already
+            gone.
+        :rtype: Exception
+        """
+        delete_folder = self.app.config['EVENTUM_DELETE_FOLDER']
+        new_path = os.path.join(delete_folder, os.path.basename(path))
+        try:
+            if not os.path.isdir(delete_folder):
+                os.makedirs(delete_folder)
+            os.rename(path, new_path)
+            # Start the retention period now, not when the file was uploaded.
+            with open(_deleted_at_path(new_path), 'w') as f:
+                f.write(repr(time()))
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT and not os.path.exists(path):
+                return None
+            return e
+        return None
+
+    def _finish(self, move, error):
+        """Record the outcome of ``move``, scheduling a retry if it failed.
+
+        :param move: The move that was tried.
+        :type move: :class:`FileMove`
+        :param Exception error: The error, if it failed.
+        """
+        move.attempts += 1
+        if error is None:
+            self._count('moved')
+        elif (not self.worker_enabled or move.attempts >=
+                self.app.config['EVENTUM_FILE_MAINTENANCE_MAX_ATTEMPTS']):
+            self._count('failed')
+            self.app.logger.error('[FILE_MAINTENANCE]: Gave up on {}: '
+                                  '{}'.format(move, error))
+        else:
+            self._count('retried')
+            move.next_attempt = time() + backoff(
+                move.attempts,
+                self.app.config['EVENTUM_FILE_MAINTENANCE_BACKOFF'],
+                self.app.config['EVENTUM_FILE_MAINTENANCE_MAX_BACKOFF']
+            ).total_seconds()
+            with self._lock:
+                self._moves.append(move)
+
+    def _count(self, counter, amount=1):
+        """Add ``amount`` to ``counter``.
+
+        :param str counter: The name of the counter.
+        :param int amount: How much to add.
+        """
+        with self._lock:
+            self._counters[counter] += amount
+
+    ###########################################################################
+    # Sweeping
+    ###########################################################################
+
+    def sweep(self):
+        """Collect orphaned uploads and purge expired deleted files.  Must be
+        called inside an app context.
+
+        :returns: The number of orphaned files moved, and the number of
+            deleted files purged and the bytes that freed.
+        :rtype: dict
+        """
+        self._last_sweep = time()
+        orphans = self.collect_orphans()
+        purged, reclaimed = self.purge_deleted()
+
+        if orphans or purged:
+            self.app.logger.info('[FILE_MAINTENANCE]: Collected {} orphaned '
+                                 'files, purged {} deleted files and '
+                                 'reclaimed {} bytes'.format(orphans, purged,
+                                                             reclaimed))
+        return {
+            'orphans': orphans,
+            'purged': purged,
+            'reclaimed_bytes': reclaimed
+        }
+
+    def collect_orphans(self):
+        """Move images in the upload folder that no
+        :class:`~app.models.Image` refers to into the delete folder.
+
+        Files younger than ``EVENTUM_ORPHAN_GRACE_PERIOD`` are left alone,
+        because uploads are written before their image is saved, and variants
+        before they are recorded.  If it is ``None``, no files are moved.
+
+        :returns: The number of files moved.
+        :rtype: int
+        """
+        grace_period = self.app.config['EVENTUM_ORPHAN_GRACE_PERIOD']
+        if grace_period is None:
+            return 0
+        folder = self.app.config['EVENTUM_UPLOAD_FOLDER']
+        extensions = (self.app.config['EVENTUM_ALLOWED_UPLOAD_EXTENSIONS'] |
+                      _VARIANT_EXTENSIONS)
+        cutoff = time() - grace_period
+
+        referenced = set()
+        for image in Image.objects.only('filename', 'variants').as_pymongo():
+            referenced.add(image['filename'])
+            referenced.update((image.get('variants') or {}).values())
+
+        collected = 0
+        for filename, path, info in _files(folder):
+            if (filename in referenced or filename.startswith('.') or
+                    os.path.splitext(filename)[1].lower() not in extensions or
+                    info.st_mtime > cutoff):
+                continue
+            error = self._move(path)
+            if error is not None:
+                self.app.logger.warning('[FILE_MAINTENANCE]: Could not move '
+                                        '{}: {}'.format(path, error))
+                continue
+            collected += 1
+        self._count('orphans', collected)
+        return collected
+
+    def purge_deleted(self):
+        """Remove files that have been in the delete folder for longer than
+        ``EVENTUM_DELETE_RETENTION_DAYS``.
+
+        :returns: The number of files removed, and the number of bytes that
+            freed.  Files that were hard linked to another upload don't free
+            any bytes.
+        :rtype: tuple
+        """
+        days = self.app.config['EVENTUM_DELETE_RETENTION_DAYS']
+        if days is None:
+            return 0, 0
+        cutoff = time() - days * 24 * 60 * 60
+
+        purged = reclaimed = 0
+        for filename, path, info in _files(
+                self.app.config['EVENTUM_DELETE_FOLDER']):
+            if filename.startswith('.') or _deleted_at(path, info) > cutoff:
+                continue
+            try:
+                os.remove(path)
+                if os.path.exists(_deleted_at_path(path)):
+                    os.remove(_deleted_at_path(path))
+            except (IOError, OSError) as e:
+                self.app.logger.warning('[FILE_MAINTENANCE]: Could not purge '
+                                        '{}: {}'.format(path, e))
+                continue
+            purged += 1
+            if info.st_nlink == 1:
+                reclaimed += info.st_size
+        self._count('purged', purged)
+        self._count('reclaimed_bytes', reclaimed)
+        return purged, reclaimed
+
+
+def _files(folder):
+    """Yields the regular files in ``folder``, if it exists.
+
+    :param str folder: The path to the folder.
+
+    :returns: The filename, path and :func:`os.lstat` of each file.
+    :rtype: generator of tuples
+    """
+    if not os.path.isdir(folder):
+        return
+    for filename in os.listdir(folder):
+        path = os.path.join(folder, filename)
+        try:
+            info = os.lstat(path)
+        except OSError:
+            continue  # Moved or removed since the listing.
+        if stat.S_ISREG(info.st_mode):
+            yield filename, path, info
+
+
+def _deleted_at_path(path):
+    """Returns the path to the file that records when the file at ``path``
+    was moved into the delete folder.
+
+    :param str path: The path to the deleted file.
+
+    :rtype: str
+    """
+    folder, filename = os.path.split(path)
+    return os.path.join(folder, '.' + filename + _DELETED_AT_SUFFIX)
+
+
+def _deleted_at(path, info):
+    """Returns when the file at ``path`` was moved into the delete folder.
+    Files deleted before this was recorded use their modification time.
+
+    :param str path: The path to the deleted file.
+    :param info: The :func:`os.lstat` of the file.
+
+    :returns: The time, in seconds since the epoch.
+    :rtype: float
+    """
+    try:
+        with open(_deleted_at_path(path)) as f:
+            return float(f.read())
+    except (IOError, OSError, ValueError):
+        return info.st_mtime
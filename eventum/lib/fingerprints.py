@@ -0,0 +1,115 @@
+"""
+.. module:: fingerprints
+    :synopsis: Remembers the fingerprints that were added to the URLs of
+        uploaded files, so that requests for them can be checked without a
+        query.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+
+:func:`~app.models.Image.url` adds the start of an image's SHA-256 hash to its
+URLs as ``?v=``, and calls :func:`remember`.  When the file is requested,
+:func:`matches` checks the ``?v=`` against what was remembered, and only then
+may the file be cached forever.
+
+Each fingerprint is stored with the inode of the file it was added for, so a
+file that is replaced under the same name, even by another process, no longer
+matches.  Files whose fingerprints this process hasn't seen are sent with the
+normal cache policy.
+
+Static files don't have a document to record their hash, so
+:func:`of_file` hashes them instead, once each time they change.  A static URL
+is only cached forever if its ``?v=`` is the fingerprint of the file.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+#: The number of fingerprints remembered, by the files they were added for.
+MAX_FINGERPRINTS = 4096
+
+#: The number of characters of the SHA-256 hex digest in a fingerprint.
+FINGERPRINT_LENGTH = 12
+
+_fingerprints = OrderedDict()
+_file_fingerprints = OrderedDict()
+_lock = threading.Lock()
+
+
+def remember(path, fingerprint):
+    """Remember that ``fingerprint`` was added to the URL of the file at
+    ``path``.  The file is only looked at the first time.
+
+    :param str path: The path to the file.
+    :param str fingerprint: The fingerprint.
+    """
+    with _lock:
+        known = _fingerprints.pop(path, None)
+        if known is not None and known[0] == fingerprint:
+            _fingerprints[path] = known
+            return
+    try:
+        inode = os.stat(path).st_ino
+    except OSError:
+        return  # Not uploaded yet, or already deleted.
+    with _lock:
+        _fingerprints[path] = (fingerprint, inode)
+        while len(_fingerprints) > MAX_FINGERPRINTS:
+            _fingerprints.popitem(last=False)
+
+
+def matches(path, fingerprint, info):
+    """Returns True if ``fingerprint`` was remembered for the file at
+    ``path``, and the file hasn't been replaced since.
+
+    :param str path: The path to the file.
+    :param str fingerprint: The fingerprint from the URL, if any.
+    :param info: The :func:`os.stat` of the file.
+
+    :rtype: bool
+    """
+    if not fingerprint:
+        return False
+    with _lock:
+        known = _fingerprints.get(path)
+        if known is not None and known[1] != info.st_ino:
+            # Replaced, so the next URL has to look at the new file.
+            del _fingerprints[path]
+            return False
+    return known is not None and known[0] == fingerprint
+
+
+def of_file(path):
+    """Returns the fingerprint of the contents of the file at ``path``: the
+    start of its SHA-256 hash.  The file is only read again when it changes.
+
+    :param str path: The path to the file.
+
+    :returns: The fingerprint, or ``None`` if there is no file at ``path``.
+    :rtype: str
+    """
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    version = (info.st_ino, info.st_size, info.st_mtime)
+    with _lock:
+        known = _file_fingerprints.pop(path, None)
+        if known is not None and known[0] == version:
+            _file_fingerprints[path] = known
+            return known[1]
+
+    sha256 = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                sha256.update(chunk)
+    except (IOError, OSError):
+        return None
+    fingerprint = sha256.hexdigest()[:FINGERPRINT_LENGTH]
+    with _lock:
+        _file_fingerprints[path] = (version, fingerprint)
+        while len(_file_fingerprints) > MAX_FINGERPRINTS:
+            _file_fingerprints.popitem(last=False)
+    return fingerprint
@@ -1,15 +1,19 @@
 import httplib2
-import httplib
+import os
+import threading
+from contextlib import contextmanager
 from sys import exit, stderr
 
-from apiclient.discovery import build
+from apiclient.discovery import build_from_document, DISCOVERY_URI
 from apiclient.errors import HttpError
 from oauth2client.file import Storage
 from flask import current_app
 
-from eventum.models import Event
+from eventum.models import Event, EventSeries
 from eventum.lib.google_calendar_resource_builder import (
     GoogleCalendarResourceBuilder)
+from eventum.lib.google_calendar_batch import (GoogleCalendarBatch,
+                                               GoogleCalendarBatchItem)
 from eventum.lib.decorators import skip_and_return_if_auth_disabled
 from eventum.lib.error import EventumError
 
@@ -21,22 +25,180 @@ NO_CREDENTIALS = (
     '`{}`.  If set to FALSE, Google Calendar calls will fail silently.')
 
 
+class GoogleCalendarServiceCache(object):
+    """A process-wide cache of the Google Calendar service.
+
+    Building the service is expensive: it reads the credentials file, opens a
+    new connection, and downloads the discovery document for the API.  This
+    cache does each of those things only when it has to:
+
+    - The credentials are re-read from disk only when the credentials file
+      changes, and refreshed only when their access token has expired.
+    - The discovery document is downloaded once per process.
+    - Each thread gets its own service object (and with it, its own
+      :class:`httplib2.Http` connection, which is not thread safe), which is
+      reused until the credentials are reloaded.
+
+    :ivar hits: int - The number of times a cached service was returned.
+    :ivar rebuilds: int - The number of times a service was built.
+    :ivar credential_loads: int - The number of times the credentials file was
+        read.
+    :ivar refreshes: int - The number of times expired credentials were
+        refreshed.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._credentials = None
+        self._credentials_path = None
+        self._credentials_mtime = None
+        self._discovery_document = None
+        self._generation = 0
+        self.hits = 0
+        self.rebuilds = 0
+        self.credential_loads = 0
+        self.refreshes = 0
+
+    def get(self, credentials_path):
+        """Return the Google Calendar service for the current thread,
+        building it only if the credentials have changed since it was last
+        built.
+
+        :param str credentials_path: The path to the credentials file.
+
+        :raises: IOError, NotImplementedError
+
+        :returns: The Google Calendar service.
+        """
+        with self._lock:
+            credentials = self._fresh_credentials(credentials_path)
+            generation = self._generation
+
+        local = self._local
+        if getattr(local, 'generation', None) == generation:
+            with self._lock:
+                self.hits += 1
+            return local.service
+
+        http = credentials.authorize(httplib2.Http())
+        service = build_from_document(self._discovery(), http=http)
+        local.service = service
+        local.generation = generation
+        with self._lock:
+            self.rebuilds += 1
+        return service
+
+    def invalidate(self):
+        """Forget the cached credentials, forcing every thread to rebuild its
+        service on the next call to :func:`get`.
+        """
+        with self._lock:
+            self._credentials = None
+            self._credentials_mtime = None
+            self._generation += 1
+
+    def stats(self):
+        """Returns the counters for this cache.
+
+        :returns: The number of hits, rebuilds, credential loads, and
+            refreshes.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'rebuilds': self.rebuilds,
+                'credential_loads': self.credential_loads,
+                'refreshes': self.refreshes
+            }
+
+    def _fresh_credentials(self, credentials_path):
+        """Returns the cached credentials, reloading them if the file at
+        ``credentials_path`` has changed and refreshing them if they have
+        expired.  Must be called with ``self._lock`` held.
+
+        :param str credentials_path: The path to the credentials file.
+
+        :raises: IOError, NotImplementedError
+
+        :returns: The credentials.
+        :rtype: :class:`oauth2client.client.Credentials`
+        """
+        try:
+            mtime = os.path.getmtime(credentials_path)
+        except (OSError, TypeError):
+            raise IOError
+
+        if (self._credentials is None or
+                credentials_path != self._credentials_path or
+                mtime != self._credentials_mtime):
+            credentials = Storage(credentials_path).get()
+            if credentials is None:
+                raise IOError
+            if credentials.invalid is True:
+                raise NotImplementedError
+
+            self._credentials = credentials
+            self._credentials_path = credentials_path
+            self._credentials_mtime = mtime
+            self._generation += 1
+            self.credential_loads += 1
+
+        if self._credentials.access_token_expired:
+            # Every service shares this credentials object, so refreshing it
+            # in place is enough.  The refreshed token is written back to the
+            # credentials file, so remember its new mtime to avoid reloading.
+            self._credentials.refresh(httplib2.Http())
+            self._credentials_mtime = os.path.getmtime(credentials_path)
+            self.refreshes += 1
+
+        return self._credentials
+
+    def _discovery(self):
+        """Returns the discovery document for the Google Calendar API,
+        downloading it the first time it is needed.
+
+        :raises: :class:`apiclient.errors.HttpError`
+
+        :returns: The discovery document.
+        :rtype: str
+        """
+        with self._lock:
+            if self._discovery_document is None:
+                uri = DISCOVERY_URI.format(api='calendar', apiVersion='v3')
+                response, content = httplib2.Http().request(uri)
+                if response.status >= 400:
+                    raise HttpError(response, content, uri=uri)
+                self._discovery_document = content
+            return self._discovery_document
+
+
+# The one service cache shared by every client in this process.
+_service_cache = GoogleCalendarServiceCache()
+
+
 class GoogleCalendarAPIClient():
     """A client to interact with the Google Calendar API.  Once initialized, it
     can be used to create, update, delete, and move events.
 
-    :ivar service: The Google Calendar service to make requests with.
+    :ivar service: The Google Calendar service to make requests with.  This is
+        cached across requests, see :class:`GoogleCalendarServiceCache`.
     :ivar private_calendar_id: str - ID of the private calendar.
     :ivar public_calendar_id: str - ID of the public calendar.
     """
 
+    # The most instances of a series the API returns in one page.
+    INSTANCES_PAGE_SIZE = 2500
+
     def __init__(self, app):
         """Initialize the Google Calendar API Client
         """
         self.app = app
+        self._batches = threading.local()
 
         try:
-            self.service = self._get_service()
+            self._get_service()
         except IOError:
 
             # Find the valueof the EVENTUM_GOOGLE_AUTH_ENABLED environment var
@@ -53,12 +215,15 @@ class GoogleCalendarAPIClient():
             # Quit
             exit(1)
 
+    @property
+    def service(self):
+        """The Google Calendar service for the current thread."""
+        return self._get_service()
+
     def before_request(self):
-        """Refreshes the Google Calendar Service.  It is better practice to
-        refresh the service before every request, as opposed to just at the
-        beginning of running the app.
+        """Loads the calendar IDs from the app config.  The service itself is
+        cached, and is only rebuilt if the credentials have changed.
         """
-        self.service = self._get_service()
         self.private_calendar_id = (
             self.app.config['EVENTUM_PRIVATE_CALENDAR_ID'])
         self.public_calendar_id = (
@@ -80,32 +245,74 @@ class GoogleCalendarAPIClient():
 
     @skip_and_return_if_auth_disabled
     def _get_service(self):
-        """Create and return the Google Calendar service object, using the
-        credentials file generated through the command::
+        """Return the Google Calendar service object, using the credentials
+        file generated through the command::
 
             python manage.py --authorize
 
         The service object is used to make API requests to Google Calendar, but
-        will raise IOError if the credentials file is not generated
+        will raise IOError if the credentials file is not generated.  It is
+        fetched from the process-wide :class:`GoogleCalendarServiceCache`.
 
         :raises: IOError, NotImplementedError
 
         :returns: The Google Calendar service.
         """
-        storage = Storage(
+        return _service_cache.get(
             self.app.config['EVENTUM_INSTALLED_APP_CREDENTIALS_PATH'])
-        credentials = storage.get()
 
-        if credentials is None:
-            raise IOError
+    @contextmanager
+    def batch(self, raise_errors=True):
+        """A context manager that sends every write made inside of it in a
+        single batch HTTP request when the block exits::
+
+            with client.batch():
+                client.delete_event(first_event)
+                client.delete_event(second_event)
+
+        Inside the block, :func:`create_event`, :func:`update_event`,
+        :func:`move_event` and :func:`delete_event` return a
+        :class:`GoogleCalendarBatchItem` instead of the API response.  The
+        response (or error) is stored on the item once the batch has been
+        sent.  Reads are never deferred.
 
-        if credentials.invalid is True:
-            raise NotImplementedError
+        Google may run the calls in a batch in any order, so calls that depend
+        on each other should not share a batch.  Nested blocks join the
+        outermost batch.
 
-        http = httplib2.Http()
-        http = credentials.authorize(http)
+        :param bool raise_errors: Whether or not to raise the first error
+            once every item in the batch has been resolved.
 
-        return build('calendar', 'v3', http=http)
+        :raises: :class:`EventumError.GCalAPI` and it's subclasses
+
+        :returns: The batch.
+        :rtype: :class:`GoogleCalendarBatch`
+        """
+        current = getattr(self._batches, 'current', None)
+        if current is not None:
+            yield current
+            return
+
+        batch = GoogleCalendarBatch()
+        self._batches.current = batch
+        try:
+            yield batch
+        except Exception:
+            # Writes queued before the error would have been made without the
+            # batch, so still send them.
+            self._batches.current = None
+            batch.execute(raise_errors=False)
+            raise
+        self._batches.current = None
+        batch.execute(raise_errors=raise_errors)
+
+    def service_cache_stats(self):
+        """Returns the hit and rebuild counters for the service cache.
+
+        :returns: The counters, see :func:`GoogleCalendarServiceCache.stats`.
+        :rtype: dict
+        """
+        return _service_cache.stats()
 
     @skip_and_return_if_auth_disabled
     def create_event(self, event):
@@ -131,14 +338,13 @@ class GoogleCalendarAPIClient():
         request = self.service.events().insert(calendarId=calendar_id,
                                                body=resource)
 
-        # Execute the request
-        created_event = self._execute_request(request)
-
-        # Update the Event with the latest info from the response.
-        self._update_event_from_response(event, created_event)
+        def on_success(created_event):
+            # Update the Event with the latest info from the response.
+            self._update_event_from_response(event, created_event)
+            return created_event
 
-        # Return the Google Calendar response dict
-        return created_event
+        # Execute the request, returning the Google Calendar response dict
+        return self._execute_request(request, on_success=on_success)
 
     @skip_and_return_if_auth_disabled
     def update_event(self, stale_event, as_exception=False):
@@ -198,18 +404,21 @@ class GoogleCalendarAPIClient():
                                                eventId=event_id_for_update,
                                                body=resource)
 
-        # Send the request, falling back to update if it fails.
-        try:
-            updated_event = self._execute_request(request)
-        except EventumError.GCalAPI.NotFound as e:
+        def on_success(updated_event):
+            # Update the Event with the latest info from the response.
+            self._update_event_from_response(event, updated_event,
+                                             as_exception=as_exception)
+            return updated_event
+
+        def on_not_found(e):
+            # Fall back to creating the event if the update fails.
             self.create_event(event)
             raise EventumError.GCalAPI.NotFound.UpdateFellBackToCreate(e=e)
 
-        # Update the Event with the latest info from the response.
-        self._update_event_from_response(event, updated_event)
-
-        # Return the Google Calendar response dict
-        return updated_event
+        # Send the request, returning the Google Calendar response dict
+        return self._execute_request(request,
+                                     on_success=on_success,
+                                     on_not_found=on_not_found)
 
     @skip_and_return_if_auth_disabled
     def publish_event(self, stale_event):
@@ -294,13 +503,15 @@ class GoogleCalendarAPIClient():
                                              eventId=event.gcal_id,
                                              destination=to_id)
 
-        # Execute the request
-        try:
-            return self._execute_request(request)
-        except EventumError.GCalAPI.NotFound as e:
+        def on_not_found(e):
             self.create_event(event)
             raise EventumError.GCalAPI.NotFound.MoveFellBackToCreate(uri=e.uri)
 
+        # Execute the request
+        return self._execute_request(request,
+                                     on_success=lambda moved: moved,
+                                     on_not_found=on_not_found)
+
     @skip_and_return_if_auth_disabled
     def delete_event(self, event, as_exception=False):
         """Delete an event or series from Google Calendar, or cancel a single
@@ -343,18 +554,29 @@ class GoogleCalendarAPIClient():
             request = self.service.events().delete(calendarId=calendar_id,
                                                    eventId=event.gcal_id)
 
-        # Execute the request, failing silently if the event has already been
-        # deleted from Google Calendar.
-        try:
-            return self._execute_request(request)
-        except EventumError.GCalAPI.NotFound as e:
+        def on_success(deleted):
+            if as_exception:
+                # The instance is cancelled, so drop it from the index.
+                event.parent_series.record_instance(instance['id'])
+            return deleted
+
+        def on_not_found(e):
             # If the resource has already been deleted, fail quietly.
             raise EventumError.GCalAPI.EventAlreadyDeleted(e=e)
 
+        # Execute the request, failing silently if the event has already been
+        # deleted from Google Calendar.
+        return self._execute_request(request,
+                                     on_success=on_success,
+                                     on_not_found=on_not_found)
+
     def _instance_resource_for_event_in_series(self, event):
-        """Searches through the instances of ``event``'s parent series,
-        returning the Google Calendar instance resource for with ``start_time``
-        that matches ``event``'s.
+        """Returns the Google Calendar instance resource for ``event`` in its
+        parent series.
+
+        The instance is found by its start time in the series' index of
+        instances, which is rebuilt first if it is stale.  If the indexed
+        instance no longer exists, the index is rebuilt once more.
 
         :param event: The event to find the instance resource for.
         :type event: :class:`Event`
@@ -363,37 +585,107 @@ class GoogleCalendarAPIClient():
         :rtype: dict
         """
         calendar_id = self._calendar_id_for_event(event)
+        series = event.parent_series
         event_start_date = (GoogleCalendarResourceBuilder
                             .rfc3339(event.start_datetime))
-        page_token = None
-        while True:
-            # Find more instances
-            request = self.service.events().instances(calendarId=calendar_id,
-                                                      eventId=event.gcal_id,
-                                                      pageToken=page_token)
-            instances = self._execute_request(request)
 
-            # Look for instances with matching start date
-            for instance in instances['items']:
-                if instance['start']['dateTime'] == event_start_date:
-                    return instance
+        if not series.instance_index_is_current():
+            self._index_instances(series, calendar_id)
+
+        instance_id = series.gcal_instances.get(event_start_date)
+        if instance_id is None:
+            return None
+
+        try:
+            return self._get_instance(calendar_id, instance_id)
+        except EventumError.GCalAPI.NotFound:
+            # The series changed without us, so the index is out of date.
+            self._index_instances(series, calendar_id)
+            instance_id = series.gcal_instances.get(event_start_date)
+            if instance_id is None:
+                return None
+            return self._get_instance(calendar_id, instance_id)
+
+    def _get_instance(self, calendar_id, instance_id):
+        """Fetches a single instance of a series.
+
+        :param str calendar_id: The ID of the calendar the series is on.
+        :param str instance_id: The ID of the instance.
+
+        :raises: :class:`EventumError.GCalAPI.BadStatusLine`,
+            :class:`EventumError.GCalAPI.NotFound`
+
+        :returns: The instance resource.
+        :rtype: dict
+        """
+        request = self.service.events().get(calendarId=calendar_id,
+                                            eventId=instance_id)
+        return self._execute_request(request)
+
+    def _index_instances(self, series, calendar_id):
+        """Pages through every instance of ``series`` once, storing the ID of
+        each by its start time in the series' index of instances.
 
-            # Get the next page of events
-            page_token = instances.get('nextPageToken')
+        :param series: The series to index.
+        :type series: :class:`EventSeries`
+        :param str calendar_id: The ID of the calendar the series is on.
 
-            # Quit if there are no more pages
+        :raises: :class:`EventumError.GCalAPI.BadStatusLine`,
+            :class:`EventumError.GCalAPI.NotFound`
+        """
+        instances = {}
+        page_token = None
+        while True:
+            # Find more instances
+            request = self.service.events().instances(
+                calendarId=calendar_id,
+                eventId=series.gcal_id,
+                pageToken=page_token,
+                maxResults=self.INSTANCES_PAGE_SIZE)
+            response = self._execute_request(request)
+
+            for instance in response.get('items', []):
+                start = instance['start'].get('dateTime')
+                if start is not None:
+                    instances[start] = instance['id']
+
+            # Get the next page of events, quitting if there are none.
+            page_token = response.get('nextPageToken')
             if not page_token:
                 break
 
-        return None
+        series.set_instance_index(instances)
+
+    def _instance_index_survives(self, series):
+        """Returns True if the index of ``series``' instances is still
+        correct after the whole series was updated, which is the case if the
+        series kept its ID and every event still starts at an indexed time.
+        Google derives instance IDs from the series ID and start times, so
+        updates that don't move any events leave them alone.
+
+        :param series: The series that was updated.
+        :type series: :class:`EventSeries`
 
-    def _update_event_from_response(self, event, response):
+        :rtype: bool
+        """
+        if (not series.gcal_instances or
+                series.gcal_instances_id != series.gcal_id):
+            return False
+        starts = set(GoogleCalendarResourceBuilder.rfc3339(e.start_datetime)
+                     for e in Event.objects(parent_series=series)
+                     .only('start_date', 'start_time'))
+        return starts == set(series.gcal_instances)
+
+    def _update_event_from_response(self, event, response,
+                                    as_exception=False):
         """Updates ``event`` using new fields from ``response``.
 
         :param event: The event to update.
         :type event: :class:`Event`
         :param dict response: The Google Calendar API response to search for
             updates in.
+        :param bool as_exception: True if ``response`` is for a single
+            instance of ``event``'s series, rather than the whole series.
 
         :raises: GoogleCalendarAPIError
         """
@@ -402,34 +694,70 @@ class GoogleCalendarAPIClient():
         if gcal_id is None or gcal_sequence is None:
             raise EventumError.GCalAPI(response=response)
 
-        if event.is_recurring:
-            event.parent_series.gcal_id = gcal_id
-            for ev in event.parent_series.events:
-                ev.gcal_id = gcal_id
-                ev.gcal_sequence = gcal_sequence
-                ev.save()
-            event.parent_series.save()
+        # Update with queries rather than saving, because a save would bring
+        # back an event that was deleted while the request was in flight.
+        if as_exception:
+            # The response is for the instance, so the series keeps its ID.
+            event.gcal_sequence = gcal_sequence
+            Event.objects(id=event.id).update_one(
+                set__gcal_sequence=gcal_sequence)
+            event.parent_series.record_instance(
+                gcal_id, start=response.get('start', {}).get('dateTime'))
+        elif event.is_recurring:
+            series = event.parent_series
+            series.gcal_id = gcal_id
+            series.gcal_sequence = gcal_sequence
+            EventSeries.objects(id=series.id).update_one(
+                set__gcal_id=gcal_id, set__gcal_sequence=gcal_sequence)
+
+            # Stamp every event in the series at once.
+            Event.objects(parent_series=series).update(
+                set__gcal_id=gcal_id, set__gcal_sequence=gcal_sequence)
+            event.gcal_id = gcal_id
+            event.gcal_sequence = gcal_sequence
+
+            if self._instance_index_survives(series):
+                # Only the details changed, so the instance IDs are the same
+                # and the index can be kept for the new sequence.
+                series.set_instance_index(series.gcal_instances)
+            else:
+                # Index the new instances now, so that later edits to single
+                # events in the series don't have to.
+                try:
+                    self._index_instances(series,
+                                          self._calendar_id_for_event(event))
+                except EventumError.GCalAPI:
+                    current_app.logger.warning(
+                        '[GOOGLE_CALENDAR]: Failed to index series instances')
         else:
             event.gcal_id = gcal_id
             event.gcal_sequence = gcal_sequence
-            event.save()
+            Event.objects(id=event.id).update_one(
+                set__gcal_id=gcal_id, set__gcal_sequence=gcal_sequence)
 
-    def _execute_request(self, request):
+    def _execute_request(self, request, on_success=None, on_not_found=None):
         """Execute the Google Calendar API request passed in.
 
+        Writes (requests made with an ``on_success`` callback) are queued
+        instead if they are made inside of a :func:`batch` block.
+
         :param request:  The Google Calendar API request object to execute.
+        :param func on_success: Called with the response if the request
+            succeeds.  Its return value is returned.
+        :param func on_not_found: Called with the
+            :class:`EventumError.GCalAPI.NotFound` error if the request fails
+            that way.  Its return value is returned.
 
         :raises: :class:`EventumError.GCalAPI.BadStatusLine`,
             :class:`EventumError.GCalAPI.NotFound`
 
-        :returns: The Google Calendar API response.
+        :returns: The Google Calendar API response, or the queued
+            :class:`GoogleCalendarBatchItem` inside of a :func:`batch` block.
         :rtype: dict
         """
-        try:
-            return request.execute()
-        except httplib.BadStatusLine as e:
-            # Google Calendar returned a empty status line.
-            raise EventumError.GCalAPI.BadStatusLine(message=e.message,
-                                                     line=e.line)
-        except HttpError as e:
-            raise EventumError.GCalAPI.NotFound(uri=e.uri)
+        batch = getattr(self._batches, 'current', None)
+        if batch is not None and on_success is not None:
+            return batch.add(request, on_success, on_not_found)
+
+        item = GoogleCalendarBatchItem(request, on_success, on_not_found)
+        return item.execute()
@@ -0,0 +1,304 @@
+"""
+.. module:: google_calendar_batch
+    :synopsis: Groups Google Calendar API requests into batch HTTP requests,
+        mapping each response back to the call that made it.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+
+Google Calendar accepts up to 50 API calls in a single ``multipart/mixed``
+request to its batch endpoint.  :class:`GoogleCalendarBatch` collects requests
+and sends them together, and :class:`GoogleCalendarBatchItem` holds the result
+(or :class:`EventumError.GCalAPI` error) for each one.
+
+Google does not promise to run the calls in a batch in order, so only calls
+that do not depend on each other should share a batch.  The writes made by a
+single :class:`~app.lib.events.EventsHelper` operation do depend on each other
+(a publish moves the event that the following update changes), so they are
+sent one after another.  Batches are filled by the
+:class:`~app.lib.google_calendar_outbox.GoogleCalendarOutbox`, which sends the
+next operation for many events at once.
+
+HTTP errors are mapped by status code: 404 and 410 become
+:class:`EventumError.GCalAPI.NotFound`, and the rest become subclasses of
+:class:`EventumError.GCalAPI.HttpError`, so that callers can tell a rate limit
+from a bad request.
+"""
+
+import httplib
+import json
+from time import time
+
+from apiclient.errors import HttpError
+from apiclient.http import BatchHttpRequest
+
+from eventum.lib.error import EventumError
+
+# Google answers 403 instead of 429 for most rate limits, with one of these
+# reasons in the body.
+_RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+_HTTP_ERRORS = {
+    400: EventumError.GCalAPI.HttpError.BadRequest,
+    401: EventumError.GCalAPI.HttpError.Unauthorized,
+    403: EventumError.GCalAPI.HttpError.Forbidden,
+    409: EventumError.GCalAPI.HttpError.Conflict,
+}
+
+
+def gcal_error(exception):
+    """Translate an exception raised while executing a Google Calendar API
+    request into the matching :class:`EventumError.GCalAPI` subclass.
+
+    :param exception: The exception raised by the API client.
+    :type exception: :class:`httplib.BadStatusLine` or
+        :class:`apiclient.errors.HttpError`
+
+    :returns: The translated error.
+    :rtype: :class:`EventumError.GCalAPI`
+    """
+    if isinstance(exception, httplib.BadStatusLine):
+        # Google Calendar returned a empty status line.
+        return EventumError.GCalAPI.BadStatusLine(message=exception.message,
+                                                  line=exception.line)
+    if isinstance(exception, HttpError):
+        status = int(exception.resp.status)
+        reason = _error_reason(exception)
+        return _http_error_class(status, reason)(uri=exception.uri,
+                                                 status=status,
+                                                 reason=reason)
+    return EventumError.GCalAPI(e=exception)
+
+
+def _http_error_class(status, reason=None):
+    """Returns the :class:`EventumError.GCalAPI` subclass for an HTTP error
+    from Google Calendar.
+
+    :param int status: The HTTP status code of the response.
+    :param str reason: The reason given in the body of the response, if any.
+
+    :rtype: type
+    """
+    if status in (404, 410):
+        # Google answers 410 Gone for events that have been deleted.
+        return EventumError.GCalAPI.NotFound
+    if status == 429 or (status == 403 and reason in _RATE_LIMIT_REASONS):
+        return EventumError.GCalAPI.HttpError.RateLimited
+    if status >= 500:
+        return EventumError.GCalAPI.HttpError.ServerError
+    return _HTTP_ERRORS.get(status, EventumError.GCalAPI.HttpError)
+
+
+def _error_reason(exception):
+    """Returns the reason Google gave for ``exception``, like
+    ``"rateLimitExceeded"``.
+
+    :param exception: The error raised by the API client.
+    :type exception: :class:`apiclient.errors.HttpError`
+
+    :returns: The reason, or ``None`` if the body doesn't give one.
+    :rtype: str
+    """
+    content = exception.content
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', 'replace')
+    try:
+        errors = json.loads(content)['error']['errors']
+        return errors[0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+class GoogleCalendarBatchItem(object):
+    """A single Google Calendar API call, and its outcome.
+
+    :ivar request: The Google Calendar API request object.
+    :ivar response: dict - The raw API response, once the call has been made.
+    :ivar result: The value returned by ``on_success`` (or ``on_not_found``),
+        once the item has been resolved.
+    :ivar error: :class:`EventumError.GCalAPI` - The error for this call, if
+        it failed.
+    :ivar latency: float - The number of seconds from when the call was sent
+        until it was resolved, not counting the time spent resolving other
+        calls in the same batch.
+    """
+
+    def __init__(self, request, on_success=None, on_not_found=None):
+        """Wrap ``request``.
+
+        :param request:  The Google Calendar API request object to execute.
+        :param func on_success: Called with the API response if the call
+            succeeds.  Its return value becomes :attr:`result`.
+        :param func on_not_found: Called with the
+            :class:`EventumError.GCalAPI.NotFound` error if the call fails
+            that way.  Its return value becomes :attr:`result`.
+        """
+        self.request = request
+        self.on_success = on_success
+        self.on_not_found = on_not_found
+        self.response = None
+        self.result = None
+        self.error = None
+        self.latency = None
+        self._exception = None
+        self._received = False
+        self._sent_at = None
+        self._received_at = None
+
+    def execute(self):
+        """Execute the request on its own, outside of a batch.
+
+        :raises: :class:`EventumError.GCalAPI` and its subclasses
+
+        :returns: The result of the call.
+        """
+        self.sent()
+        try:
+            self.receive(None, self.request.execute(), None)
+        except (httplib.BadStatusLine, HttpError) as e:
+            self.receive(None, None, e)
+        return self.resolve()
+
+    def sent(self):
+        """Record that the call is being sent, to time it from."""
+        self._sent_at = time()
+
+    def receive(self, request_id, response, exception):
+        """Record the outcome of the call.  This has the signature of a
+        :class:`apiclient.http.BatchHttpRequest` callback.
+
+        :param str request_id: The ID of the request in its batch.
+        :param dict response: The API response, if the call succeeded.
+        :param exception: The exception, if the call failed.
+        """
+        self.response = response
+        self._exception = exception
+        self._received = True
+        self._received_at = time()
+
+    def resolve(self):
+        """Run ``on_success`` or ``on_not_found`` for the recorded outcome.
+
+        :raises: :class:`EventumError.GCalAPI` and its subclasses
+
+        :returns: The result of the call.
+        """
+        started = time()
+        try:
+            if self._exception is not None:
+                error = gcal_error(self._exception)
+                if (self.on_not_found is None or
+                        not isinstance(error, EventumError.GCalAPI.NotFound)):
+                    raise error
+                self.result = self.on_not_found(error)
+            elif self.on_success is not None:
+                self.result = self.on_success(self.response)
+            else:
+                self.result = self.response
+        except EventumError.GCalAPI as e:
+            self.error = e
+            raise
+        finally:
+            if self._sent_at is not None and self._received_at is not None:
+                self.latency = ((self._received_at - self._sent_at) +
+                                (time() - started))
+        return self.result
+
+    @property
+    def done(self):
+        """True once the call has been made."""
+        return self._received
+
+
+class GoogleCalendarBatch(object):
+    """A group of Google Calendar API calls to send in one HTTP request.
+
+    Calls are queued with :func:`add` and sent with :func:`execute`.  Queues
+    longer than :attr:`MAX_BATCH_SIZE` are split across as few HTTP requests
+    as possible.
+    """
+
+    MAX_BATCH_SIZE = 50
+    BATCH_URI = 'https://www.googleapis.com/batch/calendar/v3'
+
+    def __init__(self, batch_uri=None):
+        """Create an empty batch.
+
+        :param str batch_uri: The batch endpoint to send requests to.
+        """
+        self.batch_uri = batch_uri or self.BATCH_URI
+        self.round_trips = 0
+        self._items = []
+
+    def add(self, request, on_success=None, on_not_found=None):
+        """Queue ``request``.  See :class:`GoogleCalendarBatchItem` for the
+        meaning of the arguments.
+
+        :returns: The queued item, which holds the result once the batch has
+            been executed.
+        :rtype: :class:`GoogleCalendarBatchItem`
+        """
+        item = GoogleCalendarBatchItem(request, on_success, on_not_found)
+        self._items.append(item)
+        return item
+
+    def execute(self, raise_errors=True):
+        """Send every queued call, then resolve each of them in the order they
+        were added.  Errors are recorded on each item, so one failed call does
+        not stop the others from being resolved.
+
+        :param bool raise_errors: Whether or not to raise the first error
+            after every item has been resolved.
+
+        :raises: :class:`EventumError.GCalAPI` and its subclasses
+
+        :returns: The executed items.
+        :rtype: list of :class:`GoogleCalendarBatchItem`
+        """
+        items, self._items = self._items, []
+
+        for start in range(0, len(items), self.MAX_BATCH_SIZE):
+            self._send(items[start:start + self.MAX_BATCH_SIZE])
+
+        errors = []
+        for item in items:
+            try:
+                item.resolve()
+            except EventumError.GCalAPI as e:
+                errors.append(e)
+
+        if errors and raise_errors:
+            raise errors[0]
+        return items
+
+    def _send(self, items):
+        """Send ``items`` in a single batch HTTP request.
+
+        :param items: The items to send.
+        :type items: list of :class:`GoogleCalendarBatchItem`
+        """
+        if len(items) == 1:
+            # A batch of one is just a more expensive request.
+            item = items[0]
+            item.sent()
+            try:
+                item.receive(None, item.request.execute(), None)
+            except (httplib.BadStatusLine, HttpError) as e:
+                item.receive(None, None, e)
+            self.round_trips += 1
+            return
+
+        batch = BatchHttpRequest(batch_uri=self.batch_uri)
+        for i, item in enumerate(items):
+            batch.add(item.request, callback=item.receive, request_id=str(i))
+            item.sent()
+
+        try:
+            batch.execute()
+        except (httplib.BadStatusLine, HttpError) as e:
+            # The whole batch failed, so every call in it failed.
+            for item in items:
+                if not item.done:
+                    item.receive(None, None, e)
+        self.round_trips += 1
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,630 @@
+"""
+.. module:: google_calendar_outbox
+    :synopsis: Syncs events to Google Calendar in the background, from a queue
+        of operations stored in Mongo.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+
+Routes save their changes to Mongo and then queue a
+:class:`~app.models.CalendarOperation` describing the change that has to be
+made on Google Calendar.  :class:`GoogleCalendarOutbox` drains that queue on a
+background thread, so a request never waits on Google.
+
+The queue is drained with a few rules:
+
+- Operations on the same target (an event, or a whole series) are run one at a
+  time, in the order they were queued.
+- The next operation for each of several targets are sent together, in a
+  single batch request.
+- A run of consecutive updates to the same target is coalesced into one,
+  because an update always sends the latest version of the event in Mongo.
+- Failed operations are retried with exponential backoff, until they have been
+  tried ``EVENTUM_GCAL_OUTBOX_MAX_ATTEMPTS`` times.
+
+The worker thread is started the first time it is needed in each process.  To
+drain the queue from a separate process instead, set
+``EVENTUM_GCAL_OUTBOX_WORKER`` to ``False`` in the web app, and call
+:func:`GoogleCalendarOutbox.run_forever` from a script::
+
+    from eventum import Eventum
+
+    with app.app_context():
+        Eventum.gcal_outbox().run_forever()
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from eventum.models import CalendarOperation, Event
+from eventum.lib.decorators import skip_and_return_if_auth_disabled
+from eventum.lib.error import EventumError, HTTP_OK
+from eventum.lib.google_calendar_batch import (GoogleCalendarBatch,
+                                               GoogleCalendarBatchItem)
+from eventum.lib.retry import backoff
+
+now = datetime.now
+
+
+def plan_operations(operations, busy_targets, at):
+    """Choose which of the pending ``operations`` to run next, at most one per
+    target.
+
+    For each target, only the oldest pending operation may run, and only if
+    it is not waiting to be retried and no other operation on the target is
+    running.  If it is an update, the updates that immediately follow it on
+    the same target are coalesced into it.
+
+    :param operations: Pending operations, oldest first.
+    :type operations: list of :class:`~app.models.CalendarOperation`
+    :param busy_targets: Targets that already have an operation running.
+    :type busy_targets: set of str
+    :param datetime at: The current time.
+
+    :returns: A list of runs, one per target.  Each run is a list of
+        operations, oldest first.  Only the last operation in a run needs to
+        be sent; the rest are coalesced into it.
+    :rtype: list of lists of :class:`~app.models.CalendarOperation`
+    """
+    seen = set(busy_targets)
+    runs = []
+    open_runs = {}
+    for operation in operations:
+        run = open_runs.get(operation.target)
+        if run is not None:
+            if _coalesces(run[-1], operation):
+                run.append(operation)
+            else:
+                # The run is over, and the rest of this target has to wait.
+                del open_runs[operation.target]
+            continue
+
+        if operation.target in seen:
+            continue
+        seen.add(operation.target)
+
+        if operation.next_attempt > at:
+            # Waiting to be retried, which blocks the rest of the target.
+            continue
+
+        run = [operation]
+        runs.append(run)
+        open_runs[operation.target] = run
+    return runs
+
+
+def _coalesces(first, second):
+    """Returns True if ``second`` can be coalesced into ``first``, meaning that
+    running ``second`` alone would have the same effect as running both.
+
+    :param first: The earlier operation.
+    :type first: :class:`~app.models.CalendarOperation`
+    :param second: The later operation, on the same target.
+    :type second: :class:`~app.models.CalendarOperation`
+
+    :rtype: bool
+    """
+    if (first.operation != CalendarOperation.UPDATE or
+            second.operation != CalendarOperation.UPDATE or
+            first.as_exception != second.as_exception):
+        return False
+    # Exceptions to a series only update one event.
+    return not first.as_exception or first.event_id == second.event_id
+
+
+class GoogleCalendarOutbox(object):
+    """Queues changes for Google Calendar in Mongo, and sends them from a
+    background thread.
+
+    :func:`create_event`, :func:`update_event`, :func:`publish_event`,
+    :func:`unpublish_event` and :func:`delete_event` mirror the methods of
+    :class:`~app.lib.google_calendar.GoogleCalendarAPIClient`, but return the
+    queued :class:`~app.models.CalendarOperation` instead of the API response.
+    If ``EVENTUM_GCAL_OUTBOX_ENABLED`` is ``False``, they call the client
+    directly instead.
+
+    :ivar client: :class:`~app.lib.google_calendar.GoogleCalendarAPIClient` -
+        The client used to send operations.
+    """
+
+    def __init__(self, app, client):
+        """Create an outbox for ``app`` that sends operations with
+        ``client``.  The worker is not started until it is needed.
+
+        :param app: The Flask app.
+        :param client: The client to send operations with.
+        :type client: :class:`~app.lib.google_calendar.GoogleCalendarAPIClient`
+        """
+        self.app = app
+        self.client = client
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._latencies = {}
+
+    @property
+    def enabled(self):
+        """True if operations should be queued, rather than sent right
+        away.
+        """
+        return self.app.config['EVENTUM_GCAL_OUTBOX_ENABLED']
+
+    ###########################################################################
+    # Queueing operations
+    ###########################################################################
+
+    @skip_and_return_if_auth_disabled
+    def create_event(self, event):
+        """Queue the creation of ``event`` in Google Calendar.
+
+        :param event: The event to create.
+        :type event: :class:`Event`
+
+        :returns: The queued operation.
+        :rtype: :class:`~app.models.CalendarOperation`
+        """
+        if not self.enabled:
+            return self.client.create_event(event)
+        return self._enqueue(CalendarOperation.CREATE, event)
+
+    @skip_and_return_if_auth_disabled
+    def update_event(self, event, as_exception=False):
+        """Queue an update to ``event`` in Google Calendar.  If the last
+        operation queued for the event is an identical update that has not
+        been sent yet, that operation is reused.
+
+        :param event: The event to update.
+        :type event: :class:`Event`
+        :param bool as_exception: Whether or not this update should happen as
+            an exception in a series.
+
+        :returns: The queued operation.
+        :rtype: :class:`~app.models.CalendarOperation`
+        """
+        if not self.enabled:
+            return self.client.update_event(event, as_exception=as_exception)
+        return self._enqueue(CalendarOperation.UPDATE, event,
+                             as_exception=as_exception)
+
+    @skip_and_return_if_auth_disabled
+    def publish_event(self, event):
+        """Queue moving ``event`` to the public calendar.
+
+        :param event: The event to publish.
+        :type event: :class:`Event`
+
+        :returns: The queued operation.
+        :rtype: :class:`~app.models.CalendarOperation`
+        """
+        if not self.enabled:
+            return self.client.publish_event(event)
+        return self._enqueue(CalendarOperation.PUBLISH, event)
+
+    @skip_and_return_if_auth_disabled
+    def unpublish_event(self, event):
+        """Queue moving ``event`` to the private calendar.
+
+        :param event: The event to unpublish.
+        :type event: :class:`Event`
+
+        :returns: The queued operation.
+        :rtype: :class:`~app.models.CalendarOperation`
+        """
+        if not self.enabled:
+            return self.client.unpublish_event(event)
+        return self._enqueue(CalendarOperation.UNPUBLISH, event)
+
+    @skip_and_return_if_auth_disabled
+    def delete_event(self, event, as_exception=False):
+        """Queue the deletion of ``event`` (or its series) from Google
+        Calendar.  The event is copied into the operation, so it may be
+        deleted from Mongo as soon as this returns.
+
+        :param event: The event to delete.
+        :type event: :class:`Event`
+        :param bool as_exception: Whether or not to cancel this event as an
+            exception in a series.
+
+        :returns: The queued operation.
+        :rtype: :class:`~app.models.CalendarOperation`
+        """
+        if not self.enabled:
+            return self.client.delete_event(event, as_exception=as_exception)
+        return self._enqueue(CalendarOperation.DELETE, event,
+                             as_exception=as_exception,
+                             snapshot=event.to_mongo().to_dict())
+
+    def _enqueue(self, operation, event, as_exception=False, snapshot=None):
+        """Save a new :class:`~app.models.CalendarOperation` and wake the
+        worker.
+
+        :param str operation: The operation, see
+            :attr:`CalendarOperation.OPERATIONS`.
+        :param event: The event the operation applies to.
+        :type event: :class:`Event`
+        :param bool as_exception: Whether or not the operation applies to a
+            single event in a series.
+        :param dict snapshot: The stored event, for deletes.
+
+        :returns: The queued operation.
+        :rtype: :class:`~app.models.CalendarOperation`
+        """
+        series_id = event.parent_series.id if event.parent_series else None
+        target = str(series_id or event.id)
+
+        if operation == CalendarOperation.UPDATE:
+            # An update sends the latest version of the event, so an identical
+            # update that hasn't been sent yet will already include this one.
+            last = (CalendarOperation.objects(target=target)
+                    .order_by('-date_created').first())
+            if (last is not None and
+                    last.status == CalendarOperation.PENDING and
+                    last.operation == CalendarOperation.UPDATE and
+                    last.as_exception == as_exception and
+                    (not as_exception or last.event_id == event.id)):
+                reused = (CalendarOperation.objects(
+                    id=last.id, status=CalendarOperation.PENDING)
+                    .update_one(set__event_id=event.id,
+                                set__date_modified=now()))
+                if reused:
+                    self.ensure_worker()
+                    return last.reload()
+
+        queued = CalendarOperation(operation=operation,
+                                   as_exception=as_exception,
+                                   event_id=event.id,
+                                   series_id=series_id,
+                                   target=target,
+                                   snapshot=snapshot or {})
+        queued.save()
+
+        self.ensure_worker()
+        return queued
+
+    ###########################################################################
+    # Running the worker
+    ###########################################################################
+
+    @skip_and_return_if_auth_disabled
+    def ensure_worker(self):
+        """Start the worker thread, unless it is disabled or already running
+        in this process.  This is safe to call on every request.
+        """
+        if not self.enabled or not self.app.config[
+                'EVENTUM_GCAL_OUTBOX_WORKER']:
+            return
+
+        with self._lock:
+            # Threads don't survive a fork, so check that the worker belongs
+            # to this process.
+            if (self._thread is not None and self._thread.is_alive() and
+                    self._pid == os.getpid()):
+                self._wake.set()
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever,
+                                            name='gcal-outbox')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the worker thread, waiting for it to finish the operations
+        it is currently sending.
+
+        :param float timeout: The longest to wait, in seconds.
+        """
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def run_forever(self):
+        """Drain the queue until :func:`stop` is called, sleeping for
+        ``EVENTUM_GCAL_OUTBOX_POLL_INTERVAL`` seconds whenever it is empty.
+        """
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    sent = self.run_once()
+            except Exception:
+                self.app.logger.exception('[GCAL_OUTBOX]: Worker failed')
+                sent = 0
+
+            if not sent:
+                self._wake.wait(
+                    self.app.config['EVENTUM_GCAL_OUTBOX_POLL_INTERVAL'])
+                self._wake.clear()
+
+    def run_once(self):
+        """Send the next operation for as many targets as fit in one batch
+        request.  Must be called inside an app context.
+
+        :returns: The number of operations finished, including coalesced
+            ones.
+        :rtype: int
+        """
+        at = now()
+        self._recover_stalled(at)
+
+        pending = (CalendarOperation.objects(status=CalendarOperation.PENDING)
+                   .order_by('date_created')
+                   .limit(self.app.config['EVENTUM_GCAL_OUTBOX_SCAN_LIMIT']))
+        busy = set(CalendarOperation.objects(
+            status=CalendarOperation.RUNNING).distinct('target'))
+        runs = plan_operations(list(pending), busy, at)
+
+        claimed = []
+        for run in runs[:GoogleCalendarBatch.MAX_BATCH_SIZE]:
+            if self._claim(run[-1], at):
+                claimed.append(run)
+        if not claimed:
+            return 0
+
+        outcomes = {}
+        latencies = {}
+        with self.client.batch(raise_errors=False):
+            for run in claimed:
+                operation = run[-1]
+                started = time.time()
+                try:
+                    outcomes[operation.id] = self._dispatch(operation)
+                except Exception as e:
+                    outcomes[operation.id] = e
+                # Reads made while dispatching are sent right away.
+                latencies[operation.id] = time.time() - started
+
+        finished = 0
+        for run in claimed:
+            operation = run[-1]
+            outcome = outcomes[operation.id]
+            self._finish(operation, self._error(outcome),
+                         latencies[operation.id] + self._latency(outcome))
+            for coalesced in run[:-1]:
+                self._coalesce(coalesced, into=operation)
+            finished += len(run)
+        return finished
+
+    def _claim(self, operation, at):
+        """Mark ``operation`` as running, unless another worker got to it
+        first.
+
+        :param operation: The operation to claim.
+        :type operation: :class:`~app.models.CalendarOperation`
+        :param datetime at: The current time.
+
+        :returns: True if the operation was claimed.
+        :rtype: bool
+        """
+        claimed = (CalendarOperation.objects(
+            id=operation.id, status=CalendarOperation.PENDING)
+            .update_one(set__status=CalendarOperation.RUNNING,
+                        set__date_started=at,
+                        set__date_modified=at))
+        if claimed:
+            operation.status = CalendarOperation.RUNNING
+            operation.date_started = at
+        return bool(claimed)
+
+    def _recover_stalled(self, at):
+        """Requeue operations left running by a worker that died.
+
+        :param datetime at: The current time.
+        """
+        timeout = self.app.config['EVENTUM_GCAL_OUTBOX_STALLED_AFTER']
+        (CalendarOperation.objects(
+            status=CalendarOperation.RUNNING,
+            date_started__lt=at - timedelta(seconds=timeout))
+            .update(set__status=CalendarOperation.PENDING,
+                    set__date_modified=at))
+
+    def _dispatch(self, operation):
+        """Call the client method for ``operation``.
+
+        :param operation: The operation to send.
+        :type operation: :class:`~app.models.CalendarOperation`
+
+        :raises: :class:`EventumError.GCalAPI` and its subclasses
+
+        :returns: The response, or the :class:`GoogleCalendarBatchItem` that
+            will hold it once the batch has been sent.
+        """
+        if operation.operation == CalendarOperation.DELETE:
+            event = Event._from_son(operation.snapshot)
+            return self.client.delete_event(
+                event, as_exception=operation.as_exception)
+
+        event = Event.objects(id=operation.event_id).first()
+        if event is None:
+            # The event was deleted after this operation was queued, and the
+            # delete will have been queued after it.
+            self.app.logger.info('[GCAL_OUTBOX]: Skipped {}, the event no '
+                                 'longer exists'.format(operation))
+            return None
+
+        if operation.operation == CalendarOperation.CREATE:
+            return self.client.create_event(event)
+        if operation.operation == CalendarOperation.UPDATE:
+            return self.client.update_event(
+                event, as_exception=operation.as_exception)
+        if operation.operation == CalendarOperation.PUBLISH:
+            return self.client.publish_event(event)
+        return self.client.unpublish_event(event)
+
+    def _error(self, outcome):
+        """Returns the error for a dispatched operation, if it failed.
+
+        :param outcome: What :func:`_dispatch` returned or raised.
+
+        :returns: The error, or ``None`` if the operation succeeded.
+        :rtype: Exception
+        """
+        if isinstance(outcome, GoogleCalendarBatchItem):
+            return outcome.error
+        if isinstance(outcome, Exception):
+            return outcome
+        return None
+
+    def _latency(self, outcome):
+        """Returns how long a dispatched operation spent in its batch.
+
+        :param outcome: What :func:`_dispatch` returned or raised.
+
+        :returns: The number of seconds, or ``0`` if it wasn't batched.
+        :rtype: float
+        """
+        if isinstance(outcome, GoogleCalendarBatchItem):
+            return outcome.latency or 0
+        return 0
+
+    def _finish(self, operation, error, latency):
+        """Record the outcome of ``operation``, scheduling a retry if it
+        failed.
+
+        Errors that mean there is nothing left to do count as success:
+        fallbacks that succeeded, events that were already deleted, events
+        that were never created, and publishes that were overtaken by a later
+        change.  Errors that will happen again, like a bad request, are not
+        retried.
+
+        :param operation: The operation that was sent.
+        :type operation: :class:`~app.models.CalendarOperation`
+        :param Exception error: The error, if it failed.
+        :param float latency: How long the operation took, in seconds.
+        """
+        at = now()
+        operation.attempts += 1
+        operation.latency = latency
+        operation.last_error = (getattr(error, 'message', None) or
+                                repr(error)) if error else None
+
+        if error is None or self._is_settled(error):
+            operation.status = CalendarOperation.DONE
+            operation.date_completed = at
+        elif (self._is_permanent(error) or operation.attempts >=
+                self.app.config['EVENTUM_GCAL_OUTBOX_MAX_ATTEMPTS']):
+            operation.status = CalendarOperation.FAILED
+            operation.date_completed = at
+            self.app.logger.error('[GCAL_OUTBOX]: Gave up on {}: {}'.format(
+                operation, operation.last_error))
+        else:
+            operation.status = CalendarOperation.PENDING
+            operation.next_attempt = at + backoff(
+                operation.attempts,
+                self.app.config['EVENTUM_GCAL_OUTBOX_BACKOFF'],
+                self.app.config['EVENTUM_GCAL_OUTBOX_MAX_BACKOFF'])
+        operation.save()
+
+        self._record_latency(operation,
+                             operation.status != CalendarOperation.DONE)
+
+    def _coalesce(self, operation, into):
+        """Mark ``operation`` as done, because ``into`` included it.
+
+        :param operation: The operation that was coalesced.
+        :type operation: :class:`~app.models.CalendarOperation`
+        :param into: The operation that was sent instead.
+        :type into: :class:`~app.models.CalendarOperation`
+        """
+        (CalendarOperation.objects(id=operation.id,
+                                   status=CalendarOperation.PENDING)
+         .update_one(set__status=into.status,
+                     set__coalesced=True,
+                     set__last_error=into.last_error,
+                     set__date_completed=into.date_completed,
+                     set__date_modified=now()))
+
+    @staticmethod
+    def _is_settled(error):
+        """Returns True if ``error`` means that Google Calendar is already up
+        to date, so the operation should not be retried.
+
+        :param Exception error: The error.
+        :rtype: bool
+        """
+        if getattr(error, 'http_status_code', None) == HTTP_OK:
+            return True
+        return isinstance(error, (EventumError.GCalAPI.EventAlreadyDeleted,
+                                  EventumError.GCalAPI.MissingID,
+                                  EventumError.GCalAPI.PublishFailed))
+
+    @staticmethod
+    def _is_permanent(error):
+        """Returns True if ``error`` means that Google Calendar will reject
+        the operation every time, so there is no point retrying it.
+
+        :param Exception error: The error.
+        :rtype: bool
+        """
+        return isinstance(error, (EventumError.GCalAPI.HttpError.BadRequest,
+                                  EventumError.GCalAPI.HttpError.Forbidden,
+                                  EventumError.GCalAPI.HttpError.Conflict))
+
+    ###########################################################################
+    # Monitoring
+    ###########################################################################
+
+    def _record_latency(self, operation, failed):
+        """Add ``operation`` to the latency counters.
+
+        :param operation: The finished (or retried) operation.
+        :type operation: :class:`~app.models.CalendarOperation`
+        :param bool failed: Whether or not the attempt failed.
+        """
+        with self._lock:
+            counters = self._latencies.setdefault(operation.operation, {
+                'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0,
+                'total_wait': 0.0
+            })
+            counters['count'] += 1
+            counters['errors'] += 1 if failed else 0
+            counters['total'] += operation.latency
+            counters['max'] = max(counters['max'], operation.latency)
+            if operation.date_completed is not None:
+                wait = operation.date_completed - operation.date_created
+                counters['total_wait'] += wait.total_seconds()
+
+    def stats(self):
+        """Returns the depth of the queue, and the latency of each kind of
+        operation sent by this process.
+
+        ``latency`` is the time spent sending an operation to Google, and
+        ``wait`` is the time from when an operation was queued until it was
+        finished.
+
+        :returns: The stats, like::
+
+            {
+                'pending': 3,
+                'running': 1,
+                'failed': 0,
+                'operations': {
+                    'update': {'count': 12, 'errors': 1,
+                               'mean_latency': 0.41, 'max_latency': 1.2,
+                               'mean_wait': 2.3}
+                }
+            }
+
+        :rtype: dict
+        """
+        counts = dict((status, CalendarOperation.objects(status=status)
+                       .count())
+                      for status in (CalendarOperation.PENDING,
+                                     CalendarOperation.RUNNING,
+                                     CalendarOperation.FAILED))
+        operations = {}
+        with self._lock:
+            for name, counters in self._latencies.iteritems():
+                operations[name] = {
+                    'count': counters['count'],
+                    'errors': counters['errors'],
+                    'mean_latency': counters['total'] / counters['count'],
+                    'max_latency': counters['max'],
+                    'mean_wait': counters['total_wait'] / counters['count']
+                }
+        counts['operations'] = operations
+        return counts
@@ -0,0 +1,148 @@
+"""
+.. module:: image_variants
+    :synopsis: Generates smaller versions of uploaded images in the
+        background.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+
+Each size in ``EVENTUM_IMAGE_VARIANTS`` (like ``"thumbnail"``) is a bounding
+box, in pixels, that the image is scaled down to fit.  The variants are saved
+next to the original as ``<name>.<size>.<ext>``.  If ``EVENTUM_IMAGE_WEBP`` is
+set, a WebP copy is saved too, as the ``<size>_webp`` variant.  Once they have
+been written, they are recorded in :attr:`~app.models.Image.variants`, and
+:func:`~app.models.Image.url` starts using them.
+
+Variants need `Pillow <https://python-pillow.github.io/>`_.  If it isn't
+installed, images are only served at full size.
+"""
+
+import os
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+from eventum.lib.response_cache import invalidate
+from eventum.models import Image
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+_pool = None
+_pool_lock = Lock()
+
+
+def generate_variants_async(app, image):
+    """Queues the variants of ``image`` to be generated by the background
+    pool.  Does nothing if Pillow isn't installed.
+
+    :param app: The Flask app, for its ``EVENTUM_IMAGE_*`` settings.
+    :type app: :class:`flask.Flask`
+    :param image: The image to make variants of.
+    :type image: :class:`~app.models.Image`
+
+    :returns: The pending result, or ``None``.
+    :rtype: :class:`multiprocessing.pool.AsyncResult`
+    """
+    if PILImage is None or not app.config['EVENTUM_IMAGE_VARIANTS']:
+        return None
+    return _get_pool(app).apply_async(
+        _generate_and_record,
+        (image.id, image.default_path,
+         app.config['EVENTUM_IMAGE_VARIANTS'],
+         app.config['EVENTUM_IMAGE_WEBP'],
+         app.logger))
+
+
+def generate_variants(path, sizes, webp=False):
+    """Writes the variants of the image at ``path`` next to it.
+
+    Sizes that the image already fits in are skipped, so that images are never
+    scaled up.
+
+    :param str path: The path to the original image.
+    :param dict sizes: A mapping of variant names to the largest width and
+        height of that variant, in pixels.
+    :param bool webp: Whether to also write a WebP copy of each variant.
+
+    :returns: A mapping of variant names to filenames.
+    :rtype: dict
+    """
+    stem, ext = os.path.splitext(path)
+    original = PILImage.open(path)
+    original.load()
+
+    # Palette images are scaled in full color, except GIFs, which may be
+    # animated.
+    source = original
+    if original.mode in ('1', 'P') and original.format != 'GIF':
+        source = original.convert('RGBA')
+
+    variants = {}
+    for name, size in sizes.items():
+        if original.size[0] <= size and original.size[1] <= size:
+            continue
+        variant = source.copy()
+        variant.thumbnail((size, size), PILImage.LANCZOS)
+        if original.format == 'JPEG' and variant.mode != 'RGB':
+            variant = variant.convert('RGB')
+
+        variant_path = '%s.%s%s' % (stem, name, ext)
+        variant.save(variant_path, original.format, optimize=True)
+        variants[name] = os.path.basename(variant_path)
+
+        if webp:
+            webp_path = '%s.%s.webp' % (stem, name)
+            try:
+                variant.save(webp_path, 'WEBP')
+            except (IOError, KeyError):
+                continue  # This Pillow was built without WebP support.
+            variants[name + '_webp'] = os.path.basename(webp_path)
+    return variants
+
+
+def _generate_and_record(image_id, path, sizes, webp, logger):
+    """Generates the variants of an image, and saves them to the image.  Runs
+    on the background pool, where nothing waits on the result, so errors are
+    logged rather than raised.
+
+    :param image_id: The id of the :class:`~app.models.Image`.
+    :type image_id: :class:`bson.ObjectId`
+    :param str path: The path to the original image.
+    :param dict sizes: See :func:`generate_variants`.
+    :param bool webp: See :func:`generate_variants`.
+    :param logger: The app's logger.
+    :type logger: :class:`logging.Logger`
+
+    :returns: A mapping of variant names to filenames, or ``None`` if they
+        couldn't be made.
+    :rtype: dict
+    """
+    try:
+        variants = generate_variants(path, sizes, webp)
+        if variants:
+            Image.objects(id=image_id).update_one(
+                set__variants=variants, set__date_modified=datetime.now())
+            # Updates don't send signals, so invalidate the cached pages here.
+            invalidate('images')
+    except Exception:
+        logger.exception('[IMAGE_VARIANTS]: Failed to make the variants of '
+                         '{}'.format(path))
+        return None
+    return variants
+
+
+def _get_pool(app):
+    """Returns the background pool, creating it if necessary.
+
+    :param app: The Flask app, for ``EVENTUM_IMAGE_VARIANT_WORKERS``.
+    :type app: :class:`flask.Flask`
+
+    :rtype: :class:`multiprocessing.pool.ThreadPool`
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(app.config['EVENTUM_IMAGE_VARIANT_WORKERS'])
+        return _pool
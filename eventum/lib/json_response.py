@@ -2,24 +2,38 @@ from flask import make_response
 import json
 from bson import json_util
 
+try:
+    import ujson
+except ImportError:
+    ujson = None
 
-def json_response(data, code):
+# Reused for every response, rather than building a new encoder each time.
+_encoder = json.JSONEncoder(default=json_util.default)
+
+
+def json_response(data, code, plain=False):
     """Return a :class:`flask.Response` with a JSON encoded object ``data`` in
     the body.
 
     :param dict data: The data to be put in the response body.
     :param int code: The HTTP status code for the response.
+    :param bool plain: True if ``data`` only contains JSON types (and no
+        ObjectIds or datetimes), so that it can be encoded by ``ujson``, if it
+        is installed.
 
     :returns: the response object
     :rtype: :class:`flask.Response`
     """
-    text = json.dumps(data, default=json_util.default)
+    if plain and ujson is not None:
+        text = ujson.dumps(data, ensure_ascii=False)
+    else:
+        text = _encoder.encode(data)
     response = make_response(text, code)
     response.headers['Content-Type'] = 'application/json'
     return response
 
 
-def json_success(data, code=200):
+def json_success(data, code=200, plain=False):
     """Return a :class:`flask.Response` with a JSON error message in the body,
     of the format::
 
@@ -31,6 +45,8 @@ def json_success(data, code=200):
 
     :param dict data: The data to include as JSON in the response
     :param int code: The HTTP status code for the response.
+    :param bool plain: True if ``data`` only contains JSON types, see
+        :func:`json_response`.
 
     :returns: the response object
     :rtype: :class:`flask.Response`
@@ -38,7 +54,7 @@ def json_success(data, code=200):
     return json_response({
         'status': 'success',
         'data': data
-    }, code)
+    }, code, plain=plain)
 
 
 def json_error_message(error_message, code=400, error_data=None):
@@ -0,0 +1,133 @@
+"""
+.. module:: markdown_cache
+    :synopsis: Renders markdown to HTML, caching the output by the hash of its
+        source.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+
+Events and posts render their markdown every time they are saved, and events
+in a series all share the same descriptions.  :data:`markdown_cache` keeps the
+most recently rendered HTML, keyed by a digest of the markdown, and reuses one
+:class:`markdown.Markdown` instance per thread instead of building a new one
+for every call.
+
+Models store the digest next to the HTML, so that saving a document whose
+markdown hasn't changed skips rendering entirely (see :func:`digest`).
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import markdown
+
+#: The markdown extensions used for all of Eventum's rendered content.
+EXTENSIONS = ['extra', 'smarty']
+
+#: The number of rendered documents kept in the cache.
+CACHE_SIZE = 512
+
+
+def digest(*parts):
+    """Returns a hash of ``parts``, to detect when markdown has changed.
+
+    :param parts: The markdown source, and anything else that the rendered
+        HTML depends on.
+    :type parts: list of str
+
+    :returns: The hex digest.
+    :rtype: str
+    """
+    sha = hashlib.sha1()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = part.encode('utf-8')
+        sha.update(part)
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+class MarkdownCache(object):
+    """A bounded, least-recently-used cache of rendered markdown.
+
+    :ivar int size: The maximum number of rendered documents to keep.
+    :ivar int hits: The number of renders answered from the cache.
+    :ivar int misses: The number of renders that ran markdown.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def render(self, source):
+        """Renders ``source`` to HTML.
+
+        :param str source: The markdown to render.
+
+        :returns: The rendered HTML.
+        :rtype: str
+        """
+        key = digest(source)
+        with self._lock:
+            html = self._entries.pop(key, None)
+            if html is not None:
+                self._entries[key] = html
+                self.hits += 1
+                return html
+
+        html = self._convert(source)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = html
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        """Empties the cache and resets its counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns the counters for this cache.
+
+        :returns: The number of hits and misses, the hit ratio, and the number
+            of cached documents.
+        :rtype: dict
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / total if total else 0.0,
+                'size': len(self._entries)
+            }
+
+    def _convert(self, source):
+        """Runs markdown on ``source``, using this thread's
+        :class:`markdown.Markdown` instance.
+
+        :param str source: The markdown to render.
+
+        :returns: The rendered HTML.
+        :rtype: str
+        """
+        md = getattr(self._local, 'markdown', None)
+        if md is None:
+            md = markdown.Markdown(extensions=EXTENSIONS)
+            self._local.markdown = md
+        try:
+            return md.convert(source)
+        finally:
+            md.reset()
+
+
+# The one markdown cache shared by every model in this process.
+markdown_cache = MarkdownCache()
@@ -0,0 +1,161 @@
+"""
+.. module:: prefetch
+    :synopsis: Loads the documents referenced by a list of documents in bulk,
+        instead of one query per reference.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+
+Mongoengine dereferences a :class:`mongoengine.fields.ReferenceField` the
+first time it is accessed, with one query each time.  Rendering a list of
+events that shows each event's image and creator costs two queries per event.
+:func:`prefetch` resolves those references up front, with one ``$in`` query
+per referenced collection::
+
+    events = prefetch(Event.objects(), 'image', 'creator', 'creator.image')
+
+Documents loaded this way are kept in an identity map for the rest of the
+request, so the same :class:`~app.models.Image` or :class:`~app.models.User`
+is never loaded twice.  :func:`prefetch` is also available in templates.
+"""
+
+from bson import DBRef, ObjectId
+from flask import g, has_app_context
+from mongoengine import Document
+from mongoengine.fields import ListField, ReferenceField
+
+
+def prefetch(documents, *paths):
+    """Resolve the references named by ``paths`` on every document in
+    ``documents``.
+
+    :param documents: The documents whose references should be resolved.
+    :type documents: list or :class:`mongoengine.queryset.QuerySet`
+    :param paths: The names of :class:`mongoengine.fields.ReferenceField` s
+        (or lists of them) to resolve.  Dotted paths, like
+        ``"creator.image"``, resolve references on the referenced documents.
+    :type paths: list of str
+
+    :returns: ``documents``, as a list.
+    :rtype: list
+    """
+    documents = list(documents)
+    for path in paths:
+        level = documents
+        for name in path.split('.'):
+            level = _resolve(level, name)
+    return documents
+
+
+def identity_map():
+    """Returns the identity map for the current request, creating it if
+    necessary.  Outside of an app context, a new (empty) map is returned.
+
+    :returns: A mapping of ``(collection name, id)`` to documents.
+    :rtype: dict
+    """
+    if not has_app_context():
+        return {}
+    if not hasattr(g, '_eventum_identity_map'):
+        g._eventum_identity_map = {}
+    return g._eventum_identity_map
+
+
+def _resolve(documents, name):
+    """Resolve the field ``name`` on each of ``documents``.
+
+    :param documents: The documents to resolve the field on.
+    :type documents: list of :class:`mongoengine.Document`
+    :param str name: The name of the field.
+
+    :returns: The referenced documents, to resolve the next part of a dotted
+        path on.
+    :rtype: list of :class:`mongoengine.Document`
+    """
+    # Group the references by the type of document they point to.
+    wanted = {}
+    for document in documents:
+        field = document._fields.get(name)
+        if isinstance(field, ListField):
+            field = field.field
+        if not isinstance(field, ReferenceField):
+            continue
+        document_type = field.document_type
+        ids = wanted.setdefault(document_type, set())
+        for value in _values(document._data.get(name)):
+            ref_id = _ref_id(value)
+            if ref_id is not None:
+                ids.add(ref_id)
+
+    # Load everything that isn't in the identity map yet.
+    loaded = identity_map()
+    for document_type, ids in wanted.iteritems():
+        collection = document_type._get_collection_name()
+        missing = [i for i in ids if (collection, i) not in loaded]
+        if missing:
+            found = document_type.objects.in_bulk(missing)
+            for ref_id, doc in found.iteritems():
+                loaded[(collection, ref_id)] = doc
+
+    # Swap the loaded documents in for the references.
+    resolved = {}
+    for document in documents:
+        field = document._fields.get(name)
+        is_list = isinstance(field, ListField)
+        if is_list:
+            field = field.field
+        if not isinstance(field, ReferenceField):
+            continue
+        collection = field.document_type._get_collection_name()
+
+        def lookup(value):
+            if isinstance(value, Document):
+                return value
+            return loaded.get((collection, _ref_id(value)), value)
+
+        # Read the raw value, so that Mongoengine doesn't dereference it.
+        value = document._data.get(name)
+        if value is None:
+            continue
+        if is_list:
+            value = [lookup(v) for v in value]
+        else:
+            value = lookup(value)
+        # Set it like any other field, so that Mongoengine keeps tracking
+        # changes to it.
+        setattr(document, name, value)
+
+        for v in _values(value):
+            if isinstance(v, Document):
+                resolved[id(v)] = v
+    return list(resolved.values())
+
+
+def _values(value):
+    """Returns ``value`` as a list, for fields that may or may not be lists.
+
+    :param value: The value of a field.
+
+    :rtype: list
+    """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return value
+    return [value]
+
+
+def _ref_id(value):
+    """Returns the ID that ``value`` refers to, if it isn't loaded yet.
+
+    :param value: A reference, as stored on a document.
+    :type value: :class:`bson.DBRef`, :class:`bson.ObjectId` or
+        :class:`mongoengine.Document`
+
+    :returns: The ID, or ``None`` if ``value`` is already a document.
+    :rtype: :class:`bson.ObjectId`
+    """
+    if isinstance(value, DBRef):
+        return value.id
+    if isinstance(value, ObjectId):
+        return value
+    return None
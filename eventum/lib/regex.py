@@ -13,6 +13,10 @@ class _LiveRegexCollection(object):
 
     SLUG_REGEX = r'[0-9a-zA-Z-]+'
     FILENAME_REGEX = r'[\w\-@\|\(\)]+'
+    # Filenames with a content hash in them, like ``eventum.1a2b3c4d.css``.
+    FINGERPRINT_REGEX = r'[.\-_][0-9a-fA-F]{8,}\.\w+$'
+    # The ``src`` attribute of an HTML tag, capturing its value.
+    IMAGE_SRC_REGEX = r'src="([^"]*)"'
 
     @property
     def FULL_FILENAME_REGEX(self):
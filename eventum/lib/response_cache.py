@@ -0,0 +1,312 @@
+"""
+.. module:: response_cache
+    :synopsis: A server-side cache for rendered responses and fragments,
+        invalidated when the documents they were rendered from change.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+
+Cached values are tagged with the kinds of documents they depend on (like
+``"events"`` or ``"posts"``).  Every tag has a generation number, stored in the
+backend, that is part of the key of each value cached under it.  Saving or
+deleting a document bumps the generation of its tag, so the values that depend
+on it are never read again, and age out of the backend on their own.
+
+Two backends are available:
+
+- :class:`LRUBackend`, a bounded in-process cache.  Generations are bumped
+  only in the process that saved the document, so other processes would keep
+  serving stale values until they time out.  Only use it when the app runs in
+  a single process.
+- :class:`RedisBackend`, which shares the cache between processes through any
+  client with Redis's ``get``, ``set`` and ``incr`` methods.
+
+The cache is disabled unless ``EVENTUM_RESPONSE_CACHE`` is set.
+
+Views are cached with :func:`~app.lib.decorators.cached`, and fragments with
+:func:`ResponseCache.fragment`.
+"""
+
+import pickle
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+from time import time
+
+from mongoengine import signals
+
+from eventum.models import Event, EventSeries, BlogPost, Image, User
+
+# The tag that each kind of document invalidates when it changes.
+TAGS = {
+    Event: 'events',
+    EventSeries: 'events',
+    BlogPost: 'posts',
+    Image: 'images',
+    User: 'users'
+}
+
+
+class LRUBackend(object):
+    """An in-process, least-recently-used cache backend.
+
+    Tag generations are kept separately from the values, so that they are never
+    evicted.
+    """
+
+    def __init__(self, size):
+        """
+        :param int size: The maximum number of values to keep.
+        """
+        self.size = size
+        self._values = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the value for ``key``, or ``None`` if it isn't cached or has
+        expired.
+
+        :param str key: The key.
+        """
+        with self._lock:
+            entry = self._values.pop(key, None)
+            if entry is None or entry[0] < time():
+                return None
+            self._values[key] = entry
+            return entry[1]
+
+    def set(self, key, value, timeout):
+        """Caches ``value`` for ``timeout`` seconds.
+
+        :param str key: The key.
+        :param value: The value to cache.
+        :param int timeout: How long to keep the value, in seconds.
+        """
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = (time() + timeout, value)
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+
+    def counter(self, key):
+        """Returns the counter ``key``, which starts at ``0``.
+
+        :param str key: The name of the counter.
+
+        :rtype: int
+        """
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        """Increments the counter ``key``.
+
+        :param str key: The name of the counter.
+        """
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+
+class RedisBackend(object):
+    """A cache backend that stores values in Redis, or anything that behaves
+    like it.
+    """
+
+    def __init__(self, client, prefix='eventum:'):
+        """
+        :param client: The Redis client, like :class:`redis.StrictRedis`.
+        :param str prefix: A prefix for all of Eventum's keys.
+        """
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        """Returns the value for ``key``, or ``None`` if it isn't cached or has
+        expired.
+
+        :param str key: The key.
+        """
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout):
+        """Caches ``value`` for ``timeout`` seconds.
+
+        :param str key: The key.
+        :param value: The value to cache.
+        :param int timeout: How long to keep the value, in seconds.
+        """
+        self.client.set(self.prefix + key,
+                        pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        ex=timeout)
+
+    def counter(self, key):
+        """Returns the counter ``key``, which starts at ``0``.
+
+        :param str key: The name of the counter.
+
+        :rtype: int
+        """
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key):
+        """Increments the counter ``key``.
+
+        :param str key: The name of the counter.
+        """
+        self.client.incr(self.prefix + key)
+
+
+class ResponseCache(object):
+    """Caches rendered responses and fragments, by tag.
+
+    :ivar backend: The backend values are stored in, or ``None`` if caching
+        is disabled.
+    :ivar int timeout: How long values are kept for, in seconds.
+    """
+
+    def __init__(self, app):
+        """
+        :param app: The Flask app whose ``EVENTUM_RESPONSE_CACHE_*`` settings
+            configure the cache.
+        :type app: :class:`flask.Flask`
+        """
+        self.timeout = app.config['EVENTUM_RESPONSE_CACHE_TIMEOUT']
+        self.backend = self._make_backend(app)
+        _caches.append(self)
+
+    @staticmethod
+    def _make_backend(app):
+        """Creates the backend named by ``EVENTUM_RESPONSE_CACHE``.
+
+        :param app: The Flask app.
+        :type app: :class:`flask.Flask`
+
+        :returns: The backend, or ``None`` if caching is disabled.
+        """
+        backend = app.config['EVENTUM_RESPONSE_CACHE']
+        if not backend:
+            return None
+        if backend == 'lru':
+            return LRUBackend(app.config['EVENTUM_RESPONSE_CACHE_SIZE'])
+        if backend == 'redis':
+            try:
+                import redis
+            except ImportError:
+                raise ImportError('The redis package is required to set '
+                                  'EVENTUM_RESPONSE_CACHE to "redis".')
+            url = app.config['EVENTUM_RESPONSE_CACHE_REDIS_URL']
+            return RedisBackend(redis.StrictRedis.from_url(url))
+        # Anything else should already be a backend.
+        return backend
+
+    @property
+    def enabled(self):
+        """Whether or not values are being cached."""
+        return self.backend is not None
+
+    def key(self, name, tags):
+        """Returns the backend key for ``name``, which changes whenever one of
+        ``tags`` is invalidated.
+
+        :param str name: A name that identifies the value.
+        :param tags: The tags the value depends on.
+        :type tags: list of str
+
+        :rtype: str
+        """
+        generations = ','.join('%s=%d' % (tag,
+                                          self.backend.counter('tag:' + tag))
+                               for tag in sorted(tags))
+        digest = sha1(('%s|%s' % (name, generations)).encode('utf-8'))
+        return 'value:' + digest.hexdigest()
+
+    def get(self, name, tags):
+        """Returns the value cached for ``name``, or ``None``.
+
+        :param str name: A name that identifies the value.
+        :param tags: The tags the value depends on.
+        :type tags: list of str
+        """
+        if not self.enabled:
+            return None
+        return self.backend.get(self.key(name, tags))
+
+    def set(self, name, tags, value, timeout=None):
+        """Caches ``value`` for ``name``, until one of ``tags`` is invalidated
+        or ``timeout`` seconds have passed.
+
+        :param str name: A name that identifies the value.
+        :param tags: The tags the value depends on.
+        :type tags: list of str
+        :param value: The value to cache.  It must be picklable.
+        :param int timeout: How long to keep the value, in seconds.  Defaults
+            to ``EVENTUM_RESPONSE_CACHE_TIMEOUT``.
+        """
+        if self.enabled:
+            self.backend.set(self.key(name, tags), value,
+                             timeout or self.timeout)
+
+    def fragment(self, name, tags, create, timeout=None):
+        """Returns the value cached for ``name``, calling ``create`` to make
+        and cache it if there isn't one.
+
+        :param str name: A name that identifies the value.
+        :param tags: The tags the value depends on.
+        :type tags: list of str
+        :param func create: Makes the value.
+        :param int timeout: How long to keep the value, in seconds.
+
+        :returns: The cached or created value.
+        """
+        value = self.get(name, tags)
+        if value is None:
+            value = create()
+            self.set(name, tags, value, timeout)
+        return value
+
+    def invalidate(self, *tags):
+        """Invalidates every value cached under ``tags``.
+
+        :param tags: The tags to invalidate.
+        :type tags: list of str
+        """
+        if self.enabled:
+            for tag in tags:
+                self.backend.incr('tag:' + tag)
+
+
+# Every response cache, so that signals can invalidate them all.
+_caches = []
+
+
+def invalidate(*tags):
+    """Invalidates ``tags`` in every response cache.  Use this after writes
+    that Mongoengine doesn't send signals for, like ``QuerySet.update()``.
+
+    :param tags: The tags to invalidate.
+    :type tags: list of str
+    """
+    for cache in _caches:
+        cache.invalidate(*tags)
+
+
+def _invalidate_document(sender, **kwargs):
+    """Called by Mongoengine after a document is saved, inserted or deleted.
+
+    Invalidates the tag for the document's class.
+    """
+    invalidate(TAGS[sender])
+
+
+# Connects ``_invalidate_document`` using the signals library.  Events have no
+# ``post_delete`` receiver, because that would make ``QuerySet.delete()``
+# delete series one event at a time; the events helpers invalidate instead.
+for document_class in TAGS:
+    signals.post_save.connect(_invalidate_document, sender=document_class)
+    if document_class is not Event:
+        signals.post_delete.connect(_invalidate_document,
+                                    sender=document_class)
+signals.post_bulk_insert.connect(_invalidate_document, sender=Event)
@@ -0,0 +1,22 @@
+"""
+.. module:: retry
+    :synopsis: Helpers for retrying work that has failed.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+"""
+
+from datetime import timedelta
+
+
+def backoff(attempts, base, limit):
+    """Returns how long to wait before retrying an operation that has failed
+    ``attempts`` times.
+
+    :param int attempts: The number of failed attempts.
+    :param float base: The delay after the first failure, in seconds.
+    :param float limit: The longest possible delay, in seconds.
+
+    :returns: The delay.
+    :rtype: :class:`datetime.timedelta`
+    """
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), limit))
@@ -1,5 +1,32 @@
+import hashlib
 import re
 
+try:
+    string_types = basestring
+except NameError:  # Python 3
+    string_types = str
+
+# The longest tag or comment, and the longest entity name.  A ``<`` or ``&``
+# that isn't closed within this many characters is text.
+MAX_TAG_LENGTH = 4096
+MAX_ENTITY_LENGTH = 32
+
+# A tag or comment, or a word (entities count as letters) in group 1.
+re_words = re.compile(r'<[^>]{0,%d}>|((?:\w[-\w]*|&[#\w]{1,%d};)+)' %
+                      (MAX_TAG_LENGTH, MAX_ENTITY_LENGTH), re.U)
+# A tag, split into its closing slash, its name, and its self closing slash.
+re_tag = re.compile(r'<(/)?([^ ]+?)(?:(\s*/)| .*?)?>', re.S)
+
+# Tags that never have an end tag.
+html4_singlets = frozenset([
+    'br', 'col', 'link', 'base', 'img',
+    'param', 'area', 'hr', 'input'
+])
+
+# Patterns used by :func:`snippet`.
+re_any_tag = re.compile(r'<.*?>')
+re_img_tag = re.compile(r'<img.*?/>')
+
 
 def truncate_html(text, truncate_len, truncate_text):
     """Truncates HTML to a certain number of words (not counting tags and
@@ -8,84 +35,161 @@ def truncate_html(text, truncate_len, truncate_text):
 
     Newlines in the HTML are preserved.
 
+    ``text`` is scanned from the start, and scanning stops as soon as the
+    word limit has been passed.  It may also be an iterable of chunks of
+    HTML, like a file or a generator, in which case the chunks after the
+    truncation point are never read.
+
     Modified from django.utils.text
     https://github.com/django/django/blob/master/django/utils/text.py
 
-    :param str text: The text to truncate.
-    :param str truncate_len: The number of words to shorten the HTML to
-    :param int truncate_len: Text like '...' to append to the end of tuncated
-        text.
+    :param text: The text to truncate, or an iterable of chunks of it.
+    :type text: str or iterable
+    :param int truncate_len: The number of words to shorten the HTML to
+    :param str truncate_text: Text like '...' to append to the end of
+        tuncated text.
 
     :returns: The truncated HTML
     :rtype: str
     """
-    re_words = re.compile(r'<.*?>|((?:\w[-\w]*|&.*?;)+)', re.U | re.S)
-    re_tag = re.compile(r'<(/)?([^ ]+?)(?:(\s*/)| .*?)?>', re.S)
-
-    length = truncate_len
-
-    if length <= 0:
+    if truncate_len <= 0:
         return ''
 
-    html4_singlets = (
-        'br', 'col', 'link', 'base', 'img',
-        'param', 'area', 'hr', 'input'
-    )
+    chunks = iter([text] if isinstance(text, string_types) else text)
 
-    # Count non-HTML chars/words and keep note of open tags
-    pos = 0
+    # Text that has been scanned, and the length of it.
+    scanned = []
+    offset = 0
+    # Text that has been read but not yet scanned.
+    buf = ''
     end_text_pos = 0
     current_len = 0
+    # The open tags, innermost last.
     open_tags = []
 
-    while current_len <= length:
-        m = re_words.search(text, pos)
-        if not m:
-            # Checked through whole string
-            break
-        pos = m.end(0)
-        if m.group(1):
-            # It's an actual non-HTML word or char
-            current_len += 1
-            if current_len == truncate_len:
-                end_text_pos = pos
-            continue
-        # Check for tag
-        tag = re_tag.match(m.group(0))
-        if not tag or current_len >= truncate_len:
-            # Don't worry about non tags or tags after our truncate point
-            continue
-        closing_tag, tagname, self_closing = tag.groups()
-        # Element names are always case-insensitive
-        tagname = tagname.lower()
-        if self_closing or tagname in html4_singlets:
-            pass
-        elif closing_tag:
-            # Check for match in open tags list
-            try:
-                i = open_tags.index(tagname)
-            except ValueError:
+    done_reading = False
+    while current_len <= truncate_len and not done_reading:
+        chunk = next(chunks, None)
+        if chunk is None:
+            done_reading = True
+            limit = len(buf)
+        else:
+            buf += chunk
+            limit = _scan_limit(buf)
+
+        # Count non-HTML chars/words and keep note of open tags
+        pos = 0
+        while current_len <= truncate_len:
+            m = re_words.search(buf, pos)
+            if not m or (m.end() >= limit and not done_reading):
+                # Checked through what has been read so far
+                break
+            pos = m.end()
+            if m.group(1):
+                # It's an actual non-HTML word or char
+                current_len += 1
+                if current_len == truncate_len:
+                    end_text_pos = offset + pos
+                continue
+            # Check for tag
+            tag = re_tag.match(m.group(0))
+            if not tag or current_len >= truncate_len:
+                # Don't worry about non tags or tags after our truncate point
+                continue
+            closing_tag, tagname, self_closing = tag.groups()
+            # Element names are always case-insensitive
+            tagname = tagname.lower()
+            if self_closing or tagname in html4_singlets:
                 pass
-            else:
+            elif closing_tag:
                 # SGML: An end tag closes, back to the matching start tag,
                 # all unclosed intervening start tags with omitted end tags
-                open_tags = open_tags[i + 1:]
-        else:
-            # Add it to the start of the open tags list
-            open_tags.insert(0, tagname)
+                for i in range(len(open_tags) - 1, -1, -1):
+                    if open_tags[i] == tagname:
+                        del open_tags[i:]
+                        break
+            else:
+                open_tags.append(tagname)
+
+        scanned.append(buf[:pos])
+        offset += pos
+        buf = buf[pos:]
 
-    if current_len <= length:
-        return text
-    out = text[:end_text_pos]
+    if current_len <= truncate_len:
+        return ''.join(scanned) + buf
+    out = ''.join(scanned)[:end_text_pos]
     if truncate_text:
         out += truncate_text
     # Close any tags still open
-    for tag in open_tags:
+    for tag in reversed(open_tags):
         out += '</{}>'.format(tag)
     # Return string
     return out
 
 
+def _scan_limit(buf):
+    """Returns how far into ``buf`` words and tags can be scanned before the
+    next chunk of HTML has been read.
+
+    A ``<`` with no ``>`` after it, or a ``&`` with no ``;`` after it, may be
+    the start of a tag or entity that ends in the next chunk.  Only the last
+    ``MAX_TAG_LENGTH`` or ``MAX_ENTITY_LENGTH`` characters are checked,
+    because an earlier ``<`` or ``&`` is text, however much more is read.
+
+    :param str buf: The HTML that has been read but not yet scanned.
+
+    :returns: Matches that end before this index are complete.
+    :rtype: int
+    """
+    limit = len(buf)
+    for opener, closer, length in (('<', '>', MAX_TAG_LENGTH),
+                                   ('&', ';', MAX_ENTITY_LENGTH)):
+        # The opener and up to ``length`` characters before the closer.
+        start = buf.find(opener, max(buf.rfind(closer) + 1,
+                                     len(buf) - length - 1))
+        if start != -1:
+            limit = min(limit, start)
+    return limit
+
+
+def snippet(html, length=100, truncate_text="...", newlines=True, tags=True,
+            images=False):
+    """Trim HTML into a snippet.
+
+    :param str html: The HTML to trim.
+    :param int length: The number of words to truncate to.
+    :param str truncate_text: The text to append to truncated text.
+    :param bool newlines: Whether or not to preserve newlines.
+    :param bool tags: Whether or not to trim HTML tags or not.
+    :param bool images: Whether or not to trim images as well.
+
+    :returns: The truncated text.
+    :rtype: str
+    """
+    html = truncate_html(html, length, truncate_text)
+    if not newlines:
+        html = html.replace('\n', ' ')
+    if not tags:
+        html = re_any_tag.sub(' ', html)
+    if not images:
+        html = re_img_tag.sub(' ', html)
+    return html
+
+
+def snippet_key(length=100, truncate_text="...", newlines=True, tags=True,
+                images=False):
+    """Returns a key that identifies the snippet made with these options.
+    Keys never contain ``.`` or ``$``, so they can be used as Mongo field
+    names.
+
+    See :func:`snippet` for the options.
+
+    :rtype: str
+    """
+    text_hash = hashlib.sha1(truncate_text.encode('utf-8')).hexdigest()
+    return '%d-%d%d%d-%s' % (length, newlines, tags, images, text_hash[:8])
+
+
 def clean_markdown(markdown):
     """Formats markdown text for easier plaintext viewing.  Performs the
     following substitutions:
@@ -0,0 +1,222 @@
+"""
+.. module:: uploads
+    :synopsis: Saves uploaded files to disk in chunks, checking their size and
+        contents as they are written.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+
+An :class:`UploadFile` is a temporary file in the upload folder.  While an
+upload is written to it, it hashes the file with SHA-256, stops as soon as the
+file passes ``EVENTUM_MAX_UPLOAD_SIZE``, and checks that the first bytes of the
+file match its extension.  Only when it is saved is the file renamed into
+place, so a partial or rejected upload never appears under its real name.
+
+:func:`upload_stream_factory` makes Werkzeug write uploads straight into an
+:class:`UploadFile` while it parses the request body, so an upload is only
+read once and is never buffered in full.  :func:`save_upload` does the same
+for a file that has already been read.
+
+When a file with the same hash has already been uploaded, the new filename is
+hard linked to the existing file instead, so the bytes are only stored once.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from eventum.lib.error import EventumError
+
+#: The number of bytes read from an upload at a time.
+CHUNK_SIZE = 64 * 1024
+
+#: How much larger than ``EVENTUM_MAX_UPLOAD_SIZE`` an upload's request body
+#: may be, to leave room for the other fields of the form.
+MAX_FORM_OVERHEAD = 1024 * 1024
+
+#: The bytes that files of each extension start with.
+MAGIC_NUMBERS = {
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.jpg': (b'\xff\xd8\xff',),
+    '.jpeg': (b'\xff\xd8\xff',),
+    '.gif': (b'GIF87a', b'GIF89a')
+}
+
+_MAGIC_LENGTH = max(len(magic) for magics in MAGIC_NUMBERS.values()
+                    for magic in magics)
+
+
+class Upload(object):
+    """An upload that has been written to disk.
+
+    :ivar str path: The path to the file.
+    :ivar str sha256: The hex SHA-256 digest of the file.
+    :ivar int size: The size of the file, in bytes.
+    """
+
+    def __init__(self, path, sha256, size):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+
+
+class UploadFile(object):
+    """A temporary file in the upload folder that an upload is written to.
+
+    :ivar str path: The path to the temporary file.
+    :ivar int size: The number of bytes written so far.
+    """
+
+    def __init__(self, folder, max_size, ext=None):
+        """Create the temporary file in ``folder``.
+
+        :param str folder: The upload folder.  The temporary file is in the
+            same folder, so that renaming it is atomic.
+        :param int max_size: The largest allowed size, in bytes.
+        :param str ext: The extension the file is expected to have, like
+            ``".png"``, if it is known before it is saved.
+        """
+        if not os.path.isdir(folder):
+            os.mkdir(folder)
+        fd, self.path = tempfile.mkstemp(dir=folder, prefix='.upload-')
+        self.size = 0
+        self._file = os.fdopen(fd, 'w+b')
+        self._max_size = max_size
+        self._ext = ext
+        self._head = b''
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data):
+        """Hash ``data`` and append it to the file.
+
+        :param bytes data: The next part of the upload.
+
+        :raises: :class:`EventumError.Upload.TooLarge`,
+            :class:`EventumError.Upload.WrongType`
+        """
+        if len(self._head) < _MAGIC_LENGTH:
+            self._head += data[:_MAGIC_LENGTH]
+            if self._ext is not None and len(self._head) >= _MAGIC_LENGTH:
+                self._check_type(self._ext)
+        self.size += len(data)
+        if self.size > self._max_size:
+            raise EventumError.Upload.TooLarge(self._max_size)
+        self._sha256.update(data)
+        self._file.write(data)
+
+    def __getattr__(self, name):
+        # Werkzeug seeks and reads the file like any other upload.
+        return getattr(self._file, name)
+
+    def save(self, path, existing_path=None):
+        """Move the file to ``path``.
+
+        :param str path: Where to save the file.  Its extension decides which
+            kind of image the file has to be.
+        :param func existing_path: Called with the SHA-256 of the upload,
+            returns the path to an identical file that was uploaded before, if
+            there is one.
+
+        :returns: The saved upload.
+        :rtype: :class:`Upload`
+        :raises: :class:`EventumError.Upload.WrongType`
+        """
+        self._check_type(os.path.splitext(path)[1].lower())
+        self._file.close()
+        sha256 = self._sha256.hexdigest()
+        other = existing_path(sha256) if existing_path else None
+        if other is None or not _link(other, path):
+            os.rename(self.path, path)
+        self.discard()
+        return Upload(path, sha256, self.size)
+
+    def discard(self):
+        """Close and remove the temporary file, unless it has been saved."""
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _check_type(self, ext):
+        """Check that the file starts with the magic number of ``ext``.
+
+        :param str ext: The extension, like ``".png"``.
+
+        :raises: :class:`EventumError.Upload.WrongType`
+        """
+        if not self._head.startswith(MAGIC_NUMBERS.get(ext, (b'',))):
+            raise EventumError.Upload.WrongType(ext)
+
+
+def upload_stream_factory(folder, max_size, files):
+    """Makes a ``stream_factory`` for Werkzeug's form parser, that writes
+    each uploaded file into an :class:`UploadFile` as the request is read.
+
+    Pass it to the parser instead of reading ``request.form``::
+
+        upload_files = []
+        _, form, files = parse_form_data(
+            request.environ,
+            stream_factory=upload_stream_factory(folder, max_size,
+                                                 upload_files))
+
+    :param str folder: The upload folder.
+    :param int max_size: The largest allowed size of each file, in bytes.
+    :param list files: Each :class:`UploadFile` that is made is appended to
+        this list, so that the caller can :func:`~UploadFile.discard` the
+        ones it doesn't save.
+
+    :returns: The stream factory.
+    :rtype: func
+    """
+    def stream_factory(total_content_length, content_type, filename=None,
+                       content_length=None):
+        ext = os.path.splitext(filename or '')[1].lower() or None
+        upload_file = UploadFile(folder, max_size, ext=ext)
+        files.append(upload_file)
+        return upload_file
+    return stream_factory
+
+
+def save_upload(stream, path, max_size, existing_path=None):
+    """Writes ``stream`` to ``path``.
+
+    :param stream: The uploaded file.
+    :type stream: file-like
+    :param str path: Where to save the file.  Its extension decides which
+        kind of image the file has to be.
+    :param int max_size: The largest allowed size, in bytes.
+    :param func existing_path: Called with the SHA-256 of the upload, returns
+        the path to an identical file that was uploaded before, if there is
+        one.
+
+    :returns: The saved upload.
+    :rtype: :class:`Upload`
+    :raises: :class:`EventumError.Upload.TooLarge`,
+        :class:`EventumError.Upload.WrongType`
+    """
+    upload_file = UploadFile(os.path.dirname(path), max_size,
+                             ext=os.path.splitext(path)[1].lower())
+    try:
+        chunk = stream.read(CHUNK_SIZE)
+        while chunk:
+            upload_file.write(chunk)
+            chunk = stream.read(CHUNK_SIZE)
+        return upload_file.save(path, existing_path=existing_path)
+    finally:
+        upload_file.discard()
+
+
+def _link(existing, path):
+    """Hard links ``path`` to the file at ``existing``.
+
+    :param str existing: The path to the existing file.
+    :param str path: The new path.
+
+    :returns: True if the link was made.  Links can't be made on some
+        platforms and filesystems, or if ``existing`` is gone.
+    :rtype: bool
+    """
+    try:
+        os.link(existing, path)
+    except (AttributeError, OSError):
+        return False
+    return True
@@ -0,0 +1,110 @@
+"""
+.. module:: user_cache
+    :synopsis: An in-process cache of :class:`~app.models.User` documents,
+        keyed by Google Plus ID.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+
+Every admin request looks up the logged in user.  :class:`UserCache` keeps
+each user for ``EVENTUM_USER_CACHE_TTL`` seconds, so most requests don't have
+to query Mongo at all.  Entries are dropped as soon as the user is saved or
+deleted in this process.  Changes made by other processes are picked up when
+the entry expires.
+
+Each call to :func:`UserCache.get` returns a new
+:class:`~app.models.User` object, so changes made to it during one request
+never leak into another.
+"""
+
+import threading
+import time
+
+from mongoengine import signals
+
+from eventum.models import User
+
+
+class UserCache(object):
+    """A thread-safe cache of users, with a time to live.
+
+    :ivar hits: int - The number of lookups answered from the cache.
+    :ivar misses: int - The number of lookups that queried Mongo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, gplus_id, ttl):
+        """Returns the user with ``gplus_id``, querying Mongo only if the
+        cached copy is older than ``ttl`` seconds.
+
+        :param str gplus_id: The Google Plus ID of the user.
+        :param float ttl: How long a cached user may be used for, in seconds.
+            If it is ``0``, the cache is bypassed.
+
+        :returns: The user, or ``None`` if there isn't one.
+        :rtype: :class:`~app.models.User`
+        """
+        if ttl:
+            with self._lock:
+                entry = self._entries.get(gplus_id)
+                if entry is not None and entry[0] > time.time():
+                    self.hits += 1
+                    return User._from_son(entry[1])
+                generation = self._generation
+
+        user = User.objects(gplus_id=gplus_id).first()
+        with self._lock:
+            self.misses += 1
+            # Don't cache a user that was changed while we were loading it.
+            if ttl and user is not None and generation == self._generation:
+                self._entries[gplus_id] = (time.time() + ttl,
+                                           user.to_mongo())
+        return user
+
+    def invalidate(self, gplus_id=None):
+        """Drop the user with ``gplus_id`` from the cache, or every user if
+        ``gplus_id`` is ``None``.
+
+        :param str gplus_id: The Google Plus ID of the user.
+        """
+        with self._lock:
+            self._generation += 1
+            if gplus_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(gplus_id, None)
+
+    def stats(self):
+        """Returns the counters for this cache.
+
+        :returns: The number of hits, misses, and cached users.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries)
+            }
+
+
+# The one user cache shared by every request in this process.
+user_cache = UserCache()
+
+
+def _invalidate_user(sender, document, **kwargs):
+    """Called by Mongoengine after a user is saved or deleted.
+
+    Drops the user from :data:`user_cache`.
+    """
+    user_cache.invalidate(document.gplus_id)
+
+
+# Connects ``_invalidate_user`` using the signals library.
+signals.post_save.connect(_invalidate_user, sender=User)
+signals.post_delete.connect(_invalidate_user, sender=User)
@@ -4,13 +4,11 @@
 
 .. moduleauthor:: Dan Schlosser <dan@schlosser.io>
 """
-import re
 from datetime import datetime
-from operator import itemgetter
 from flask import url_for
 
 from eventum.models import Post
-from eventum.lib.text import truncate_html
+from eventum.lib import text
 
 now = datetime.now
 
@@ -26,6 +24,11 @@ class BlogPost(Post):
                 tags=True, images=False):
         """Trim the blog post's HTML contnet into a snippet.
 
+        The snippets in ``EVENTUM_POST_SNIPPETS`` are stored on the post when
+        it is saved, see :attr:`Post.snippets`.  Others are made from
+        ``html_content`` every time, and are empty if a listing query didn't
+        load it.
+
         :param int length: The number of words to truncate to.
         :param str truncate_text: The text to append to truncated text.
         :param bool newlines: Whether or not to preserve newlines.
@@ -35,16 +38,12 @@ class BlogPost(Post):
         :returns: The truncated text.
         :rtype: str
         """
-        html = truncate_html(self.html_content, length, truncate_text)
-        if not newlines:
-            html = html.replace('\n', ' ')
-        if not tags:
-            p = re.compile(r'<.*?>')
-            html = p.sub(' ', html)
-        if not images:
-            p = re.compile(r'<img.*?/>')
-            html = p.sub(' ', html)
-        return html
+        options = dict(length=length, truncate_text=truncate_text,
+                       newlines=newlines, tags=tags, images=images)
+        html = (self.snippets or {}).get(text.snippet_key(**options))
+        if html is not None:
+            return html
+        return text.snippet(self.html_content or '', **options)
 
     def get_absolute_url(self):
         """Returns the absolute URL of this blog post.
@@ -54,30 +53,64 @@ class BlogPost(Post):
         """
         return url_for('blog.post', slug=self.slug)
 
-    def get_related_posts(self):
-        """Get blog posts that share tags with this blog post.
+    def get_related_posts(self, limit=None):
+        """Get blog posts that share tags with this blog post, the posts with
+        the most tags in common first.
+
+        The IDs of the related posts are cached until a blog post changes,
+        see :mod:`~app.lib.response_cache`.
+
+        :param int limit: The largest number of posts to return.
 
         :returns: list of related posts
         :rtype: list
+        """
+        from eventum import Eventum
+
+        name = 'related_posts:%s:%s' % (self.id, limit)
+        ids = Eventum.response_cache().fragment(
+            name, ['posts'], lambda: self._related_post_ids(limit))
+        posts = BlogPost.objects.in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+    def _related_post_ids(self, limit=None):
+        """Find the IDs of the posts that share tags with this blog post, in
+        one aggregation.
+
+        :param int limit: The largest number of IDs to return.
 
+        :returns: The IDs, the posts with the most tags in common first, and
+            then the most recently published.
+        :rtype: list of :class:`bson.ObjectId`
         """
-        related_posts = {}
-        for tag in self.post_tags:
-            for obj in BlogPost.objects(post_tags=tag,
-                                        published=True,
-                                        id__ne=self.id,
-                                        featured_image__ne=None):
-                if obj not in related_posts:
-                    related_posts[obj] = 1
-                else:
-                    related_posts[obj] += 1
-
-        sorted_posts = [x[0] for x in sorted(related_posts.items(),
-                                             key=itemgetter(1),
-                                             reverse=True)]  # sort posts by
-        # number of common tags
-
-        return sorted_posts
+        # Compare references by id, without loading the tags.
+        tag_ids = [getattr(ref, 'id', ref)
+                   for ref in self._data.get('post_tags') or []]
+        if not tag_ids:
+            return []
+
+        match = BlogPost.objects(post_tags__in=tag_ids,
+                                 published=True,
+                                 id__ne=self.id,
+                                 featured_image__ne=None)._query
+        pipeline = [
+            {'$match': match},
+            {'$project': {'post_tags': 1, 'date_published': 1}},
+            {'$unwind': '$post_tags'},
+            {'$match': {'post_tags': {'$in': tag_ids}}},
+            {'$group': {'_id': '$_id',
+                        'overlap': {'$sum': 1},
+                        'date_published': {'$first': '$date_published'}}},
+            {'$sort': {'overlap': -1, 'date_published': -1, '_id': -1}}
+        ]
+        if limit:
+            pipeline.append({'$limit': limit})
+
+        result = BlogPost._get_collection().aggregate(pipeline)
+        # PyMongo 2 returns the whole result, later versions a cursor.
+        if isinstance(result, dict):
+            result = result['result']
+        return [row['_id'] for row in result]
 
     def human_readable_date(self):
         """Retuns the date this post was published, formatted like Oct 08, 2014.
@@ -117,6 +150,10 @@ class BlogPost(Post):
         """
         if self.published:
             return 'published'
-        if self.html_content and self.title and self.slug and self.author:
+        # Listings don't load html_content, but it is always rendered when
+        # html_digest is set.  Posts saved before html_digest was stored get
+        # it the next time they are saved.
+        content = self.html_content or self.html_digest
+        if content and self.title and self.slug and self.author:
             return 'complete'
         return 'incomplete'
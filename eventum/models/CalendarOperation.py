@@ -0,0 +1,124 @@
+"""
+.. module:: CalendarOperation
+    :synopsis: A database model for a pending Google Calendar operation.
+
+.. moduleauthor:: Dan Schlosser <dan@schlosser.io>
+"""
+
+from datetime import datetime
+from mongoengine import (Document, DateTimeField, StringField, BooleanField,
+                         IntField, FloatField, DictField, ObjectIdField)
+from eventum.models import BaseEventumDocument
+
+now = datetime.now
+
+
+class CalendarOperation(Document, BaseEventumDocument):
+    """An entry in the Google Calendar outbox: a change to an
+    :class:`~app.models.Event` or :class:`~app.models.EventSeries` that has
+    been saved to Mongo, but not yet synced to Google Calendar.
+
+    Operations are drained by
+    :class:`~app.lib.google_calendar_outbox.GoogleCalendarOutbox`.  Events
+    are stored by ID rather than by reference, so that operations outlive the
+    events they describe (which is always the case for deletes).
+
+    :ivar date_created: :class:`mongoengine.fields.DateTimeField` - The date
+        when the operation was queued.
+    :ivar date_modified: :class:`mongoengine.fields.DateTimeField` - The date
+        when the operation was last modified.
+    :ivar operation: :class:`mongoengine.fields.StringField` - The method of
+        :class:`~app.lib.google_calendar.GoogleCalendarAPIClient` to call. One
+        of ``"create"``, ``"update"``, ``"publish"``, ``"unpublish"`` or
+        ``"delete"``.
+    :ivar as_exception: :class:`mongoengine.fields.BooleanField` - True if
+        the operation applies to a single event in a series.
+    :ivar event_id: :class:`mongoengine.fields.ObjectIdField` - The ID of the
+        event to sync.
+    :ivar series_id: :class:`mongoengine.fields.ObjectIdField` - The ID of
+        the event's parent series, if it is recurring.
+    :ivar target: :class:`mongoengine.fields.StringField` - The calendar
+        object the operation changes (the series if the event is recurring,
+        otherwise the event).  Operations on the same target are run one at a
+        time, in the order they were queued.
+    :ivar snapshot: :class:`mongoengine.fields.DictField` - For deletes, the
+        event as it was stored when the operation was queued.
+    :ivar status: :class:`mongoengine.fields.StringField` - One of
+        ``"pending"``, ``"running"``, ``"done"`` or ``"failed"``.
+    :ivar attempts: :class:`mongoengine.fields.IntField` - The number of times
+        the operation has been tried.
+    :ivar next_attempt: :class:`mongoengine.fields.DateTimeField` - The
+        earliest date the operation may be tried again.
+    :ivar last_error: :class:`mongoengine.fields.StringField` - The message of
+        the last error the operation ran into, if any.
+    :ivar coalesced: :class:`mongoengine.fields.BooleanField` - True if the
+        operation was absorbed into an identical operation before it ran.
+    :ivar date_started: :class:`mongoengine.fields.DateTimeField` - The date
+        the last attempt started.
+    :ivar date_completed: :class:`mongoengine.fields.DateTimeField` - The date
+        the operation finished.
+    :ivar latency: :class:`mongoengine.fields.FloatField` - The number of
+        seconds the last attempt took.
+    """
+
+    CREATE = 'create'
+    UPDATE = 'update'
+    PUBLISH = 'publish'
+    UNPUBLISH = 'unpublish'
+    DELETE = 'delete'
+    OPERATIONS = (CREATE, UPDATE, PUBLISH, UNPUBLISH, DELETE)
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (PENDING, RUNNING, DONE, FAILED)
+
+    # MongoEngine ORM metadata
+    meta = {
+        'indexes': [('status', 'date_created'), 'target'],
+        'ordering': ['date_created']
+    }
+
+    date_created = DateTimeField(required=True, default=now)
+    date_modified = DateTimeField(required=True, default=now)
+    operation = StringField(required=True, choices=OPERATIONS)
+    as_exception = BooleanField(required=True, default=False)
+    event_id = ObjectIdField(required=True)
+    series_id = ObjectIdField()
+    target = StringField(required=True)
+    snapshot = DictField()
+    status = StringField(required=True, default=PENDING, choices=STATUSES)
+    attempts = IntField(required=True, default=0)
+    next_attempt = DateTimeField(required=True, default=now)
+    last_error = StringField()
+    coalesced = BooleanField(required=True, default=False)
+    date_started = DateTimeField()
+    date_completed = DateTimeField()
+    latency = FloatField()
+
+    def clean(self):
+        """Called by Mongoengine on every ``.save()`` to the object.
+
+        Updates ``date_modified``.
+        """
+        self.date_modified = now()
+
+    def __repr__(self):
+        """The representation of this operation.
+
+        :returns: The operation's details.
+        :rtype: str
+        """
+        return ('CalendarOperation(operation=%r, event_id=%r, target=%r, '
+                'status=%r, attempts=%r)' % (self.operation, self.event_id,
+                                             self.target, self.status,
+                                             self.attempts))
+
+    def __unicode__(self):
+        """This operation, as a unicode string.
+
+        :returns: The operation and the event it applies to.
+        :rtype: str
+        """
+        return u'{} {}'.format(self.operation, self.event_id)
@@ -5,13 +5,13 @@
 .. moduleauthor:: Dan Schlosser <dan@schlosser.io>
 """
 
-import markdown
 from flask import url_for, current_app
 from datetime import datetime, timedelta
 from mongoengine import (Document, DateTimeField, StringField, ReferenceField,
                          BooleanField, IntField, ValidationError)
 from eventum.models.fields import DateField, TimeField
 from eventum.models import BaseEventumDocument
+from eventum.lib.markdown_cache import digest, markdown_cache
 now = datetime.now
 
 
@@ -48,6 +48,10 @@ class Event(Document, BaseEventumDocument):
         The markdown short description of the event.
     :ivar long_description_markdown: :class:`mongoengine.fields.StringField` -
         The markdown long description of the event.
+    :ivar short_description_digest: :class:`mongoengine.fields.StringField` -
+        A hash of the markdown that ``short_description`` was rendered from.
+    :ivar long_description_digest: :class:`mongoengine.fields.StringField` -
+        A hash of the markdown that ``long_description`` was rendered from.
     :ivar published: :class:`mongoengine.fields.BooleanField` - True if the
         event is published.
     :ivar date_published: :class:`mongoengine.fields.DateTimeField` - The date
@@ -69,12 +73,16 @@ class Event(Document, BaseEventumDocument):
         Calendar.
     :ivar gcal_sequence: :class:`mongoengine.fields.IntField` - The sequence
         number for the event, used by Google Calendar for versioning.
+    :ivar occurrence: :class:`mongoengine.fields.IntField` - The index of the
+        event in its parent :class:`~app.models.EventSeries`, if it is
+        recurring.
     """
 
     # MongoEngine ORM metadata
     meta = {
         'allow_inheritance': True,
-        'indexes': ['start_date', 'creator'],
+        'indexes': [('start_date', 'id'), 'creator', 'parent_series',
+                    ('slug', 'occurrence')],
         'ordering': ['-start_date']
     }
 
@@ -92,6 +100,8 @@ class Event(Document, BaseEventumDocument):
     long_description = StringField()
     short_description_markdown = StringField()
     long_description_markdown = StringField()
+    short_description_digest = StringField()
+    long_description_digest = StringField()
     published = BooleanField(required=True, default=False)
     date_published = DateTimeField()
     is_recurring = BooleanField(required=True, default=False)
@@ -100,6 +110,21 @@ class Event(Document, BaseEventumDocument):
     facebook_url = StringField()
     gcal_id = StringField()
     gcal_sequence = IntField()
+    occurrence = IntField(min_value=0)
+
+    @classmethod
+    def get_occurrence(cls, slug, index):
+        """Returns the event at ``index`` in the series with the URL slug
+        ``slug``, as linked to by :func:`get_absolute_url`.
+
+        :param str slug: The slug of the series.
+        :param int index: The index of the event in its series.
+
+        :returns: The event, or ``None`` if there isn't one.
+        :rtype: :class:`Event`
+        """
+        return cls.objects(slug=slug, occurrence=index,
+                           is_recurring=True).first()
 
     def get_absolute_url(self):
         """Returns the URL path that points to the client-facing version of
@@ -125,6 +150,9 @@ class Event(Document, BaseEventumDocument):
         """
         if not self.is_recurring:
             return
+        if self.occurrence is not None:
+            return self.occurrence
+        # Events saved before ``occurrence`` existed have to be looked up.
         return self.parent_series.events.index(self)
 
     def clean(self):
@@ -136,19 +164,33 @@ class Event(Document, BaseEventumDocument):
         :raises: :class:`wtforms.validators.ValidationError`
         """
         self.date_modified = now()
+        self.render_markdown()
+        self.validate_dates()
 
-        if self.short_description_markdown:
-            self.short_description = markdown.markdown(
-                self.short_description_markdown,
-                ['extra', 'smarty']
-            )
+    def render_markdown(self):
+        """Renders the markdown descriptions into the HTML fields.
 
-        if self.long_description_markdown:
-            self.long_description = markdown.markdown(
-                self.long_description_markdown,
-                ['extra', 'smarty']
-            )
+        Events in a series share their descriptions, so bulk writes render
+        them once and copy the HTML, rather than calling this on every event.
+        Descriptions whose markdown hasn't changed since they were last
+        rendered are skipped.
+        """
+        for field in ('short_description', 'long_description'):
+            source = getattr(self, field + '_markdown')
+            if not source:
+                continue
+            source_digest = digest(source)
+            if (getattr(self, field + '_digest') == source_digest and
+                    getattr(self, field) is not None):
+                continue
+            setattr(self, field, markdown_cache.render(source))
+            setattr(self, field + '_digest', source_digest)
+
+    def validate_dates(self):
+        """Ensures that the event ends after it starts.
 
+        :raises: :class:`wtforms.validators.ValidationError`
+        """
         if (self.start_date and
                 self.end_date and
                 self.start_date > self.end_date):
@@ -200,14 +242,17 @@ class Event(Document, BaseEventumDocument):
         """
         return str(self.id)
 
-    def image_url(self):
+    def image_url(self, size=None):
         """Returns the URL path that points to the image for the event.
 
+        :param str size: The name of the smaller version of the image to use,
+            like ``"thumbnail"`` (see :func:`~app.models.Image.url`).
+
         :returns: The URL path like ``"/static/img/cat.jpg"``.
         :rtype: str
         """
         if self.image:
-            return self.image.url()
+            return self.image.url(size)
         return url_for(
             'eventum.static',
             filename=current_app.config['EVENTUM_DEFAULT_EVENT_IMAGE'])
@@ -7,8 +7,9 @@
 
 from datetime import datetime
 from mongoengine import (Document, DateTimeField, ReferenceField, IntField,
-                         ListField, StringField, BooleanField, ValidationError)
-from eventum.models import BaseEventumDocument
+                         ListField, StringField, BooleanField, DictField,
+                         ValidationError)
+from eventum.models import BaseEventumDocument, Event
 from eventum.models.fields import DateField
 
 now = datetime.now
@@ -54,6 +55,16 @@ class EventSeries(Document, BaseEventumDocument):
         made a request to create it there. It most likely does not exist on
         Google Calendar.  This is the same as the ``gcal_id`` of the first
         event in the series.
+    :ivar gcal_sequence: :class:`mongoengine.fields.IntField` - The sequence
+        number for the series on Google Calendar, from the last time the whole
+        series was created or updated there.
+    :ivar gcal_instances: :class:`mongoengine.fields.DictField` - An index of
+        the series' instances on Google Calendar, mapping the rfc3339 start
+        time of each instance to its instance ID.
+    :ivar gcal_instances_id: :class:`mongoengine.fields.StringField` - The
+        ``gcal_id`` that ``gcal_instances`` was built for.
+    :ivar gcal_instances_sequence: :class:`mongoengine.fields.IntField` - The
+        ``gcal_sequence`` that ``gcal_instances`` was built for.
     """
 
     # MongoEngine ORM metadata
@@ -71,6 +82,53 @@ class EventSeries(Document, BaseEventumDocument):
     recurrence_end_date = DateField()
     recurrence_summary = StringField()
     gcal_id = StringField()  # ID of the first event in the series
+    gcal_sequence = IntField()
+    gcal_instances = DictField()
+    gcal_instances_id = StringField()
+    gcal_instances_sequence = IntField()
+
+    def instance_index_is_current(self):
+        """Returns True if ``gcal_instances`` was built for the current
+        version of the series on Google Calendar.  The index goes stale
+        whenever the series' ``gcal_id`` or ``gcal_sequence`` change, unless
+        it is carried over by an update that didn't move any events.
+
+        :rtype: bool
+        """
+        return (self.gcal_id is not None and
+                self.gcal_instances_id == self.gcal_id and
+                self.gcal_instances_sequence == self.gcal_sequence)
+
+    def set_instance_index(self, instances):
+        """Replaces the index of the series' instances on Google Calendar,
+        marking it as current.
+
+        :param dict instances: A mapping of rfc3339 start times to instance
+            IDs.
+        """
+        self.gcal_instances = instances
+        self.gcal_instances_id = self.gcal_id
+        self.gcal_instances_sequence = self.gcal_sequence
+        EventSeries.objects(id=self.id).update_one(
+            set__gcal_instances=instances,
+            set__gcal_instances_id=self.gcal_instances_id,
+            set__gcal_instances_sequence=self.gcal_instances_sequence)
+
+    def record_instance(self, instance_id, start=None):
+        """Updates the index entry for the instance ``instance_id`` after it
+        was changed on its own.
+
+        :param str instance_id: The Google Calendar ID of the instance.
+        :param str start: The rfc3339 start time of the instance, or ``None``
+            if it has been cancelled.
+        """
+        instances = dict((k, v) for k, v in self.gcal_instances.iteritems()
+                         if v != instance_id)
+        if start is not None:
+            instances[start] = instance_id
+        self.gcal_instances = instances
+        EventSeries.objects(id=self.id).update_one(
+            set__gcal_instances=instances)
 
     def delete_one(self, event):
         """Deletes ``event`` after removing it from the series.
@@ -82,23 +140,35 @@ class EventSeries(Document, BaseEventumDocument):
         event.delete()
         self.save()
 
+        # Close the gap that ``event`` left in the occurrence numbers.  The
+        # update is raw, because newer versions of Mongoengine check the -1
+        # against the field's ``min_value``.
+        if event.occurrence is not None:
+            Event.objects(parent_series=self,
+                          occurrence__gt=event.occurrence).update(
+                __raw__={'$inc': {'occurrence': -1}})
+
     def delete_all_except(self, event):
         """Deletes all events in the series except ``event``, and then deletes
         the series. Should be called when an event's recurrence is disabled.
 
+        The events are deleted with a single query, so delete rules are
+        applied to them once, in aggregate.
+
         :param event: The event to delete.
         :type event: :class:`~app.models.Event`
         """
-        for e in self.events[:]:
-            if e != event:
-                e.delete()
+        Event.objects(parent_series=self, id__ne=event.id).delete()
         event.parent_series = None
         self.delete()
 
     def delete_all(self):
-        """Deletes all events in the series, and the series itself."""
-        for e in self.events:
-            e.delete()
+        """Deletes all events in the series, and the series itself.
+
+        The events are deleted with a single query, so delete rules are
+        applied to them once, in aggregate.
+        """
+        Event.objects(parent_series=self).delete()
         self.delete()
 
     def clean(self):
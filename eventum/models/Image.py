@@ -11,9 +11,10 @@ from datetime import datetime
 
 from flask import url_for, current_app
 from mongoengine import (Document, DateTimeField, StringField, ReferenceField,
-                         signals)
+                         DictField, IntField, signals)
 
 from eventum.models import BaseEventumDocument
+from eventum.lib import fingerprints
 from eventum.lib.regex import Regex
 now = datetime.now
 
@@ -34,12 +35,20 @@ class Image(Document, BaseEventumDocument):
         the picture, if one is needed.
     :ivar default_path: :class:`mongoengine.fields.StringField` - The path to
         the image that should be used.
+    :ivar variants: :class:`mongoengine.fields.DictField` - The filenames of
+        the scaled down versions of the image, by size (like ``"thumbnail"``).
+        See :mod:`~app.lib.image_variants`.
+    :ivar sha256: :class:`mongoengine.fields.StringField` - The SHA-256 hex
+        digest of the image file.  Images with the same digest share one file
+        on disk.
+    :ivar size: :class:`mongoengine.fields.IntField` - The size of the image
+        file, in bytes.
     """
 
     # MongoEngine ORM metadata
     meta = {
         'allow_inheritance': True,
-        'indexes': ['creator'],
+        'indexes': ['creator', 'sha256', ('date_created', 'id')],
         'ordering': ['-date_created']
     }
 
@@ -53,14 +62,54 @@ class Image(Document, BaseEventumDocument):
     caption = StringField()
     source = StringField()
     default_path = StringField(required=True)
+    variants = DictField()
+    sha256 = StringField()
+    size = IntField()
 
-    def url(self):
+    def url(self, size=None, webp=False):
         """Returns the URL path that points to the image.
 
-        :returns: The URL path like ``"/static/img/cat.jpg"``.
+        :param str size: The name of the smaller version of the image to use,
+            like ``"thumbnail"``.  If it hasn't been made (yet), the URL of
+            the full size image is returned.
+        :param bool webp: Whether to prefer the WebP version of ``size``.
+
+        :returns: The URL path like ``"/static/img/cat.jpg"``.  If the hash of
+            the image is known, it is added as ``?v=``, so that the URL can be
+            cached forever (see :mod:`~app.lib.fingerprints`).
         :rtype: str
         """
-        return url_for('media.file', filename=self.filename)
+        filename = None
+        if size is not None and self.variants:
+            if webp:
+                filename = self.variants.get(size + '_webp')
+            filename = filename or self.variants.get(size)
+        filename = filename or self.filename
+        if self.sha256:
+            fingerprint = self.sha256[:fingerprints.FINGERPRINT_LENGTH]
+            fingerprints.remember(
+                os.path.join(current_app.config['EVENTUM_UPLOAD_FOLDER'],
+                             filename),
+                fingerprint)
+            return url_for('media.file', filename=filename, v=fingerprint)
+        return url_for('media.file', filename=filename)
+
+    @classmethod
+    def get_by_filenames(cls, filenames):
+        """Looks up the images with ``filenames``, in one query.
+
+        :param filenames: The filenames of the images.
+        :type filenames: list of str
+
+        :returns: The images that exist, by filename.  Empty filenames are
+            ignored.
+        :rtype: dict
+        """
+        filenames = [filename for filename in filenames if filename]
+        if not filenames:
+            return {}
+        return dict((image.filename, image)
+                    for image in cls.objects(filename__in=filenames))
 
     def clean(self):
         """Called by Mongoengine on every ``.save()`` to the object.
@@ -80,20 +129,20 @@ class Image(Document, BaseEventumDocument):
     def post_delete(cls, sender, document, **kwargs):
         """Called by Mongoengine after the object has been delted.
 
-        Moves the deleted image's assocaited files to the DELETED_FOLDER.
+        Queues the deleted image's assocaited files to be moved to the
+        DELETED_FOLDER, see :mod:`~app.lib.file_maintenance`.  Variants that
+        are shared with an identical image are left in place.
         """
-        old_path = document.default_path
-        _, filename = os.path.split(document.default_path)
-        delete_folder = current_app.config['EVENTUM_DELETE_FOLDER']
-
-        if not os.path.isdir(delete_folder):
-            os.mkdir(delete_folder)
-        new_path = os.path.join(delete_folder, filename)
-
-        try:
-            os.rename(old_path, new_path)
-        except IOError:
-            pass  # TODO: Do something real if this fails. Logging?
+        from eventum import Eventum
+
+        folder, filename = os.path.split(document.default_path)
+        filenames = [filename]
+        shared = (document.sha256 and
+                  Image.objects(sha256=document.sha256).count() > 0)
+        if not shared:
+            filenames += (document.variants or {}).values()
+        Eventum.file_maintenance().delete_files(
+            [os.path.join(folder, filename) for filename in filenames])
 
     def __unicode__(self):
         """This image, as a unicode string.
@@ -5,14 +5,19 @@
 .. moduleauthor:: Dan Schlosser <dan@schlosser.io>
 """
 
-import markdown
+import re
 from datetime import datetime
+from flask import current_app, has_app_context
 from mongoengine import (Document, DateTimeField, ReferenceField, StringField,
-                         BooleanField, ListField)
+                         BooleanField, ListField, DictField)
+from eventum.config import eventum_config
 from eventum.models import User, BaseEventumDocument
 from eventum.lib.regex import Regex
+from eventum.lib.markdown_cache import digest, markdown_cache
+from eventum.lib.text import snippet, snippet_key
 
 now = datetime.now
+image_src = re.compile(Regex.IMAGE_SRC_REGEX)
 
 
 class Post(Document, BaseEventumDocument):
@@ -30,6 +35,12 @@ class Post(Document, BaseEventumDocument):
         of the post.
     :ivar markdown_content: :class:`mongoengine.fields.StringField` - The
         markdown body of the post, which will be rendered to HTML.
+    :ivar html_digest: :class:`mongoengine.fields.StringField` - A hash of
+        the markdown and images that ``html_content`` was rendered from.
+    :ivar snippets: :class:`mongoengine.fields.DictField` - Trimmed versions
+        of ``html_content``, by :func:`~app.lib.text.snippet_key`.  The
+        snippets in ``EVENTUM_POST_SNIPPETS`` are made on every save, so that
+        listings don't have to load ``html_content``.
     :ivar images: :class:`mongoengine.fields.ListField` of
         :class:`mongoengine.fields.ReferenceField` - The images for this blog
         post.
@@ -54,7 +65,7 @@ class Post(Document, BaseEventumDocument):
     # MongoEngine ORM metadata
     meta = {
         'allow_inheritance': True,
-        'indexes': ['title', 'date_created'],
+        'indexes': ['title', 'date_created', 'post_tags'],
         'ordering': ['-date_created']
     }
 
@@ -64,6 +75,8 @@ class Post(Document, BaseEventumDocument):
     author = ReferenceField(User, required=True)
     html_content = StringField()
     markdown_content = StringField(required=True)
+    html_digest = StringField()
+    snippets = DictField()
     images = ListField(ReferenceField('Image'))
     featured_image = ReferenceField('Image')
     slug = StringField(required=True, regex=Regex.SLUG_REGEX)
@@ -94,19 +107,49 @@ class Post(Document, BaseEventumDocument):
 
         self.date_modified = now()
 
-        self.html_content = markdown.markdown(self.markdown_content,
-                                              ['extra', 'smarty'])
-        if self.images:
-            for image in self.images:
-                if image.filename in self.html_content:
-                    self.html_content = self.html_content.replace(
-                        'src="' + image.filename + '"',
-                        'src="' + image.url() + '"')
+        urls = [(image.filename, image.url()) for image in self.images or []]
+        # The HTML only has to be rendered again if the markdown or the image
+        # URLs have changed.
+        parts = [self.markdown_content or '']
+        for filename, url in urls:
+            parts += [filename, url]
+        html_digest = digest(*parts)
+        if html_digest != self.html_digest or self.html_content is None:
+            html = markdown_cache.render(self.markdown_content)
+            if urls:
+                # Point images that are referenced by filename at their URLs,
+                # in one pass over the HTML.
+                urls = dict(urls)
+                html = image_src.sub(
+                    lambda match: 'src="%s"' % urls.get(match.group(1),
+                                                        match.group(1)),
+                    html)
+            self.html_content = html
+            self.html_digest = html_digest
+            self.snippets = {}
+        self.render_snippets()
         if not self.posted_by:
             self.posted_by = self.author
         if self.published and not self.date_published:
             self.date_published = now()
 
+    def render_snippets(self):
+        """Make the snippets in ``EVENTUM_POST_SNIPPETS`` that haven't been
+        made yet.  Outside of an app context, the default
+        ``EVENTUM_POST_SNIPPETS`` are made.
+        """
+        if has_app_context():
+            snippet_options = current_app.config['EVENTUM_POST_SNIPPETS']
+        else:
+            snippet_options = eventum_config.EVENTUM_POST_SNIPPETS
+
+        snippets = dict(self.snippets or {})
+        for options in snippet_options:
+            key = snippet_key(**options)
+            if key not in snippets:
+                snippets[key] = snippet(self.html_content or '', **options)
+        self.snippets = snippets
+
     def __unicode__(self):
         """This post, as a unicode string.
 
@@ -131,7 +174,9 @@ class Post(Document, BaseEventumDocument):
         rep += ', posted_by=%r' % (self.posted_by) if self.posted_by else ""
 
         # cut down to 100 characters
-        if len(self.html_content) > 100:
+        if self.html_content is None:
+            pass  # Not loaded by a listing query.
+        elif len(self.html_content) > 100:
             rep += ', html_content=%r' % (self.html_content[:97] + "...")
         else:
             rep += ', html_content=%r' % (self.html_content)
@@ -5,12 +5,17 @@
 .. moduleauthor:: Evan Goldstein
 """
 
+from collections import OrderedDict
 from datetime import datetime
-from mongoengine import Document, DateTimeField, StringField, DoesNotExist
+from mongoengine import Document, DateTimeField, StringField
+from pymongo.errors import BulkWriteError
 from eventum.models import BaseEventumDocument
 
 now = datetime.now
 
+# The code of the error Mongo returns when an insert breaks a unique index.
+DUPLICATE_KEY_ERROR = 11000
+
 
 class Tag(Document, BaseEventumDocument):
     """A generic tag object
@@ -45,20 +50,82 @@ class Tag(Document, BaseEventumDocument):
     def get_or_create_tags(cls, tagnames):
         """Get or creates the tags in tagnames
 
-        :returns: list of tags
+        Existing tags are fetched with one query, and the missing ones are
+        created with one unordered bulk upsert.  Tags that another request
+        creates at the same time are fetched with one more query.
+
+        :param tagnames: The names of the tags.
+        :type tagnames: list of str
+
+        :returns: list of tags, in the same order as ``tagnames``
 
         :rtype: list of tag objects
 
         """
-        tags_list = []
-        for tagname in tagnames:
-            try:
-                tags_list.append(cls.objects().get(tagname=tagname))
-            except DoesNotExist:
-                tag = Tag(tagname=tagname)
-                tag.save()
-                tags_list.append(tag)
-        return tags_list
+        unique = list(OrderedDict.fromkeys(tagnames))
+        if not unique:
+            return []
+
+        tags = dict((tag.tagname, tag)
+                    for tag in cls.objects(tagname__in=unique))
+        missing = [cls(tagname=tagname) for tagname in unique
+                   if tagname not in tags]
+        if missing:
+            for tag in missing:
+                tag.validate()
+            upserted = cls._upsert_tags(missing)
+            for index, tag_id in upserted.items():
+                missing[index].id = tag_id
+                tags[missing[index].tagname] = missing[index]
+
+            # Created by someone else since the first query.
+            raced = [tag.tagname for tag in missing if tag.id is None]
+            if raced:
+                tags.update((tag.tagname, tag)
+                            for tag in cls.objects(tagname__in=raced))
+        return [tags[tagname] for tagname in tagnames if tagname in tags]
+
+    @classmethod
+    def _upsert_tags(cls, tags):
+        """Insert ``tags`` that don't exist yet, in one unordered bulk write.
+        Tags that already exist are left alone.
+
+        :param tags: The new, unsaved tags.
+        :type tags: list of :class:`Tag`
+
+        :returns: The IDs of the tags that were inserted, by their index in
+            ``tags``.
+        :rtype: dict
+        """
+        collection = cls._get_collection()
+        try:
+            from pymongo import UpdateOne
+        except ImportError:
+            UpdateOne = None  # PyMongo 2 uses the older bulk API.
+
+        try:
+            if UpdateOne is None:
+                bulk = collection.initialize_unordered_bulk_op()
+                for tag in tags:
+                    (bulk.find({'tagname': tag.tagname}).upsert()
+                     .update_one({'$setOnInsert': tag.to_mongo()}))
+                result = bulk.execute()
+            else:
+                result = collection.bulk_write(
+                    [UpdateOne({'tagname': tag.tagname},
+                               {'$setOnInsert': tag.to_mongo()},
+                               upsert=True)
+                     for tag in tags],
+                    ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            # Concurrent upserts of the same tag can break the unique index.
+            # Those tags exist now, so only other errors are a problem.
+            if any(error['code'] != DUPLICATE_KEY_ERROR
+                   for error in e.details['writeErrors']):
+                raise
+            result = e.details
+        return dict((upsert['index'], upsert['_id'])
+                    for upsert in result['upserted'])
 
     def __unicode__(self):
         """This tag, as a unicode string.
@@ -7,6 +7,7 @@ from BlogPost import BlogPost
 from Event import Event
 from EventSeries import EventSeries
 from Tag import Tag
+from CalendarOperation import CalendarOperation
 
 # Silence flake8 by referencing otherwise unused imports
 __all__ = [
@@ -18,5 +19,6 @@ __all__ = [
     'User',
     'Whitelist',
     'Tag',
+    'CalendarOperation',
     'BaseEventumDocument'
 ]
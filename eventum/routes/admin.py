@@ -5,7 +5,9 @@
 .. moduleauthor:: Dan Schlosser <dan@schlosser.io>
 """
 
-from eventum.lib.decorators import login_required
+from eventum import Eventum
+from eventum.lib.decorators import login_required, requires_privilege, cached
+from eventum.lib.json_response import json_success
 from flask import Blueprint, render_template, redirect, url_for
 from datetime import date, timedelta, datetime
 from eventum.models import Event, BlogPost
@@ -15,6 +17,7 @@ admin = Blueprint('admin', __name__)
 
 @admin.route('/home', methods=['GET'])
 @login_required
+@cached('events', 'posts', 'users', 'images')
 def index():
     """The homepage of Eventum. Shows the latest blog posts and events.
 
@@ -31,7 +34,8 @@ def index():
     this_week = (Event.objects(start_date__gt=last_sunday,
                                start_date__lt=next_sunday)
                  .order_by('start_date'))
-    posts = BlogPost.objects().order_by('published', '-date_published')[:5]
+    posts = (BlogPost.objects().exclude('html_content', 'markdown_content')
+             .order_by('published', '-date_published')[:5])
 
     return render_template('eventum_home.html',
                            this_week=this_week,
@@ -48,3 +52,17 @@ def landing():
     **Methods:** ``GET``
     """
     return redirect(url_for('.index'))
+
+
+@admin.route('/stats/google-calendar', methods=['GET'])
+@requires_privilege('admin')
+def gcal_stats():
+    """Returns the depth of the Google Calendar outbox, and the latency of
+    the operations sent by this process, as JSON.  See
+    :func:`~app.lib.google_calendar_outbox.GoogleCalendarOutbox.stats`.
+
+    **Route:** ``/admin/stats/google-calendar``
+
+    **Methods:** ``GET``
+    """
+    return json_success(Eventum.gcal_outbox().stats())
@@ -5,22 +5,57 @@
 .. moduleauthor:: Jett Andersen <jettca1@gmail.com>
 """
 
+from calendar import timegm
 from datetime import datetime, date, timedelta
+from hashlib import sha1
 
-from flask import Blueprint
+import json
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import Blueprint, Response, g, request, stream_with_context
+from mongoengine import Q
 
 from eventum.models import Event
-from eventum.lib.json_response import json_success
+from eventum.lib.decorators import cached
+from eventum.lib.json_response import json_success, json_error_message
+from eventum.routes.base import lookup_current_user, set_private
 
 api = Blueprint('api', __name__)
 
+# The number of events returned by ``/api/events`` when no limit is given.
+DEFAULT_EVENTS_LIMIT = 100
+
+# The largest number of events ``/api/events`` will return at once.
+MAX_EVENTS_LIMIT = 1000
+
+# The format of the dates in the ``start`` and ``end`` parameters.
+DATE_FORMAT = '%Y-%m-%d'
+
+# The fields of :func:`~app.models.Event.to_jsonifiable` that are stored as-is.
+_EVENT_FIELDS = ('title', 'location', 'slug', 'short_description',
+                 'long_description', 'short_description_markdown',
+                 'long_description_markdown', 'published', 'is_recurring',
+                 'facebook_url')
+
+# The stored datetime fields of :func:`~app.models.Event.to_jsonifiable`.
+_EVENT_DATETIME_FIELDS = ('date_created', 'date_modified', 'date_published')
+
 
 @api.route('/api/events/this_week', methods=['GET'])
+@cached('events')
 def events_this_week():
     """
     Get a json object containing information about all the events for the
     current week (Sunday to Sunday).
 
+    The events are read as raw documents, with only the fields that are
+    returned, and the response has an ``ETag`` so that clients can poll with
+    ``If-None-Match`` and get a ``304`` back when nothing has changed.  The
+    ``ETag`` is built from the number of events and the newest
+    ``date_modified`` among them, so a ``304`` is sent without loading the
+    events.
+
     **Route:** ``/admin/api/events/this_week
 
     **Methods:** ``GET``
@@ -31,8 +66,210 @@ def events_this_week():
         today - timedelta(days=(today.isoweekday() % 7)),
         datetime.min.time())
     next_tuesday = last_sunday + timedelta(days=9)
-    events = Event.objects(start_date__gte=last_sunday,
-                           start_date__lt=next_tuesday).order_by('start_date')
-    event_dicts = [event.to_jsonifiable() for event in events]
+    week = Event.objects(start_date__gte=last_sunday,
+                         start_date__lt=next_tuesday)
+
+    # Answer unchanged weeks before loading or serializing any events.
+    etag = _week_etag(week, last_sunday)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    events = (week.order_by('start_date')
+              .only(*(_EVENT_FIELDS + _EVENT_DATETIME_FIELDS +
+                      ('start_date', 'start_time', 'end_date', 'end_time')))
+              .as_pymongo())
+    event_dicts = [_jsonifiable_event(event) for event in events]
+
+    response = json_success(event_dicts, plain=True)
+    response.set_etag(etag)
+    return response
+
+
+def _week_etag(week, start):
+    """Returns an ETag for the events in ``week``, from their number and
+    newest ``date_modified``, which are found in one aggregation.  Every
+    change to an event updates its ``date_modified``, and deleting one
+    changes the count.
+
+    :param week: The events that start in the week.
+    :type week: :class:`mongoengine.queryset.QuerySet`
+    :param datetime start: The start of the week.
+
+    :returns: The ETag.
+    :rtype: str
+    """
+    result = Event._get_collection().aggregate([
+        {'$match': week._query},
+        {'$group': {'_id': None,
+                    'count': {'$sum': 1},
+                    'modified': {'$max': '$date_modified'}}}
+    ])
+    # PyMongo 2 returns the whole result, later versions a cursor.
+    if isinstance(result, dict):
+        result = result['result']
+    summary = next(iter(result), {'count': 0, 'modified': None})
+    return sha1(('%s:%d:%s' % (start, summary['count'],
+                               summary['modified'])).encode('utf-8')
+                ).hexdigest()
+
+
+@api.route('/api/events', methods=['GET'])
+def events():
+    """
+    Get a json object containing the events that start in a range of dates,
+    ordered by start date.
+
+    Results are paginated: if there are more events, ``next`` is a cursor that
+    can be passed back as ``cursor`` to get the next page.  The events are
+    streamed as they are read from Mongo::
+
+        {
+            "status": "success",
+            "data": {
+                "events": [<event:dict>, ...],
+                "next": <cursor:string or null>
+            }
+        }
+
+    **Route:** ``/admin/api/events``
+
+    **Methods:** ``GET``
+
+    **Parameters:**
+
+    - ``start``: Only events starting on or after this date (``YYYY-MM-DD``).
+    - ``end``: Only events starting before this date (``YYYY-MM-DD``).
+    - ``published``: ``true`` or ``false`` to only get (un)published events.
+      Unpublished events are only sent to logged in users: without a user,
+      only published events are sent, and ``false`` is refused.
+    - ``limit``: The number of events per page (at most 1000).
+    - ``cursor``: The ``next`` value from the previous page.
+    """
+    lookup_current_user()
+    include_drafts = request.args.get('published') != 'true'
+    if include_drafts and g.user is None:
+        if request.args.get('published'):
+            return json_error_message('Log in to see unpublished events.',
+                                      401)
+        include_drafts = False
+
+    try:
+        query = _events_query(request.args, include_drafts)
+        limit = int(request.args.get('limit', DEFAULT_EVENTS_LIMIT))
+    except ValueError as e:
+        return json_error_message('Invalid query: %s' % e, 400)
+    if not 0 < limit <= MAX_EVENTS_LIMIT:
+        return json_error_message('limit must be between 1 and %d.' %
+                                  MAX_EVENTS_LIMIT, 400)
+    if include_drafts:
+        # Drafts must not be cached by proxies, or shown to other users.
+        set_private()
+
+    # Read one extra event, to know whether there is another page.
+    results = (Event.objects(query)
+               .order_by('start_date', 'id')
+               .limit(limit + 1)
+               .only(*(_EVENT_FIELDS + _EVENT_DATETIME_FIELDS +
+                       ('start_date', 'start_time', 'end_date', 'end_time')))
+               .as_pymongo())
+
+    def generate():
+        yield '{"status": "success", "data": {"events": ['
+        last = None
+        has_more = False
+        for count, event in enumerate(results):
+            if count == limit:
+                has_more = True
+                break
+            if last is not None:
+                yield ', '
+            yield json.dumps(_jsonifiable_event(event))
+            last = event
+        cursor = None
+        if has_more:
+            cursor = '%s.%s' % (last['start_date'].strftime(DATE_FORMAT),
+                                last['_id'])
+        yield '], "next": %s}}' % json.dumps(cursor)
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
+
+
+def _events_query(args, include_drafts=True):
+    """Builds the query for :func:`events` from the request arguments.
+
+    :param args: The request arguments.
+    :type args: :class:`werkzeug.datastructures.MultiDict`
+    :param bool include_drafts: False to only get published events when
+        ``published`` isn't given.
 
-    return json_success(event_dicts)
+    :returns: The query.
+    :rtype: :class:`mongoengine.Q`
+    :raises: ValueError
+    """
+    query = Q(start_date__ne=None)
+    if args.get('start'):
+        query &= Q(start_date__gte=datetime.strptime(args['start'],
+                                                     DATE_FORMAT))
+    if args.get('end'):
+        query &= Q(start_date__lt=datetime.strptime(args['end'], DATE_FORMAT))
+    if args.get('published'):
+        if args['published'] not in ('true', 'false'):
+            raise ValueError('published must be true or false.')
+        query &= Q(published=(args['published'] == 'true'))
+    elif not include_drafts:
+        query &= Q(published=True)
+    if args.get('cursor'):
+        # Keyset pagination: continue after the last (start_date, id) seen.
+        start_date, _, event_id = args['cursor'].partition('.')
+        start_date = datetime.strptime(start_date, DATE_FORMAT)
+        try:
+            event_id = ObjectId(event_id)
+        except (InvalidId, TypeError):
+            raise ValueError('Invalid cursor.')
+        query &= (Q(start_date__gt=start_date) |
+                  Q(start_date=start_date, id__gt=event_id))
+    return query
+
+
+def _jsonifiable_event(son):
+    """Returns the same dictionary as :func:`~app.models.Event.to_jsonifiable`
+    for a raw event document, with datetimes already in the format that
+    :func:`bson.json_util.default` would give them.
+
+    :param dict son: The event, as returned by pymongo.
+
+    :returns: A jsonifiable dictionary of event attributes to values.
+    :rtype: dict
+    """
+    event = dict((field, son.get(field)) for field in _EVENT_FIELDS)
+    for field in _EVENT_DATETIME_FIELDS:
+        event[field] = _json_date(son.get(field))
+    event['start_datetime'] = _json_date(son.get('start_date'),
+                                         son.get('start_time'))
+    event['end_datetime'] = _json_date(son.get('end_date'),
+                                       son.get('end_time'))
+    return event
+
+
+def _json_date(value, seconds=0):
+    """Returns ``value`` plus ``seconds`` as ``{"$date": <milliseconds>}``,
+    the extended JSON format for dates.
+
+    :param value: A datetime from Mongo.
+    :type value: :class:`datetime.datetime`
+    :param seconds: The number of seconds since midnight to add to ``value``,
+        as stored by :class:`~app.models.fields.TimeField`. If it is ``None``,
+        the date is ``None`` too.
+    :type seconds: int or float
+
+    :returns: The date, or ``None``.
+    :rtype: dict
+    """
+    # Check times against None, because midnight is represented by 0.
+    if value is None or seconds is None:
+        return None
+    millis = (timegm(value.utctimetuple()) + int(seconds)) * 1000
+    return {'$date': millis + value.microsecond // 1000}
@@ -6,42 +6,213 @@
 .. moduleauthor:: Dan Schlosser <dan@schlosser.io>
 """
 
+import re
 import sys
+from hashlib import sha1
 from flask import (g, session, render_template, request, redirect, flash,
-                   url_for, current_app)
-from mongoengine.queryset import DoesNotExist
+                   url_for, current_app, safe_join)
+from eventum.config import eventum_config
 from eventum.models import User
+from eventum.lib import fingerprints
+from eventum.lib.regex import Regex
+from eventum.lib.user_cache import user_cache
+from eventum.lib.prefetch import prefetch
 
 SUPER_USER_GPLUS_ID = 'super'
 ERROR_FLASH = 'error'
 MESSAGE_FLASH = 'message'
 
+# What is remembered in ``g`` for the length of one request.
+_REQUEST_ATTRIBUTES = ('_user_looked_up', '_cache_validators',
+                       '_fingerprinted', '_private', '_eventum_identity_map')
+
 
 def lookup_current_user():
     """Set the g.user variable to the User in the database that shares
     openid with the session, if one exists.
 
-    Note that it gets called before all requests, but not before decorators
+    Note that it gets called before all requests, but not before decorators.
+    The user is only looked up once per request, and comes from the
+    :class:`~app.lib.user_cache.UserCache` when possible.
     """
+    if getattr(g, '_user_looked_up', False):
+        return
+    g._user_looked_up = True
+
     g.user = None
+    ttl = current_app.config['EVENTUM_USER_CACHE_TTL']
     if not current_app.config.get('EVENTUM_GOOGLE_AUTH_ENABLED'):
         # bypass auth by mocking a super user
         session['gplus_id'] = SUPER_USER_GPLUS_ID
-        try:
-            g.user = User.objects.get(gplus_id=SUPER_USER_GPLUS_ID)
-        except DoesNotExist:
-            user = User(name='Super User',
-                        gplus_id=SUPER_USER_GPLUS_ID,
-                        user_type='admin',
-                        email='email@email.com')
-            user.save()
+        g.user = user_cache.get(SUPER_USER_GPLUS_ID, ttl)
+        if g.user is None:
+            g.user = User(name='Super User',
+                          gplus_id=SUPER_USER_GPLUS_ID,
+                          user_type='admin',
+                          email='email@email.com')
+            g.user.save()
+        return
 
     if 'gplus_id' in session:
-        gplus_id = session['gplus_id']
-        try:
-            g.user = User.objects().get(gplus_id=gplus_id)
-        except DoesNotExist:
-            pass  # Fail gracefully if the user is not in the database yet
+        # Fails gracefully if the user is not in the database yet
+        g.user = user_cache.get(session['gplus_id'], ttl)
+
+
+def set_cache_validators(documents):
+    """Sets the ``Last-Modified`` header of the response to this request to
+    the newest ``date_modified`` of ``documents``, and its ``ETag`` to a hash
+    of their ids and modification dates, unless the view sets one itself.
+
+    Pages are rendered for one user and session, so the ``ETag`` depends on
+    those too.  Requests with flashed messages waiting to be shown get no
+    validators, so that the messages aren't lost to a ``304``.
+
+    Conditional ``GET`` requests are then answered with ``304 Not Modified``
+    by :func:`apply_cache_policy`.
+
+    :param documents: The :class:`~app.models.Event`,
+        :class:`~app.models.Post` or :class:`~app.models.Image` objects (or
+        their raw documents) that the response is rendered from.
+    :type documents: list
+    """
+    if '_flashes' in session:
+        return
+
+    user = getattr(g, 'user', None)
+    last_modified = None
+    etag = sha1(('%s|%s|' % (user.id if user is not None else '',
+                             session.get('csrf_token', ''))).encode('utf-8'))
+    for document in documents:
+        if isinstance(document, dict):
+            document_id = document.get('_id')
+            modified = document.get('date_modified')
+        else:
+            document_id = document.id
+            modified = document.date_modified
+        etag.update(('%s:%s;' % (document_id, modified)).encode('utf-8'))
+        if modified and (last_modified is None or modified > last_modified):
+            last_modified = modified
+    g._cache_validators = (etag.hexdigest(), last_modified)
+
+
+def set_fingerprinted():
+    """Marks the file sent in response to this request as fingerprinted, so
+    that it gets the ``fingerprinted`` cache policy.  Only do this once the
+    fingerprint in the URL has been checked against the file.
+    """
+    g._fingerprinted = True
+
+
+def set_private():
+    """Marks the response to this request as only meant for the current user,
+    so that it gets the ``private`` cache policy, whatever its endpoint.
+    """
+    g._private = True
+
+
+def apply_cache_validators(response):
+    """Sets the ``ETag`` and ``Last-Modified`` headers from
+    :func:`set_cache_validators` on ``response``, if there are any.
+
+    :param response: The response to the current request.
+    :type response: :class:`flask.Response`
+    """
+    validators = getattr(g, '_cache_validators', None)
+    if validators is not None:
+        etag, last_modified = validators
+        if 'ETag' not in response.headers:
+            response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+
+
+def apply_cache_policy(response):
+    """Sets the ``Cache-Control`` header of ``response`` from
+    ``EVENTUM_CACHE_POLICIES``, and answers conditional ``GET`` requests.
+
+    :param response: The response to the current request.
+    :type response: :class:`flask.Response`
+
+    :returns: The response, which may now be a ``304 Not Modified``.
+    :rtype: :class:`flask.Response`
+    """
+    policies = current_app.config['EVENTUM_CACHE_POLICIES']
+    cacheable = (request.method in ('GET', 'HEAD') and
+                 response.status_code in (200, 304))
+    if not cacheable:
+        response.headers['Cache-Control'] = policies['default']
+        return response
+
+    apply_cache_validators(response)
+
+    response.headers['Cache-Control'] = _cache_policy(policies)
+    if 'ETag' in response.headers or 'Last-Modified' in response.headers:
+        response = response.make_conditional(request)
+    return response
+
+
+def _cache_policy(policies):
+    """Returns the policy in ``policies`` for the current request.
+
+    :param dict policies: The cache policies, from ``EVENTUM_CACHE_POLICIES``.
+
+    :returns: The Cache-Control header value.
+    :rtype: str
+    """
+    endpoint = request.endpoint or ''
+    blueprint, _, name = endpoint.rpartition('.')
+    if getattr(g, '_private', False):
+        return policies['private']
+    if getattr(g, '_fingerprinted', False) or (
+            name == 'static' and (
+                re.search(Regex.FINGERPRINT_REGEX, request.path) or
+                _static_fingerprint_matches(blueprint))):
+        return policies['fingerprinted']
+    for key in (endpoint, 'static' if name == 'static' else None, blueprint):
+        if key and key in policies:
+            return policies[key]
+    return policies['default']
+
+
+def _static_fingerprint_matches(blueprint):
+    """Returns True if the ``?v=`` of the static file requested is the
+    fingerprint of its contents (see :func:`~app.lib.fingerprints.of_file`).
+
+    :param str blueprint: The name of the blueprint the file belongs to.
+
+    :rtype: bool
+    """
+    fingerprint = request.args.get('v')
+    filename = (request.view_args or {}).get('filename')
+    if not fingerprint or not filename:
+        return False
+    folder = getattr(current_app.blueprints.get(blueprint), 'static_folder',
+                     None)
+    path = safe_join(folder, filename) if folder else None
+    return path is not None and fingerprints.of_file(path) == fingerprint
+
+
+def register_cache_policy(blueprint):
+    """Apply ``EVENTUM_CACHE_POLICIES`` to the responses of ``blueprint``.
+
+    Only Eventum's blueprints are registered, so that the routes of the app
+    that Eventum is part of are left alone.  Apps can call
+    :func:`apply_cache_policy` from their own ``after_request`` handlers to
+    use the policies for their routes too.
+
+    :param blueprint: The blueprint.
+    :type blueprint: :class:`flask.Blueprint`
+    """
+
+    @blueprint.after_request
+    def add_header(response):
+        """
+        Add headers to force latest IE rendering engine or Chrome Frame, and
+        to let browsers and proxies cache the response, according to
+        ``EVENTUM_CACHE_POLICIES``.
+        """
+        response.headers['X-UA-Compatible'] = 'IE=Edge,chrome=1'
+        return apply_cache_policy(response)
 
 
 def register_error_handlers(blueprint):
@@ -87,6 +258,11 @@ def register_error_handlers(blueprint):
 
 def configure_routing(app):
 
+    # Policies set by the client are merged with the defaults.
+    policies = dict(eventum_config.EVENTUM_CACHE_POLICIES)
+    policies.update(app.config['EVENTUM_CACHE_POLICIES'])
+    app.config['EVENTUM_CACHE_POLICIES'] = policies
+
     @app.before_request
     def _lookup_current_user():
         """We need to be able to import :func:`lookup_current_user`, so
@@ -95,26 +271,26 @@ def configure_routing(app):
         """
         lookup_current_user()
 
+    @app.teardown_request
+    def _forget_request(exception):
+        """Drops what was remembered about this request from ``g``, which
+        outlives the request when an app context was pushed before it, like
+        in tests or :func:`flask.copy_current_request_context`.
+        """
+        for name in _REQUEST_ATTRIBUTES:
+            g.pop(name, None)
+
     @app.context_processor
     def inject_helpers():
         """Injects a dictionary of helper variables and functions into
         Jinja templates.
         """
         helpers = {
-            'current_user': None
+            'current_user': None,
+            'prefetch': prefetch
         }
 
         if hasattr(g, 'user'):
             helpers['current_user'] = g.user
 
         return helpers
-
-    @app.after_request
-    def add_header(response):
-        """
-        Add headers to both force latest IE rendering engine or Chrome Frame,
-        and also to cache the rendered page for 10 minutes.
-        """
-        response.headers['X-UA-Compatible'] = 'IE=Edge,chrome=1'
-        response.headers['Cache-Control'] = 'public, max-age=0'
-        return response
@@ -14,14 +14,16 @@ from flask import (Blueprint, request, render_template, g, redirect,
 from bson.objectid import ObjectId
 from mongoengine.errors import DoesNotExist, ValidationError
 
-from eventum.models import Event, Image
+from eventum.models import Event
 from eventum.forms import (CreateEventForm, EditEventForm, DeleteEventForm,
                            UploadImageForm)
 from eventum.lib.decorators import login_required, requires_privilege
-from eventum.routes.base import ERROR_FLASH, MESSAGE_FLASH
+from eventum.routes.base import (ERROR_FLASH, MESSAGE_FLASH,
+                                 set_cache_validators)
 
 from eventum.lib.error import EventumError
 from eventum.lib.events import EventsHelper
+from eventum.lib.prefetch import prefetch
 events = Blueprint('events', __name__)
 
 
@@ -45,6 +47,9 @@ def index():
      next_week,
      future_events) = _get_events_for_template(past, future)
 
+    set_cache_validators(
+        [event for week in past_events + future_events
+         for event in week['events']] + this_week + next_week)
     return render_template('eventum_events/events.html',
                            past_events=past_events,
                            this_week=this_week,
@@ -76,46 +81,48 @@ def _get_events_for_template(past, future):
     - ``future_events``: A list of dictionaries similar to ``post_events``,
         but for events happening in the future.
 
+    Every week is fetched in one query, with the events' images, creators and
+    series prefetched, and then split into weeks.  The events of this week
+    and next week are in order of their start dates, and the events of the
+    other weeks are newest first.
+
+    :param int past: The number of weeks before this week to include.
+    :param int future: The number of weeks after next week to include.
+
     :returns: ``past_events``, ``this_week``, ``next_week``, ``future_events``
     """
+    past, future = max(past, 0), max(future, 0)
     today = date.today()
     last_sunday = datetime.combine(
         today - timedelta(days=(today.isoweekday() % 7)),
         datetime.min.time()
     )
-    next_sunday = last_sunday + timedelta(days=7)
-    following_sunday = last_sunday + timedelta(days=14)
-
-    this_week = (Event.objects(start_date__gte=last_sunday,
-                               start_date__lt=next_sunday)
-                 .order_by('start_date'))
-    next_week = (Event.objects(start_date__gte=next_sunday,
-                               start_date__lt=following_sunday)
-                 .order_by('start_date'))
-    past_events = []
-    future_events = []
-
-    for week_no in range(past):
-        ending_sunday = last_sunday - timedelta(days=7 * week_no)
-        starting_sunday = last_sunday - timedelta(days=7 * (week_no + 1))
-        week_name = _format_for_display(starting_sunday)
-        events = Event.objects(start_date__gte=starting_sunday,
-                               start_date__lt=ending_sunday)
-        past_events.insert(0, {
-            'week_name': week_name,
-            'events': events,
-        })
-
-    for week_no in range(future):
-        starting_sunday = following_sunday + timedelta(days=7 * week_no)
-        ending_sunday = following_sunday + timedelta(days=7 * (week_no + 1))
-        week_name = _format_for_display(starting_sunday)
-        events = Event.objects(start_date__gte=starting_sunday,
-                               start_date__lt=ending_sunday)
-        future_events.append({
-            'week_name': week_name,
-            'events': events,
-        })
+    first_sunday = last_sunday - timedelta(days=7 * past)
+    n_weeks = past + 2 + future
+    end_sunday = first_sunday + timedelta(days=7 * n_weeks)
+
+    events = prefetch(Event.objects(start_date__gte=first_sunday,
+                                    start_date__lt=end_sunday)
+                      .order_by('start_date'),
+                      'image', 'creator', 'creator.image', 'parent_series')
+
+    weeks = [[] for _ in range(n_weeks)]
+    first_day = first_sunday.date()
+    for event in events:
+        weeks[(event.start_date - first_day).days // 7].append(event)
+
+    def labeled(week_no):
+        starting_sunday = first_sunday + timedelta(days=7 * week_no)
+        return {
+            'week_name': _format_for_display(starting_sunday),
+            'events': weeks[week_no][::-1],
+        }
+
+    past_events = [labeled(week_no) for week_no in range(past)]
+    this_week = weeks[past]
+    next_week = weeks[past + 1]
+    future_events = [labeled(week_no)
+                     for week_no in range(past + 2, n_weeks)]
 
     return past_events, this_week, next_week, future_events
 
@@ -145,10 +152,8 @@ def create():
 
     upload_form = UploadImageForm()
     delete_form = DeleteEventForm()
-    images = Image.objects()
     return render_template('eventum_events/create.html', form=form,
-                           delete_form=delete_form, upload_form=upload_form,
-                           images=images)
+                           delete_form=delete_form, upload_form=upload_form)
 
 
 @events.route('/events/edit/<event_id>', methods=['GET', 'POST'])
@@ -188,11 +193,9 @@ def edit(event_id):
 
     delete_form = DeleteEventForm()
     upload_form = UploadImageForm()
-    images = Image.objects()
 
     return render_template('eventum_events/edit.html', form=form, event=event,
-                           delete_form=delete_form, upload_form=upload_form,
-                           images=images)
+                           delete_form=delete_form, upload_form=upload_form)
 
 
 @events.route('/events/delete/<event_id>', methods=['POST'])
@@ -5,22 +5,50 @@
 .. moduleauthor:: Dan Schlosser <dan@schlosser.io>
 """
 
+import mimetypes
 import os
+from calendar import timegm
+from datetime import datetime, timedelta
 
 from flask import Blueprint, request, redirect, url_for, render_template, \
-    send_from_directory, g, flash, jsonify, current_app
+    send_file, g, flash, jsonify, current_app, abort, safe_join
+from bson import ObjectId
+from bson.errors import InvalidId
+from mongoengine import Q
+from mongoengine.errors import ValidationError
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
 from werkzeug.utils import secure_filename
 
-from eventum.lib.decorators import login_required, requires_privilege
+from eventum.lib.decorators import (login_required, requires_privilege,
+                                    cached)
+from eventum.lib import fingerprints
+from eventum.lib.error import EventumError
+from eventum.lib.image_variants import generate_variants_async
+from eventum.lib.uploads import (MAX_FORM_OVERHEAD, UploadFile,
+                                 save_upload, upload_stream_factory)
+from eventum.lib.json_response import json_success, json_error_message
+from eventum.lib.prefetch import prefetch
 from eventum.forms import UploadImageForm
-from eventum.models import Image
-from eventum.routes.base import ERROR_FLASH
+from eventum.models import Image, BlogPost
+from eventum.routes.base import (ERROR_FLASH, set_cache_validators,
+                                 set_fingerprinted)
 
 media = Blueprint('media', __name__)
 
+# The number of images in each page of the media library.
+IMAGES_PAGE_SIZE = 60
+
+# The largest page of images that can be requested.
+MAX_IMAGES_PAGE_SIZE = 200
+
+# The ways the image grid can be rendered by :func:`select`.
+IMAGE_MODES = ('editor', 'selector')
+
 
 @media.route('/media', methods=['GET'])
 @login_required
+@cached('images', 'users')
 def index():
     """View all of the uploaded images.
 
@@ -28,10 +56,9 @@ def index():
 
     **Methods:** ``GET``
     """
-    images = Image.objects()
     form = UploadImageForm()
     return render_template('eventum_media/media.html',
-                           images=images,
+                           has_images=Image.objects.first() is not None,
                            form=form)
 
 
@@ -66,33 +93,110 @@ def create_filename(f, slug):
 def upload():
     """Upload an image to Eventum
 
+    Uploads are hashed and written to the upload folder while the request
+    is read, and are refused as soon as they pass ``EVENTUM_MAX_UPLOAD_SIZE``.
+    Request bodies that are too large to hold an upload are refused before
+    they are read at all.  Uploads that are identical to an existing image
+    share its file on disk.
+
     :returns: A JSON containing the status of the file upload, or error
               messages, if any.
     :rtype: json
     """
-    form = UploadImageForm(request.form)
+    max_size = current_app.config['EVENTUM_MAX_UPLOAD_SIZE']
+    max_content_length = max_size + MAX_FORM_OVERHEAD
+    if (request.content_length or 0) > max_content_length:
+        return _upload_error(EventumError.Upload.TooLarge(max_size))
+
+    upload_files = []
+    try:
+        # The body is parsed here, instead of by ``request.form``, so that
+        # uploads are written to disk as they are read.
+        _, formdata, files = parse_form_data(
+            request.environ,
+            stream_factory=upload_stream_factory(
+                current_app.config['EVENTUM_UPLOAD_FOLDER'], max_size,
+                upload_files),
+            max_form_memory_size=MAX_FORM_OVERHEAD,
+            max_content_length=max_content_length)
+        return _save_upload(formdata, files, max_size)
+    except RequestEntityTooLarge:
+        return _upload_error(EventumError.Upload.TooLarge(max_size))
+    except EventumError.Upload as e:
+        return _upload_error(e)
+    finally:
+        for upload_file in upload_files:
+            upload_file.discard()
+
+
+def _save_upload(formdata, files, max_size):
+    """Validates the upload form, and saves its image.
+
+    :param formdata: The fields of the form.
+    :type formdata: :class:`werkzeug.datastructures.MultiDict`
+    :param files: The files in the form.
+    :type files: :class:`werkzeug.datastructures.MultiDict`
+    :param int max_size: The largest allowed size, in bytes.
+
+    :returns: The response.
+    :rtype: :class:`flask.Response`
+    :raises: :class:`EventumError.Upload`
+    """
+    form = UploadImageForm(formdata)
     if form.validate_on_submit():
-        f = request.files['image']
+        f = files.get('image')
         if f:
-            filename = create_filename(f, request.form['filename'])
-            upload_folder = current_app.config['EVENTUM_UPLOAD_FOLDER']
-            if not os.path.isdir(upload_folder):
-                os.mkdir(upload_folder)
-            f.save(os.path.join(upload_folder, filename))
+            filename = create_filename(f, formdata['filename'])
             default_path = os.path.join(
                 current_app.config['EVENTUM_UPLOAD_FOLDER'],
                 filename,
             )
+            duplicates = []
+
+            def existing_path(sha256):
+                duplicates.extend(Image.objects(sha256=sha256).limit(1))
+                return duplicates[0].default_path if duplicates else None
+
+            if isinstance(f.stream, UploadFile):
+                upload = f.stream.save(default_path,
+                                       existing_path=existing_path)
+            else:
+                upload = save_upload(f.stream, default_path, max_size,
+                                     existing_path=existing_path)
+
             image = Image(filename=filename,
                           default_path=default_path,
-                          creator=g.user)
+                          creator=g.user,
+                          sha256=upload.sha256,
+                          size=upload.size)
+            if duplicates and duplicates[0].variants:
+                # The variants are shared along with the file.
+                image.variants = duplicates[0].variants
             image.save()
+            if not image.variants:
+                generate_variants_async(current_app._get_current_object(),
+                                        image)
             return jsonify({"status": "true"})
     if form.errors:
         return jsonify(form.errors)
     return jsonify({"status": "error"})
 
 
+def _upload_error(error):
+    """Returns the response for a failed upload, in the same format as form
+    errors.
+
+    :param error: The error.
+    :type error: :class:`EventumError.Upload`
+
+    :returns: The response.
+    :rtype: :class:`flask.Response`
+    """
+    response = jsonify({'image': [error.message]})
+    response.status_code = error.http_status_code
+    return response
+
+
 @media.route('/media/uploads/<filename>', methods=['GET'])
 def file(filename):
     """View the raw image file for the file with name ``filename``.
@@ -101,10 +205,37 @@ def file(filename):
 
     **Methods:** ``GET``
 
+    If ``EVENTUM_MEDIA_OFFLOAD`` is set, the file is sent by the web server
+    in front of Eventum instead.  Otherwise, it is sent with support for
+    conditional and range requests.
+
+    Files requested with the fingerprint from :func:`Image.url` as ``?v=``
+    are cached forever, but only if this process added it to the URL of the
+    same file.
+
     :param str filename: The filename of the image to show.
     """
-    return send_from_directory(current_app.config['EVENTUM_UPLOAD_FOLDER'],
-                               filename)
+    path = safe_join(current_app.config['EVENTUM_UPLOAD_FOLDER'], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    # Checked without a query, see :mod:`~app.lib.fingerprints`.
+    if fingerprints.matches(path, request.args.get('v'), os.stat(path)):
+        set_fingerprinted()
+
+    offload = current_app.config['EVENTUM_MEDIA_OFFLOAD']
+    if offload:
+        mimetype = (mimetypes.guess_type(filename)[0] or
+                    'application/octet-stream')
+        response = current_app.response_class(mimetype=mimetype)
+        if offload == 'x-accel-redirect':
+            response.headers['X-Accel-Redirect'] = (
+                current_app.config['EVENTUM_MEDIA_ACCEL_PREFIX'] + filename)
+        else:
+            response.headers['X-Sendfile'] = path
+        return response
+
+    return send_file(path, conditional=True)
 
 
 @media.route('/media/delete/<filename>', methods=['POST'])
@@ -124,16 +255,147 @@ def delete(filename):
     return redirect(url_for('.index'))
 
 
+@media.route('/media/images', methods=['GET'])
+@login_required
+def images():
+    """Get a page of uploaded images, newest first, as JSON::
+
+        {
+            "status": "success",
+            "data": {
+                "images": [
+                    {
+                        "filename": <filename:string>,
+                        "url": <url:string>,
+                        "thumbnail_url": <url:string>
+                    }, ...
+                ],
+                "next": <cursor:string or null>
+            }
+        }
+
+    **Route:** ``/admin/media/images``
+
+    **Methods:** ``GET``
+
+    **Parameters:** See :func:`_images_page`.
+    """
+    try:
+        page, cursor = _images_page(request.args)
+    except ValueError as e:
+        return json_error_message('Invalid query: %s' % e, 400)
+    set_cache_validators(page)
+    return json_success({
+        'images': [{
+            'filename': image.filename,
+            'url': image.url(),
+            'thumbnail_url': image.url('thumbnail')
+        } for image in page],
+        'next': cursor
+    })
+
+
 @media.route('/media/image-view', methods=['GET'])
+@login_required
 def select():
-    """Displays all uploaded images, with mode depending on parameter passed in
+    """Displays a page of uploaded images, with mode depending on parameter
+    passed in.  The last item of the page loads the next page when it is
+    scrolled into view.
 
-    **Route:** ``/admin/media/image``
+    **Route:** ``/admin/media/image-view``
 
     **Methods:** ``GET``
-    """
-    images = Image.objects()
 
-    fmt = "eventum_media/image_{image_mode!s}.html"
-    template_name = fmt.format(image_mode=request.args.get("mode"))
-    return render_template(template_name, images=images)
+    **Parameters:** The parameters of :func:`_images_page`, and:
+
+    - ``mode``: ``editor`` or ``selector``.
+    - ``action``: The link that selecting an image follows, in ``selector``
+      mode.  Either ``select-image`` (the default) or ``set-image``.
+    - ``page``: If set, only the images are rendered, to be appended to an
+      existing grid.
+    """
+    mode = request.args.get('mode')
+    action = request.args.get('action', 'select-image')
+    if mode not in IMAGE_MODES or action not in ('select-image', 'set-image'):
+        abort(400)
+    try:
+        page, cursor = _images_page(request.args)
+    except ValueError:
+        abort(400)
+
+    next_url = None
+    if cursor is not None:
+        args = request.args.to_dict()
+        args.update(before=cursor, page=1)
+        next_url = url_for('.select', **args)
+
+    template_name = "eventum_media/image_{image_mode!s}.html".format(
+        image_mode=mode)
+    set_cache_validators(page)
+    return render_template(template_name,
+                           images=page,
+                           action=action,
+                           next_url=next_url,
+                           page_only=bool(request.args.get('page')))
+
+
+def _images_page(args):
+    """Returns a page of images, newest first, using keyset pagination on
+    ``(date_created, id)``.
+
+    - ``before``: The cursor from the previous page.
+    - ``q``: Only images whose filenames start with this.
+    - ``post``: Leave out the images that are already in this post.
+    - ``limit``: The number of images to return (at most 200).
+
+    :param args: The request arguments.
+    :type args: :class:`werkzeug.datastructures.MultiDict`
+
+    :returns: The images, and the cursor for the next page (or ``None``).
+    :rtype: tuple
+    :raises: ValueError
+    """
+    limit = int(args.get('limit', IMAGES_PAGE_SIZE))
+    if not 0 < limit <= MAX_IMAGES_PAGE_SIZE:
+        raise ValueError('limit must be between 1 and %d.' %
+                         MAX_IMAGES_PAGE_SIZE)
+
+    query = Q()
+    if args.get('q'):
+        query &= Q(filename__startswith=args['q'])
+    if args.get('before'):
+        millis, _, image_id = args['before'].partition('.')
+        try:
+            date_created = (datetime(1970, 1, 1) +
+                            timedelta(milliseconds=int(millis)))
+            image_id = ObjectId(image_id)
+        except (InvalidId, TypeError):
+            raise ValueError('Invalid cursor.')
+        query &= (Q(date_created__lt=date_created) |
+                  Q(date_created=date_created, id__lt=image_id))
+    if args.get('post'):
+        try:
+            post = BlogPost.objects(id=args['post']).only('images').first()
+        except (InvalidId, ValidationError):
+            raise ValueError('Invalid post.')
+        if post is not None:
+            # Compare references by id, without loading the images.
+            ids = [getattr(ref, 'id', ref)
+                   for ref in post._data.get('images') or []]
+            query &= Q(id__nin=ids)
+
+    # Read one extra image, to know whether there is another page.  Creators
+    # are loaded with one query, rather than one for each image that shows
+    # its creator.
+    page = prefetch(Image.objects(query)
+                    .order_by('-date_created', '-id')
+                    .limit(limit + 1),
+                    'creator')
+    cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last = page[-1]
+        millis = (timegm(last.date_created.utctimetuple()) * 1000 +
+                  last.date_created.microsecond // 1000)
+        cursor = '%d.%s' % (millis, last.id)
+    return page, cursor
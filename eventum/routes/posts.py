@@ -13,14 +13,18 @@ from bson.objectid import InvalidId
 from mongoengine.errors import DoesNotExist, ValidationError
 from eventum.models import BlogPost, Image, User, Tag
 from eventum.forms import CreateBlogPostForm, UploadImageForm
-from eventum.lib.decorators import login_required, requires_privilege
-from eventum.routes.base import MESSAGE_FLASH, ERROR_FLASH
+from eventum.lib.decorators import (login_required, requires_privilege,
+                                    cached)
+from eventum.lib.prefetch import prefetch
+from eventum.routes.base import (MESSAGE_FLASH, ERROR_FLASH,
+                                 set_cache_validators)
 
 posts = Blueprint('posts', __name__)
 
 
 @posts.route('/posts', methods=['GET'])
 @login_required
+@cached('posts', 'users', 'images')
 def index():
     """View all of the blog posts.
 
@@ -28,7 +32,12 @@ def index():
 
     **Methods:** ``GET``
     """
-    all_posts = BlogPost.objects().order_by('published', '-date_published')
+    # Snippets are stored on each post, so the content isn't needed.
+    all_posts = prefetch(
+        BlogPost.objects().exclude('html_content', 'markdown_content')
+        .order_by('published', '-date_published'),
+        'author', 'author.image')
+    set_cache_validators(all_posts)
     return render_template('eventum_posts/posts.html', posts=all_posts)
 
 
@@ -50,7 +59,8 @@ def new():
     upload_form = UploadImageForm()
     if form.validate_on_submit():
         author = User.objects().get(id=ObjectId(form.author.data))
-        images = [Image.objects().get(filename=fn) for fn in form.images.data]
+        found = Image.get_by_filenames(form.images.data)
+        images = [found[fn] for fn in form.images.data if fn in found]
         tags = Tag.get_or_create_tags(form.tags.data)
         post = BlogPost(title=form.title.data,
                         slug=form.slug.data,
@@ -69,9 +79,8 @@ def new():
             return redirect(url_for('blog.preview', slug=post.slug))
 
         return redirect(url_for('.index'))
-    images = Image.objects()
     return render_template('eventum_posts/edit.html', user=g.user, form=form,
-                           images=images, upload_form=upload_form)
+                           upload_form=upload_form)
 
 
 @posts.route('/posts/edit/<post_id>', methods=['GET', 'POST'])
@@ -107,16 +116,15 @@ def edit(post_id):
             post.author = User.objects.get(id=ObjectId(form.author.data))
             post.slug = form.slug.data
             post.markdown_content = form.body.data
+            # Look up the featured image with the others.
+            found = Image.get_by_filenames(form.images.data +
+                                           [form.featured_image.data])
             post.images = [
-                Image.objects().get(filename=fn) for fn in form.images.data
+                found[fn] for fn in form.images.data if fn in found
             ]
 
             post.post_tags = Tag.get_or_create_tags(form.tags.data)
-            if form.featured_image.data:
-                post.featured_image = Image.objects().get(
-                    filename=form.featured_image.data)
-            else:
-                post.featured_image = None
+            post.featured_image = found.get(form.featured_image.data)
             post.save()
 
             if post.published != form.published.data:
@@ -130,6 +138,7 @@ def edit(post_id):
             if form.preview.data is True:
                 return redirect(url_for('blog.preview', slug=post.slug))
 
+    prefetch([post], 'author', 'images', 'featured_image', 'post_tags')
     upload_form = UploadImageForm()
     feat_img = post.featured_image.filename if post.featured_image else None
     form = CreateBlogPostForm(request.form,
@@ -145,13 +154,11 @@ def edit(post_id):
         for u in User.objects()
     ]
     form.author.default = str(g.user.id)
-    images = [image for image in Image.objects() if image not in post.images]
 
     return render_template('eventum_posts/edit.html',
                            user=g.user,
                            form=form,
                            post=post,
-                           images=images,
                            upload_form=upload_form)
 
 
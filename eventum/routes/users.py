@@ -5,9 +5,11 @@
 .. moduleauthor:: Dan Schlosser <dan@schlosser.io>
 """
 
-from eventum.models import User, Whitelist, Image
+from eventum.models import User, Whitelist
 from eventum.forms import AddToWhitelistForm, EditUserForm, UploadImageForm
 from eventum.lib.decorators import login_required, development_only
+from eventum.lib.prefetch import prefetch
+from eventum.lib.user_cache import user_cache
 from eventum.routes.base import MESSAGE_FLASH, ERROR_FLASH
 from apiclient.discovery import build
 from mongoengine import DoesNotExist
@@ -38,8 +40,7 @@ def index():
                            whitelist_form=whitelist_form,
                            upload_form=upload_form,
                            whitelist=Whitelist.objects(redeemed=False),
-                           users=User.objects(),
-                           images=Image.objects(),
+                           users=prefetch(User.objects(), 'image'),
                            current_user=g.user)
 
 
@@ -150,6 +151,8 @@ def become(level=0):
     db_dict = dict((("set__privileges__{}".format(k), v)
                    for k, v in admin_privileges.iteritems()))
     User.objects(gplus_id=session['gplus_id']).update(**db_dict)
+    # Updating the queryset doesn't send signals, so drop the cached user.
+    user_cache.invalidate(session['gplus_id'])
     return redirect(url_for('.index'))
 
 
@@ -223,11 +223,7 @@ $(function() {
     /*When image modal opens, request images*/
     $(document).on('click', 'a[href="#show-modal"][data-modal="image"]', function(e) {
         e.preventDefault();
-        $('#images-ajax-loadpoint').load("/admin/media/image-view?mode=selector", function(response, status){
-            if (status == "error"){
-                $('error-message').text("Sorry, there was an error loading the images.");
-            }
-        });
+        loadImages($('#images-ajax-loadpoint'));
     });
 
     /* =======================================================================
@@ -0,0 +1,56 @@
+/* ===========================================================================
+ * Media library
+ *
+ * Image grids are loaded a page at a time.  Each page ends with a
+ * `.load-more` item that points to the next page, which is loaded when it
+ * scrolls into view.
+ * =========================================================================*/
+
+(function($) {
+
+    /* Load the first page of images into `$loadpoint`, from the URL in its
+     * `data-url` attribute. */
+    window.loadImages = function($loadpoint, callback) {
+        $loadpoint.load($loadpoint.data('url'), function(response, status) {
+            if (status == "error") {
+                $('.error-message').text("Sorry, there was an error loading the images.");
+            }
+            loadMoreImages();
+            if (callback) {
+                callback(response, status);
+            }
+        });
+    };
+
+    /* Load the next page of any grid that has been scrolled to the end. */
+    function loadMoreImages() {
+        $('.image-grid .load-more').each(function() {
+            var $more = $(this),
+                rect = this.getBoundingClientRect();
+
+            // Hidden (in a closed modal), below the fold, or already loading.
+            if (!this.offsetParent || rect.top > $(window).height() + 300 ||
+                    $more.data('loading')) {
+                return;
+            }
+            $more.data('loading', true);
+            $.get($more.data('url'), function(html) {
+                $more.replaceWith(html);
+                $('.image-grid-wrapper').height($('.image-grid').height());
+                loadMoreImages();
+            }).fail(function() {
+                $more.data('loading', false);
+            });
+        });
+    }
+
+    $(function() {
+        // Capture scrolling inside modals and grids, not just the window.
+        document.addEventListener('scroll', loadMoreImages, true);
+        $(window).on('resize', loadMoreImages);
+        $(document).on('click', 'a[href="#show-modal"]', function() {
+            setTimeout(loadMoreImages, 0);
+        });
+    });
+
+})(jQuery);
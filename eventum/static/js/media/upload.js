@@ -37,15 +37,7 @@ $(function() {
             success: function(data, textStatus, jqXHR) {
                 var response = jQuery.parseJSON(jqXHR.responseText);
                 if (response.extension == null && response.filename == null) {
-                    var ajaxPath = "/admin/media/image-view?mode="
-                    var imageGetMode = document.getElementsByClassName("image-grid")[0].className
-                    ajaxPath += imageGetMode.indexOf("editor") !== -1 ? "editor" : "selector"
-
-                    $('#images-ajax-loadpoint').load(ajaxPath, function(response, status) {
-                        if (status == "error") {
-                            $('error-message').text("Sorry, there was an error loading the images.");
-                        }
-                    });
+                    loadImages($('#images-ajax-loadpoint'));
                     $('.error-message').hide();
                 } else {
                     if (response.extension == null)
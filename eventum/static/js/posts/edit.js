@@ -54,6 +54,9 @@ $(function() {
     opts.autogrow.maxHeight = maxHeight;
     var editor = new EpicEditor(opts).load();
 
+    /* Request the images for the modal */
+    loadImages($('#images-ajax-loadpoint'));
+
     /* Populated object of associated images for markdown rendering */
     $('.post-image').each(function() {
         window.markdownImages[$(this).data('filename')] = $(this).data('url');
@@ -35,6 +35,12 @@ $(function() {
      * Fake User Image
      * ==================================================================== */
 
+    /* When the image modal opens, request images */
+    $(document).on('click', 'a[href="#show-modal"][data-modal="image"]', function(e) {
+        e.preventDefault();
+        loadImages($('#images-ajax-loadpoint'));
+    });
+
     $(document).on('click', 'a[href="#set-image"]', function(e) {
         e.preventDefault();
         var filename = $(this).data('filename'),
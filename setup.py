@@ -10,7 +10,7 @@ setup(name='eventum',
       packages=['eventum'],
       include_package_data=True,
       install_requires=[
-          'Flask>=0.10.1',
+          'Flask>=0.12',
           'Flask-Assets>=0.11',
           'Flask-WTF>=0.9.5',
           'Jinja2>=2.7.2',
@@ -32,4 +32,8 @@ setup(name='eventum',
           'requests>=2.3.0',
           'webassets>=0.11.1,<0.12.0'
       ],
+      extras_require={
+          'images': ['Pillow>=2.7.0'],
+          'speedups': ['ujson>=1.33']
+      },
       zip_safe=False)
@@ -11,6 +11,7 @@ def eventum(tmpdir_factory):
         "UPLOAD_FOLDER": str(tmpdir_factory.mktemp("upload")),
         "DELETE_FOLDER": str(tmpdir_factory.mktemp("delete")),
         "GOOGLE_AUTH_ENABLED": False,
+        "RESPONSE_CACHE": "lru",
     }
     app.config["SECRET_KEY"] = "HELLO"
     eventum = Eventum(app)
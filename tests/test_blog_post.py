@@ -0,0 +1,148 @@
+import threading
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from eventum.config import eventum_config
+from eventum.lib import text
+from eventum.models import BlogPost, Image, Tag, User
+
+AUTHOR = User(id=ObjectId(), name="Ada")
+IMAGE = Image(id=ObjectId(), filename="related.png")
+TAGS = [Tag(id=ObjectId(), tagname=name) for name in ("a", "b", "c")]
+
+
+def make_post(slug, tags, day):
+    return BlogPost(id=ObjectId(), title=slug, slug=slug, author=AUTHOR,
+                    posted_by=AUTHOR, markdown_content=slug,
+                    featured_image=IMAGE, post_tags=tags, published=True,
+                    date_published=datetime(2015, 1, day))
+
+
+@pytest.yield_fixture
+def author(eventum):
+    User.objects.insert([User(id=AUTHOR.id, name=AUTHOR.name)],
+                        load_bulk=False)
+    yield AUTHOR
+    User.objects(id=AUTHOR.id).delete()
+
+
+def test_related_posts(author):
+    a, b, c = TAGS
+    post = make_post("post", [a, b], 1)
+    posts = {
+        "two": make_post("two", [a, b, c], 2),
+        "two-newer": make_post("two-newer", [b, a], 3),
+        "one": make_post("one", [a], 4),
+        "one-newer": make_post("one-newer", [b, c], 5),
+        "none": make_post("none", [c], 6),
+    }
+    BlogPost.objects.insert([post] + list(posts.values()), load_bulk=False)
+    try:
+        related = [p.slug for p in post.get_related_posts()]
+        # The most tags in common first, then the most recently published.
+        assert related == ["two-newer", "two", "one-newer", "one"]
+        assert [p.slug for p in post.get_related_posts(limit=3)] == \
+            related[:3]
+
+        # The IDs are cached until a blog post is saved.
+        BlogPost.objects(id=posts["none"].id).update_one(
+            set__post_tags=[a, b])
+        assert [p.slug for p in post.get_related_posts()] == related
+
+        none = BlogPost.objects.get(id=posts["none"].id)
+        none.save()
+        assert [p.slug for p in post.get_related_posts()] == \
+            ["none", "two-newer", "two", "one-newer", "one"]
+    finally:
+        BlogPost.objects(id__in=[post.id] + [p.id for p in
+                                             posts.values()]).delete()
+
+
+def default_snippet_keys():
+    return set(text.snippet_key(**options)
+               for options in eventum_config.EVENTUM_POST_SNIPPETS)
+
+
+def test_clean_renders_changed_markdown(eventum):
+    post = make_post("clean", [], 1)
+    post.markdown_content = "Hello *world*"
+    post.clean()
+    assert post.html_content == "<p>Hello <em>world</em></p>"
+    assert set(post.snippets) == default_snippet_keys()
+
+    # Unchanged markdown isn't rendered again.
+    post.html_content = "<p>Kept</p>"
+    post.clean()
+    assert post.html_content == "<p>Kept</p>"
+
+    post.markdown_content = "Changed"
+    post.clean()
+    assert post.html_content == "<p>Changed</p>"
+
+
+def test_clean_outside_app_context():
+    post = make_post("no-app", [], 1)
+    errors = []
+
+    def clean():
+        try:
+            post.clean()
+        except Exception as e:
+            errors.append(e)
+
+    # App contexts aren't shared with other threads.
+    thread = threading.Thread(target=clean)
+    thread.start()
+    thread.join()
+    assert errors == []
+    assert set(post.snippets) == default_snippet_keys()
+
+
+def test_render_snippets_keeps_stored_snippets(eventum):
+    key = text.snippet_key(length=40, newlines=False, tags=False)
+    post = make_post("snippets", [], 1)
+    post.html_content = "<p>One two three</p>"
+    post.snippets = {key: "Stored"}
+    post.render_snippets()
+    assert post.snippets[key] == "Stored"
+    assert post.snippets[text.snippet_key()] == \
+        text.snippet(post.html_content)
+
+
+def test_snippet_is_stored(eventum):
+    html = "<p>One two three</p>"
+    post = make_post("stored", [], 1)
+    post.markdown_content = "One two three"
+    post.clean()
+    BlogPost.objects.insert([post], load_bulk=False)
+    try:
+        listed = BlogPost.objects(id=post.id).exclude(
+            "html_content", "markdown_content").first()
+        assert listed.snippet(length=40, newlines=False, tags=False) == \
+            text.snippet(html, length=40, newlines=False, tags=False)
+
+        # Other snippets are made from the content that was loaded, without
+        # going back to Mongo.
+        assert listed.snippet(length=2) == ""
+        loaded = BlogPost.objects(id=post.id).first()
+        assert loaded.snippet(length=2) == text.snippet(html, length=2)
+        stored = BlogPost.objects(id=post.id).scalar("snippets").first()
+        assert text.snippet_key(length=2) not in stored
+    finally:
+        BlogPost.objects(id=post.id).delete()
+
+
+def test_status_of_listed_posts(author):
+    post = make_post("listed", [], 1)
+    post.published = False
+    post.clean()
+    BlogPost.objects.insert([post], load_bulk=False)
+    try:
+        listed = BlogPost.objects(id=post.id).exclude(
+            "html_content", "markdown_content").first()
+        assert listed.html_content is None
+        assert listed.status() == "complete"
+    finally:
+        BlogPost.objects(id=post.id).delete()
@@ -1,6 +1,7 @@
 import datetime as dt
 
 import pytest
+from mongoengine import ValidationError
 
 from eventum.models import Event
 
@@ -124,3 +125,33 @@ def test_event_starting_on_midnight():
     assert not event.is_multiday()
     assert event.human_readable_date() == "Wednesday, April 1"
     assert event.human_readable_time() == "12-5:30am"
+
+
+def test_validate_dates():
+    """Events must not end before they start."""
+    event = Event(start_date=dt.date(2015, 4, 2),
+                  start_time=dt.time(12),
+                  end_date=dt.date(2015, 4, 1),
+                  end_time=dt.time(13))
+
+    with pytest.raises(ValidationError):
+        event.validate_dates()
+
+    event.end_date = dt.date(2015, 4, 2)
+    event.validate_dates()
+
+
+def test_render_markdown():
+    """Rendering markdown fills in the HTML descriptions."""
+    event = Event(short_description_markdown='*Short*',
+                  long_description_markdown='**Long**')
+    event.render_markdown()
+
+    assert event.short_description == '<p><em>Short</em></p>'
+    assert event.long_description == '<p><strong>Long</strong></p>'
+
+
+def test_index_uses_occurrence():
+    """Recurring events know their index without loading their series."""
+    assert Event(is_recurring=True, occurrence=3).index == 3
+    assert Event(is_recurring=False, occurrence=3).index is None
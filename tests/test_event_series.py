@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+
+import pytest
+from bson import ObjectId
+from mongoengine.queryset import QuerySet
+
+from eventum.models import Event, EventSeries, User
+
+CREATOR = User(id=ObjectId(), name="Ada")
+
+
+def make_series(slug, occurrences):
+    series = EventSeries(slug=slug, every=1, num_occurrences=occurrences)
+    series.save()
+    series.events = [
+        Event(id=ObjectId(), title="%s %d" % (slug, i), slug=slug,
+              creator=CREATOR, is_recurring=True, parent_series=series,
+              occurrence=i, start_date=date(2015, 4, 1) + timedelta(weeks=i))
+        for i in range(occurrences)
+    ]
+    Event.objects.insert(series.events, load_bulk=False)
+    series.save()
+    return series
+
+
+@pytest.yield_fixture
+def two_series(eventum):
+    series = [make_series("first", 3), make_series("second", 2)]
+    yield series
+    for s in series:
+        Event.objects(parent_series=s).delete()
+        EventSeries.objects(id=s.id).delete()
+
+
+@pytest.yield_fixture
+def event_deletes(monkeypatch):
+    """Counts the queries that delete events, and fails if events are
+    deleted one at a time.
+    """
+    deletes = []
+    delete = QuerySet.delete
+
+    def counting_delete(self, *args, **kwargs):
+        if self._document is Event:
+            deletes.append(self._query)
+        return delete(self, *args, **kwargs)
+
+    def fail(self, *args, **kwargs):
+        raise AssertionError("Deleted an event on its own")
+
+    monkeypatch.setattr(QuerySet, "delete", counting_delete)
+    monkeypatch.setattr(Event, "delete", fail)
+    yield deletes
+
+
+def titles(series):
+    return sorted(Event.objects(parent_series=series).scalar("title"))
+
+
+def test_delete_all(two_series, event_deletes):
+    first, second = two_series
+    first.delete_all()
+
+    assert len(event_deletes) == 1
+    assert titles(first) == []
+    assert EventSeries.objects(id=first.id).first() is None
+    assert titles(second) == ["second 0", "second 1"]
+
+
+def test_delete_all_except(two_series, event_deletes):
+    first, second = two_series
+    kept = first.events[1]
+    first.delete_all_except(kept)
+
+    assert len(event_deletes) == 1
+    assert titles(first) == ["first 1"]
+    assert kept.parent_series is None
+    assert EventSeries.objects(id=first.id).first() is None
+    assert titles(second) == ["second 0", "second 1"]
+
+
+def test_delete_one_renumbers_later_occurrences(two_series):
+    first, second = two_series
+    first.delete_one(first.events[1])
+
+    assert Event.get_occurrence("first", 0).title == "first 0"
+    assert Event.get_occurrence("first", 1).title == "first 2"
+    assert Event.get_occurrence("first", 2) is None
+    assert len(EventSeries.objects.get(id=first.id).events) == 2
+    # Other series keep their numbers.
+    assert Event.get_occurrence("second", 1).title == "second 1"
@@ -0,0 +1,81 @@
+from datetime import date, time, timedelta
+
+import pytest
+from bson import ObjectId
+from mongoengine import ValidationError
+
+from eventum.lib.events import EventsHelper
+from eventum.models import Event, EventSeries, User
+
+CREATOR = User(id=ObjectId(), name="Ada")
+
+
+class Field(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class EventForm(object):
+    """Just enough of an :class:`~app.forms.EditEventForm` for
+    :class:`DataBuilder`.
+    """
+
+    def __init__(self, **data):
+        fields = dict(title="Single", slug="single", location=None,
+                      start_time=time(10, 0), end_time=time(11, 0),
+                      published=False, short_description=None,
+                      long_description=None, is_recurring=False,
+                      facebook_url=None, event_image=None,
+                      start_date=date(2015, 4, 8), end_date=date(2015, 4, 8))
+        fields.update(data)
+        for name, value in fields.items():
+            setattr(self, name, Field(value))
+
+
+@pytest.yield_fixture
+def series(eventum):
+    series = EventSeries(slug="series", every=1, num_occurrences=3)
+    series.save()
+    series.events = [
+        Event(id=ObjectId(), title="Weekly", slug="series", creator=CREATOR,
+              is_recurring=True, parent_series=series, occurrence=i,
+              start_date=date(2015, 4, 1) + timedelta(weeks=i))
+        for i in range(3)
+    ]
+    Event.objects.insert(series.events, load_bulk=False)
+    series.save()
+    yield series
+    Event.objects(parent_series=series).delete()
+    series.delete()
+
+
+def test_update_series_events(series):
+    event = series.events[0]
+    EventsHelper._update_series_events(series, event, {"title": "Renamed"})
+    assert event.title == "Renamed"
+    assert set(Event.objects(parent_series=series).scalar("title")) == \
+        {"Renamed"}
+
+
+def test_update_series_events_validates(series):
+    """The data is validated before the multi-document update, which skips
+    validation.
+    """
+    with pytest.raises(ValidationError):
+        EventsHelper._update_series_events(series, series.events[0],
+                                           {"title": "x" * 256})
+    assert set(Event.objects(parent_series=series).scalar("title")) == \
+        {"Weekly"}
+
+
+def test_convert_to_single_event(series):
+    event = Event.objects.get(id=series.events[1].id)
+    EventsHelper.convert_to_single_event(event, EventForm())
+
+    converted = Event.objects.get(id=event.id)
+    assert converted.occurrence is None
+    assert converted.parent_series is None
+    assert converted.title == "Single"
+    assert not converted.is_recurring
+    assert Event.objects(parent_series=series).count() == 0
+    assert EventSeries.objects(id=series.id).first() is None
@@ -0,0 +1,113 @@
+import os
+import time
+
+import pytest
+from flask import Flask
+
+from eventum.lib.file_maintenance import FileMaintenance
+
+
+@pytest.yield_fixture(scope="function")
+def maintenance(tmpdir):
+    app = Flask("testing")
+    app.config.update(
+        EVENTUM_UPLOAD_FOLDER=str(tmpdir.mkdir("upload")),
+        EVENTUM_DELETE_FOLDER=str(tmpdir.join("delete")),
+        EVENTUM_FILE_MAINTENANCE_WORKER=False,
+        EVENTUM_FILE_MAINTENANCE_MAX_ATTEMPTS=2,
+        EVENTUM_FILE_MAINTENANCE_BACKOFF=0,
+        EVENTUM_FILE_MAINTENANCE_MAX_BACKOFF=0,
+        EVENTUM_FILE_MAINTENANCE_SWEEP_INTERVAL=3600,
+        EVENTUM_DELETE_RETENTION_DAYS=30,
+    )
+    yield FileMaintenance(app)
+
+
+def touch(path, data=b"cat", age=0):
+    with open(path, "wb") as f:
+        f.write(data)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+def test_delete_files(maintenance):
+    upload_folder = maintenance.app.config["EVENTUM_UPLOAD_FOLDER"]
+    delete_folder = maintenance.app.config["EVENTUM_DELETE_FOLDER"]
+    path = os.path.join(upload_folder, "cat.png")
+    touch(path, age=60 * 24 * 60 * 60)
+
+    maintenance.delete_files([path, os.path.join(upload_folder, "gone.png")])
+    assert os.listdir(upload_folder) == []
+    assert sorted(os.listdir(delete_folder)) == [".cat.png.deleted-at",
+                                                 "cat.png"]
+    assert maintenance.stats()["moved"] == 2
+
+    # The retention period starts when the file is deleted.
+    assert maintenance.purge_deleted() == (0, 0)
+
+
+def test_failed_moves_are_retried(maintenance):
+    maintenance.app.config["EVENTUM_FILE_MAINTENANCE_WORKER"] = True
+    upload_folder = maintenance.app.config["EVENTUM_UPLOAD_FOLDER"]
+    path = os.path.join(upload_folder, "cat.png")
+    touch(path)
+    # The delete folder can't be created where a file already is.
+    touch(maintenance.app.config["EVENTUM_DELETE_FOLDER"])
+
+    maintenance.ensure_worker = lambda: None
+    maintenance._last_sweep = time.time()
+    maintenance.delete_files([path])
+    maintenance.run_once()
+    assert maintenance.stats()["retried"] == 1
+    maintenance.run_once()
+    assert maintenance.stats()["failed"] == 1
+    assert maintenance.stats()["pending"] == 0
+    assert os.path.exists(path)
+
+
+def test_purge_deleted(maintenance):
+    upload_folder = maintenance.app.config["EVENTUM_UPLOAD_FOLDER"]
+    delete_folder = maintenance.app.config["EVENTUM_DELETE_FOLDER"]
+    os.mkdir(delete_folder)
+    touch(os.path.join(delete_folder, "old.png"), b"12345",
+          age=31 * 24 * 60 * 60)
+    touch(os.path.join(delete_folder, "new.png"), b"12345")
+    touch(os.path.join(upload_folder, "shared.png"), b"12345",
+          age=31 * 24 * 60 * 60)
+    os.link(os.path.join(upload_folder, "shared.png"),
+            os.path.join(delete_folder, "shared.png"))
+
+    # Hard linked files don't free any space.
+    assert maintenance.purge_deleted() == (2, 5)
+    assert os.listdir(delete_folder) == ["new.png"]
+
+
+def test_deleting_a_shared_file_keeps_its_mtime(maintenance):
+    """A deleted file may be hard linked to an upload that is still used, so
+    the deletion time is recorded without touching the file.
+    """
+    upload_folder = maintenance.app.config["EVENTUM_UPLOAD_FOLDER"]
+    delete_folder = maintenance.app.config["EVENTUM_DELETE_FOLDER"]
+    live = os.path.join(upload_folder, "live.png")
+    deleted = os.path.join(upload_folder, "deleted.png")
+    touch(live, age=31 * 24 * 60 * 60)
+    os.link(live, deleted)
+    mtime = os.stat(live).st_mtime
+
+    maintenance.delete_files([deleted])
+    assert os.stat(live).st_mtime == mtime
+
+    # The retention period starts when the file is deleted.
+    assert maintenance.purge_deleted() == (0, 0)
+    assert "deleted.png" in os.listdir(delete_folder)
+
+
+def test_sweeps_are_opt_in(maintenance):
+    maintenance.app.config.update(EVENTUM_ORPHAN_GRACE_PERIOD=None,
+                                  EVENTUM_DELETE_RETENTION_DAYS=None)
+    upload_folder = maintenance.app.config["EVENTUM_UPLOAD_FOLDER"]
+    touch(os.path.join(upload_folder, "orphan.png"), age=60 * 24 * 60 * 60)
+
+    assert maintenance.sweep() == {"orphans": 0, "purged": 0,
+                                   "reclaimed_bytes": 0}
+    assert os.listdir(upload_folder) == ["orphan.png"]
@@ -0,0 +1,35 @@
+import hashlib
+import os
+
+from eventum.lib import fingerprints
+
+
+def test_fingerprints_match_the_same_file(tmpdir):
+    path = str(tmpdir.join("a.png"))
+    tmpdir.join("a.png").write("a")
+    assert not fingerprints.matches(path, "abc", os.stat(path))
+
+    fingerprints.remember(path, "abc")
+    assert fingerprints.matches(path, "abc", os.stat(path))
+    assert not fingerprints.matches(path, "abd", os.stat(path))
+    assert not fingerprints.matches(path, None, os.stat(path))
+
+    # Replacing the file makes a new inode.
+    tmpdir.join("b.png").write("b")
+    os.rename(str(tmpdir.join("b.png")), path)
+    assert not fingerprints.matches(path, "abc", os.stat(path))
+
+    fingerprints.remember(path, "abc")
+    assert fingerprints.matches(path, "abc", os.stat(path))
+
+
+def test_fingerprint_of_file(tmpdir):
+    path = str(tmpdir.join("app.css"))
+    tmpdir.join("app.css").write("a")
+    fingerprint = fingerprints.of_file(path)
+    assert fingerprint == hashlib.sha256(b"a").hexdigest()[:12]
+    assert fingerprints.of_file(path) == fingerprint
+
+    tmpdir.join("app.css").write("bb")
+    assert fingerprints.of_file(path) == hashlib.sha256(b"bb").hexdigest()[:12]
+    assert fingerprints.of_file(str(tmpdir.join("missing.css"))) is None
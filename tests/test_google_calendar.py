@@ -0,0 +1,207 @@
+import os
+import threading
+from datetime import date, time
+
+import pytest
+from bson import ObjectId
+
+from eventum import Eventum
+from eventum.lib import google_calendar
+from eventum.lib.google_calendar_resource_builder import (
+    GoogleCalendarResourceBuilder)
+from eventum.models import Event, EventSeries
+
+START = time(10, 0)
+DATES = [date(2015, 1, 5), date(2015, 1, 12), date(2015, 1, 19)]
+
+
+def rfc3339(day):
+    return GoogleCalendarResourceBuilder.rfc3339(
+        Event(start_date=day, start_time=START).start_datetime)
+
+
+@pytest.yield_fixture(scope="function")
+def client(eventum):
+    client = Eventum.gcal_client()
+    client.before_request()
+    client.indexed = 0
+
+    def index_instances(series, calendar_id):
+        client.indexed += 1
+        series.set_instance_index({})
+
+    client._index_instances = index_instances
+    yield client
+    del client._index_instances
+
+
+@pytest.yield_fixture(scope="function")
+def series(eventum):
+    series = EventSeries(slug='weekly', gcal_id='g', gcal_sequence=1,
+                         gcal_instances_id='g', gcal_instances_sequence=1)
+    series.gcal_instances = dict((rfc3339(day), 'g_%d' % i)
+                                 for i, day in enumerate(DATES))
+    series.save()
+    events = [Event(id=ObjectId(), title='Weekly', slug='weekly',
+                    is_recurring=True, parent_series=series, start_date=day,
+                    start_time=START, gcal_id='g', gcal_sequence=1)
+              for day in DATES]
+    Event.objects.insert(events, load_bulk=False)
+    yield series, events
+    Event.objects(parent_series=series).delete()
+    series.delete()
+
+
+def test_index_is_kept_when_no_events_move(client, series):
+    """Updating the details of a series should not page through its
+    instances again.
+    """
+    series, events = series
+    index = dict(series.gcal_instances)
+    client._update_event_from_response(events[0], {'id': 'g', 'sequence': 2})
+
+    series.reload()
+    assert client.indexed == 0
+    assert series.gcal_instances == index
+    assert series.instance_index_is_current()
+
+
+def test_index_is_rebuilt_when_events_move(client, series):
+    series, events = series
+    moved = date(2015, 2, 2)
+    Event.objects(id=events[-1].id).update_one(set__start_date=moved)
+    client._update_event_from_response(events[0], {'id': 'g', 'sequence': 2})
+    assert client.indexed == 1
+
+
+def test_index_is_rebuilt_for_a_new_series_id(client, series):
+    series, events = series
+    client._update_event_from_response(events[0], {'id': 'h', 'sequence': 0})
+    assert client.indexed == 1
+
+
+def test_instance_lookup_uses_the_index(client, series):
+    """A current index should be used without asking Google for it."""
+    series, events = series
+    fetched = []
+    client._get_instance = lambda calendar_id, instance_id: (
+        fetched.append(instance_id) or {'id': instance_id})
+    try:
+        instance = client._instance_resource_for_event_in_series(events[1])
+    finally:
+        del client._get_instance
+
+    assert instance == {'id': 'g_1'}
+    assert fetched == ['g_1']
+    assert client.indexed == 0
+
+
+class FakeCredentials(object):
+    invalid = False
+
+    def __init__(self, expired):
+        self.access_token_expired = expired
+
+    def authorize(self, http):
+        return http
+
+    def refresh(self, http):
+        self.access_token_expired = False
+
+
+class FakeGoogle(object):
+    """Stands in for the credentials file and Google's servers, counting how
+    often each is used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.expired = False
+        self.discovery_requests = 0
+        self.cache = google_calendar.GoogleCalendarServiceCache()
+
+    def storage(self, path):
+        assert path == self.path
+        fake = self
+
+        class Storage(object):
+            def get(self):
+                return FakeCredentials(fake.expired)
+        return Storage()
+
+    def http(self):
+        fake = self
+
+        class Response(object):
+            status = 200
+
+        class Http(object):
+            def request(self, uri):
+                fake.discovery_requests += 1
+                return Response(), "{}"
+        return Http()
+
+
+@pytest.yield_fixture(scope="function")
+def google(tmpdir, monkeypatch):
+    path = tmpdir.join("credentials.json")
+    path.write("{}")
+    google = FakeGoogle(str(path))
+    monkeypatch.setattr(google_calendar, "Storage", google.storage)
+    monkeypatch.setattr(google_calendar.httplib2, "Http", google.http)
+    monkeypatch.setattr(google_calendar, "build_from_document",
+                        lambda document, http: object())
+    yield google
+
+
+def test_service_is_reused_per_thread(google):
+    cache = google.cache
+    service = cache.get(google.path)
+    assert cache.get(google.path) is service
+
+    services = []
+    thread = threading.Thread(
+        target=lambda: services.extend([cache.get(google.path),
+                                        cache.get(google.path)]))
+    thread.start()
+    thread.join()
+    # Other threads get their own service, since connections aren't shared.
+    assert services[0] is services[1]
+    assert services[0] is not service
+
+    assert google.discovery_requests == 1
+    assert cache.stats() == {"hits": 2, "rebuilds": 2,
+                             "credential_loads": 1, "refreshes": 0}
+
+
+def test_credentials_are_reloaded_when_the_file_changes(google):
+    cache = google.cache
+    service = cache.get(google.path)
+    mtime = os.path.getmtime(google.path)
+    os.utime(google.path, (mtime + 10, mtime + 10))
+
+    assert cache.get(google.path) is not service
+    assert cache.stats()["credential_loads"] == 2
+    assert cache.stats()["rebuilds"] == 2
+    assert google.discovery_requests == 1
+
+
+def test_expired_credentials_are_refreshed(google):
+    google.expired = True
+    cache = google.cache
+    service = cache.get(google.path)
+
+    # The refreshed credentials are used without reading the file again.
+    assert cache.get(google.path) is service
+    assert cache.stats() == {"hits": 1, "rebuilds": 1,
+                             "credential_loads": 1, "refreshes": 1}
+
+
+def test_invalidate_rebuilds_the_service(google):
+    cache = google.cache
+    service = cache.get(google.path)
+    cache.invalidate()
+
+    assert cache.get(google.path) is not service
+    assert cache.stats()["credential_loads"] == 2
+    assert google.discovery_requests == 1
@@ -0,0 +1,172 @@
+import json
+import re
+
+import httplib2
+import pytest
+from apiclient.http import HttpRequest
+from apiclient.model import JsonModel
+
+from eventum.lib.error import EventumError
+from eventum.lib.google_calendar_batch import GoogleCalendarBatch
+
+BATCH_URI = 'https://www.googleapis.com/batch/calendar/v3'
+EVENTS_URI = 'https://www.googleapis.com/calendar/v3/calendars/cal/events/'
+
+
+class FakeBatchEndpoint(object):
+    """A local stand-in for the Google Calendar batch endpoint.  It takes the
+    place of an :class:`httplib2.Http`, answering each request inside a
+    ``multipart/mixed`` batch with ``handler(method, path)``, and counting
+    round trips.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.round_trips = 0
+        self.batch_sizes = []
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        self.round_trips += 1
+        if uri != BATCH_URI:
+            status, payload = self.handler(method, uri)
+            return (httplib2.Response({'status': status}),
+                    json.dumps(payload).encode('utf-8'))
+
+        content_type = headers['content-type']
+        boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1)
+        parts = [p for p in body.split('--' + boundary)
+                 if p.strip() and p.strip() != '--']
+        self.batch_sizes.append(len(parts))
+
+        out = []
+        for part in parts:
+            content_id = re.search(r'Content-ID: <(.*)>', part).group(1)
+            method, path = re.search(r'\n(GET|POST|PUT|DELETE) (\S+) HTTP',
+                                     part).groups()
+            status, payload = self.handler(method, path)
+            out.append(
+                '--BOUNDARY\r\n'
+                'Content-Type: application/http\r\n'
+                'Content-ID: <response-{}>\r\n\r\n'
+                'HTTP/1.1 {} OK\r\n'
+                'Content-Type: application/json\r\n\r\n'
+                '{}\r\n'.format(content_id, status, json.dumps(payload)))
+        out.append('--BOUNDARY--')
+
+        response = httplib2.Response({
+            'status': 200,
+            'content-type': 'multipart/mixed; boundary="BOUNDARY"'})
+        return response, ''.join(out).encode('utf-8')
+
+
+# Event IDs that fail, with the status and reason Google would answer with.
+FAILURES = {
+    'missing': (404, 'notFound'),
+    'gone': (410, 'deleted'),
+    'invalid': (400, 'invalid'),
+    'forbidden': (403, 'forbidden'),
+    'limited': (403, 'rateLimitExceeded'),
+    'throttled': (429, 'rateLimitExceeded'),
+    'conflict': (409, 'duplicate'),
+    'broken': (503, 'backendError'),
+}
+
+
+def events_handler(method, path):
+    """Succeed for every event except those in ``FAILURES``."""
+    event_id = path.rstrip('/').split('/')[-1]
+    if event_id in FAILURES:
+        status, reason = FAILURES[event_id]
+        return status, {'error': {'code': status, 'message': reason,
+                                  'errors': [{'reason': reason}]}}
+    return 200, {'id': event_id, 'method': method}
+
+
+def make_request(http, event_id, method='PUT'):
+    return HttpRequest(http, JsonModel().response, EVENTS_URI + event_id,
+                       method=method, body='{}',
+                       headers={'content-type': 'application/json'})
+
+
+@pytest.fixture
+def endpoint(eventum):
+    eventum.app.logger.disabled = True
+    return FakeBatchEndpoint(events_handler)
+
+
+def test_batch_is_one_round_trip(endpoint):
+    """Several calls in a batch should cost one HTTP request, and each
+    response should be mapped back to the call that made it.
+    """
+    batch = GoogleCalendarBatch(batch_uri=BATCH_URI)
+    items = [batch.add(make_request(endpoint, event_id))
+             for event_id in ('a', 'b', 'c')]
+    batch.execute()
+
+    assert endpoint.round_trips == 1
+    assert [item.result['id'] for item in items] == ['a', 'b', 'c']
+
+
+def test_batch_maps_errors_per_item(endpoint):
+    """A failed call should get its own error without failing the others."""
+    batch = GoogleCalendarBatch(batch_uri=BATCH_URI)
+    found = batch.add(make_request(endpoint, 'found'))
+    missing = batch.add(make_request(endpoint, 'missing', method='DELETE'))
+
+    with pytest.raises(EventumError.GCalAPI.NotFound):
+        batch.execute()
+
+    assert endpoint.round_trips == 1
+    assert found.error is None and found.result['id'] == 'found'
+    assert isinstance(missing.error, EventumError.GCalAPI.NotFound)
+
+
+def test_batch_runs_not_found_fallback(endpoint):
+    """``on_not_found`` should be run for a call that 404s, and its result
+    should become the call's result.
+    """
+    batch = GoogleCalendarBatch(batch_uri=BATCH_URI)
+    other = batch.add(make_request(endpoint, 'other'))
+    missing = batch.add(make_request(endpoint, 'missing'),
+                        on_not_found=lambda e: 'fell back')
+    items = batch.execute(raise_errors=False)
+
+    assert items == [other, missing]
+    assert missing.result == 'fell back'
+    assert missing.error is None
+
+
+def test_batch_splits_large_batches(endpoint):
+    """Batches larger than ``MAX_BATCH_SIZE`` are split into as few HTTP
+    requests as possible.
+    """
+    size = GoogleCalendarBatch.MAX_BATCH_SIZE
+    batch = GoogleCalendarBatch(batch_uri=BATCH_URI)
+    for i in range(size + 1):
+        batch.add(make_request(endpoint, str(i)))
+    batch.execute()
+
+    assert batch.round_trips == 2
+    assert endpoint.round_trips == 2
+    assert endpoint.batch_sizes == [size]
+
+
+@pytest.mark.parametrize(['event_id', 'error'], [
+    ('missing', EventumError.GCalAPI.NotFound),
+    ('gone', EventumError.GCalAPI.NotFound),
+    ('invalid', EventumError.GCalAPI.HttpError.BadRequest),
+    ('forbidden', EventumError.GCalAPI.HttpError.Forbidden),
+    ('limited', EventumError.GCalAPI.HttpError.RateLimited),
+    ('throttled', EventumError.GCalAPI.HttpError.RateLimited),
+    ('conflict', EventumError.GCalAPI.HttpError.Conflict),
+    ('broken', EventumError.GCalAPI.HttpError.ServerError),
+])
+def test_batch_maps_errors_by_status(endpoint, event_id, error):
+    """Each failed call should get the error for its own HTTP status."""
+    batch = GoogleCalendarBatch(batch_uri=BATCH_URI)
+    found = batch.add(make_request(endpoint, 'found'))
+    failed = batch.add(make_request(endpoint, event_id))
+    batch.execute(raise_errors=False)
+
+    assert found.error is None
+    assert type(failed.error) is error
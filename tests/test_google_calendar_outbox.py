@@ -0,0 +1,199 @@
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from flask import Flask
+
+from eventum.lib.error import EventumError
+from eventum.lib.google_calendar_outbox import (GoogleCalendarOutbox,
+                                                plan_operations)
+from eventum.models import CalendarOperation, Event
+
+Op = namedtuple('Op', ['operation', 'target', 'event_id', 'as_exception',
+                       'next_attempt'])
+
+NOW = datetime(2015, 1, 1, 12, 0, 0)
+PAST = NOW - timedelta(minutes=1)
+FUTURE = NOW + timedelta(minutes=1)
+
+
+def op(operation, target, event_id=None, as_exception=False, at=PAST):
+    return Op(operation, target, event_id or target, as_exception, at)
+
+
+def test_one_operation_per_target():
+    """Only the oldest operation for each target should run."""
+    create_a = op('create', 'a')
+    delete_a = op('delete', 'a')
+    create_b = op('create', 'b')
+
+    runs = plan_operations([create_a, delete_a, create_b], set(), NOW)
+    assert runs == [[create_a], [create_b]]
+
+
+def test_consecutive_updates_are_coalesced():
+    """Updates that follow an update to the same target should be sent as
+    one, but not past an operation of a different kind.
+    """
+    first = op('update', 'a')
+    second = op('update', 'a')
+    publish = op('publish', 'a')
+    third = op('update', 'a')
+
+    runs = plan_operations([first, second, publish, third], set(), NOW)
+    assert runs == [[first, second]]
+
+
+def test_exception_updates_coalesce_per_event():
+    """Updates to single events in a series only coalesce with updates to the
+    same event.
+    """
+    first = op('update', 'series', event_id='x', as_exception=True)
+    same = op('update', 'series', event_id='x', as_exception=True)
+    other = op('update', 'series', event_id='y', as_exception=True)
+
+    runs = plan_operations([first, same, other], set(), NOW)
+    assert runs == [[first, same]]
+
+
+def test_busy_and_backed_off_targets_wait():
+    """Targets with a running operation, or whose oldest operation is waiting
+    to be retried, should be skipped entirely.
+    """
+    busy = op('update', 'busy')
+    retrying = op('update', 'retrying', at=FUTURE)
+    after_retry = op('delete', 'retrying')
+    ready = op('create', 'ready')
+
+    runs = plan_operations([busy, retrying, after_retry, ready],
+                           set(['busy']), NOW)
+    assert runs == [[ready]]
+
+
+class FakeClient(object):
+    """Stands in for the Google Calendar client.  The outbox's dispatch is
+    replaced in each test, so only the batch is needed.
+    """
+
+    @contextmanager
+    def batch(self, raise_errors=True):
+        yield
+
+
+@pytest.yield_fixture(scope="function")
+def outbox(eventum):
+    app = Flask("testing")
+    app.config.update(eventum.app.config)
+    app.config.update(
+        EVENTUM_GOOGLE_AUTH_ENABLED=True,
+        EVENTUM_GCAL_OUTBOX_ENABLED=True,
+        EVENTUM_GCAL_OUTBOX_WORKER=False,
+        EVENTUM_GCAL_OUTBOX_MAX_ATTEMPTS=2,
+        EVENTUM_GCAL_OUTBOX_BACKOFF=0,
+        EVENTUM_GCAL_OUTBOX_MAX_BACKOFF=0,
+    )
+    eventum.app.logger.disabled = True
+    CalendarOperation.objects.delete()
+    yield GoogleCalendarOutbox(app, FakeClient())
+    CalendarOperation.objects.delete()
+
+
+def queue(operation, target, **kwargs):
+    queued = CalendarOperation(operation=operation, event_id=ObjectId(),
+                               target=target, **kwargs)
+    queued.save()
+    return queued
+
+
+def test_enqueue_reuses_pending_update(outbox):
+    """An update should reuse the identical update queued before it, but not
+    one that follows a different operation.
+    """
+    event = Event(id=ObjectId())
+    first = outbox.update_event(event)
+    second = outbox.update_event(event)
+    assert first.id == second.id
+
+    outbox.publish_event(event)
+    third = outbox.update_event(event)
+    assert third.id != first.id
+    assert CalendarOperation.objects(target=str(event.id)).count() == 3
+
+
+def test_claim_is_exclusive(outbox):
+    """Only one worker should be able to claim an operation."""
+    queued = queue('create', 'a')
+    assert outbox._claim(queued, NOW)
+    assert not outbox._claim(CalendarOperation.objects.get(id=queued.id),
+                             NOW)
+
+
+def test_run_once_finishes_and_coalesces(outbox):
+    """Consecutive updates should be sent once, and every operation in the
+    run should be finished.
+    """
+    first = queue('update', 'a')
+    second = queue('update', 'a')
+    other = queue('create', 'b')
+    sent = []
+
+    def dispatch(operation):
+        sent.append(operation.id)
+        return {'id': 'gcal'}
+
+    outbox._dispatch = dispatch
+    assert outbox.run_once() == 3
+    assert sorted(sent) == sorted([second.id, other.id])
+
+    first, second, other = [CalendarOperation.objects.get(id=o.id)
+                            for o in (first, second, other)]
+    assert all(o.status == CalendarOperation.DONE
+               for o in (first, second, other))
+    assert first.coalesced and not second.coalesced
+
+
+def test_failed_operations_are_retried_then_given_up(outbox):
+    """Failures should be retried until ``MAX_ATTEMPTS``, but bad requests
+    should not be retried at all.
+    """
+    flaky = queue('update', 'a')
+    invalid = queue('update', 'b')
+
+    def dispatch(operation):
+        if operation.id == flaky.id:
+            raise EventumError.GCalAPI.HttpError.ServerError()
+        raise EventumError.GCalAPI.HttpError.BadRequest()
+
+    outbox._dispatch = dispatch
+    outbox.run_once()
+    assert (CalendarOperation.objects.get(id=flaky.id).status ==
+            CalendarOperation.PENDING)
+    assert (CalendarOperation.objects.get(id=invalid.id).status ==
+            CalendarOperation.FAILED)
+
+    outbox.run_once()
+    flaky = CalendarOperation.objects.get(id=flaky.id)
+    assert flaky.status == CalendarOperation.FAILED
+    assert flaky.attempts == 2
+
+
+def test_latency_is_per_operation(outbox):
+    """Each operation should record its own latency, not the batch's."""
+    slow = queue('create', 'slow')
+    fast = queue('create', 'fast')
+
+    def dispatch(operation):
+        if operation.id == slow.id:
+            time.sleep(0.05)
+        return {}
+
+    outbox._dispatch = dispatch
+    outbox.run_once()
+
+    slow = CalendarOperation.objects.get(id=slow.id)
+    fast = CalendarOperation.objects.get(id=fast.id)
+    assert slow.latency >= 0.05 > fast.latency
+    assert outbox.stats()['operations']['create']['count'] == 2
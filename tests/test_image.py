@@ -0,0 +1,63 @@
+import pytest
+from bson import ObjectId
+
+from eventum.models import BlogPost, Image, User
+
+CREATOR = User(id=ObjectId(), name="Ada")
+FILENAMES = ["cat.png", "dog.png", "owl.png"]
+
+
+@pytest.yield_fixture
+def images(eventum):
+    images = [Image(id=ObjectId(), filename=filename, creator=CREATOR,
+                    default_path="/tmp/" + filename)
+              for filename in FILENAMES]
+    Image.objects.insert(images, load_bulk=False)
+    yield images
+    # Without the signal that moves the images' files away.
+    Image._get_collection().delete_many(
+        {"_id": {"$in": [image.id for image in images]}})
+
+
+@pytest.yield_fixture
+def image_queries(monkeypatch):
+    """The names of the collections that are queried."""
+    collection_class = type(Image._get_collection())
+    find = collection_class.find
+    queries = []
+
+    def counting_find(self, *args, **kwargs):
+        queries.append(self.name)
+        return find(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_class, "find", counting_find)
+    yield queries
+
+
+def test_get_by_filenames(images, image_queries):
+    found = Image.get_by_filenames(FILENAMES + ["missing.png", "", None])
+    assert sorted(found) == FILENAMES
+    assert all(found[image.filename].id == image.id for image in images)
+    assert image_queries == [Image._get_collection_name()]
+
+
+def test_get_by_no_filenames(eventum, image_queries):
+    assert Image.get_by_filenames(["", None]) == {}
+    assert image_queries == []
+
+
+def test_clean_points_images_at_their_urls(eventum, images):
+    cat, dog, _ = images
+    post = BlogPost(title="Pets", slug="pets", author=CREATOR,
+                    images=[cat, dog],
+                    markdown_content="![](cat.png) ![](dog.png) "
+                                     "![](cat.png) ![](missing.png)")
+    with eventum.app.test_request_context():
+        post.clean()
+        cat_url, dog_url = cat.url(), dog.url()
+
+    assert cat_url != "cat.png"
+    assert post.html_content.count('src="%s"' % cat_url) == 2
+    assert post.html_content.count('src="%s"' % dog_url) == 1
+    # Images that aren't in the post are left alone.
+    assert 'src="missing.png"' in post.html_content
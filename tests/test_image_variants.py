@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from eventum.lib.image_variants import (_generate_and_record,
+                                        generate_variants)
+
+PIL = pytest.importorskip("PIL.Image")
+
+
+def test_variants_fit_their_size(tmpdir):
+    path = str(tmpdir.join("cat.jpg"))
+    PIL.new("RGB", (1200, 600)).save(path, "JPEG")
+
+    variants = generate_variants(path, {"thumbnail": 300, "huge": 2000})
+    assert variants == {"thumbnail": "cat.thumbnail.jpg"}
+    thumbnail = PIL.open(os.path.join(str(tmpdir), variants["thumbnail"]))
+    assert thumbnail.size == (300, 150)
+
+
+def test_palette_png_variants(tmpdir):
+    path = str(tmpdir.join("logo.png"))
+    PIL.new("P", (800, 800)).save(path, "PNG")
+
+    variants = generate_variants(path, {"thumbnail": 100})
+    assert variants == {"thumbnail": "logo.thumbnail.png"}
+
+
+class FakeLogger(object):
+
+    def __init__(self):
+        self.exceptions = []
+
+    def exception(self, message):
+        self.exceptions.append(message)
+
+
+def test_failures_are_logged(tmpdir):
+    """Errors on the background pool should be logged, not lost."""
+    path = str(tmpdir.join("broken.jpg"))
+    with open(path, "wb") as f:
+        f.write(b"not a jpeg")
+
+    logger = FakeLogger()
+    assert _generate_and_record(None, path, {"thumbnail": 300}, False,
+                                logger) is None
+    assert len(logger.exceptions) == 1
@@ -0,0 +1,38 @@
+from eventum.lib.markdown_cache import MarkdownCache
+from eventum.models import Event
+
+
+def test_render_is_cached():
+    """Rendering the same markdown twice should only run markdown once."""
+    cache = MarkdownCache()
+    assert cache.render('*hi*') == '<p><em>hi</em></p>'
+    assert cache.render('*hi*') == '<p><em>hi</em></p>'
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5,
+                             'size': 1}
+
+
+def test_least_recently_used_is_evicted():
+    cache = MarkdownCache(size=2)
+    cache.render('a')
+    cache.render('b')
+    cache.render('a')
+    cache.render('c')
+    cache.render('a')
+    cache.render('b')
+    assert cache.hits == 2
+    assert cache.misses == 4
+
+
+def test_unchanged_description_is_not_rendered(eventum):
+    """Events should only render descriptions whose markdown has changed."""
+    event = Event(short_description_markdown='*old*')
+    event.render_markdown()
+    assert event.short_description == '<p><em>old</em></p>'
+
+    event.short_description = 'kept'
+    event.render_markdown()
+    assert event.short_description == 'kept'
+
+    event.short_description_markdown = '*new*'
+    event.render_markdown()
+    assert event.short_description == '<p><em>new</em></p>'
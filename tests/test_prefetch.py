@@ -0,0 +1,58 @@
+from bson import DBRef, ObjectId
+
+from eventum.lib.prefetch import identity_map, prefetch
+from eventum.models import Event, EventSeries, Image, User
+
+
+def test_prefetch_resolves_from_identity_map(eventum):
+    """References to documents that were already loaded this request should
+    be resolved without going back to Mongo.
+    """
+    user = User(id=ObjectId(), name='Ada')
+    image = Image(id=ObjectId(), filename='ada.png')
+    loaded = identity_map()
+    loaded[(User._get_collection_name(), user.id)] = user
+    loaded[(Image._get_collection_name(), image.id)] = image
+
+    user.image = DBRef(Image._get_collection_name(), image.id)
+    events = [Event(title=str(i),
+                    creator=DBRef(User._get_collection_name(), user.id))
+              for i in range(3)]
+
+    assert prefetch(events, 'creator', 'creator.image') == events
+    assert all(event.creator is user for event in events)
+    assert user.image is image
+
+
+def test_prefetch_skips_missing_references(eventum):
+    """Documents without the reference, or with it already loaded, are left
+    alone.
+    """
+    user = User(id=ObjectId(), name='Grace')
+    with_creator = Event(title='a', creator=user)
+    without_creator = Event(title='b')
+
+    prefetch([with_creator, without_creator], 'creator', 'image')
+    assert with_creator.creator is user
+    assert without_creator.creator is None
+
+
+def test_prefetch_keeps_tracking_changes(eventum):
+    """Documents with prefetched references should still save the changes
+    made to them afterwards.
+    """
+    events = [Event(id=ObjectId(), title=str(i)) for i in range(2)]
+    Event.objects.insert(events, load_bulk=False)
+    series = EventSeries(slug='prefetched', events=events[:1])
+    series.save()
+    try:
+        loaded = EventSeries.objects.get(id=series.id)
+        prefetch([loaded], 'events')
+        assert [event.title for event in loaded.events] == ['0']
+
+        loaded.events.append(events[1])
+        loaded.save()
+        assert EventSeries.objects.get(id=series.id).events == events
+    finally:
+        series.delete()
+        Event.objects(id__in=[event.id for event in events]).delete()
@@ -0,0 +1,104 @@
+from datetime import date, time
+
+from bson import ObjectId
+from flask import Flask
+
+from eventum.lib.events import EventsHelper
+from eventum.lib.response_cache import (LRUBackend, RedisBackend,
+                                        ResponseCache)
+from eventum.models import Event, EventSeries, User
+
+
+class FakeRedis(object):
+    """Just enough of a Redis client for :class:`RedisBackend`."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+
+
+def make_cache(backend):
+    app = Flask("testing")
+    app.config["EVENTUM_RESPONSE_CACHE"] = backend
+    app.config["EVENTUM_RESPONSE_CACHE_TIMEOUT"] = 60
+    return ResponseCache(app)
+
+
+def test_lru_evicts_least_recently_used():
+    backend = LRUBackend(2)
+    backend.set("a", 1, 60)
+    backend.set("b", 2, 60)
+    backend.get("a")
+    backend.set("c", 3, 60)
+    assert backend.get("a") == 1
+    assert backend.get("b") is None
+    assert backend.get("c") == 3
+
+
+def test_lru_expires_values():
+    backend = LRUBackend(2)
+    backend.set("a", 1, -1)
+    assert backend.get("a") is None
+
+
+def test_invalidating_a_tag_drops_its_values():
+    for backend in (LRUBackend(10), RedisBackend(FakeRedis())):
+        cache = make_cache(backend)
+        cache.set("home", ["events", "posts"], "<html>")
+        cache.set("media", ["images"], "<img>")
+
+        cache.invalidate("posts")
+        assert cache.get("home", ["events", "posts"]) is None
+        assert cache.get("media", ["images"]) == "<img>"
+
+
+def test_fragment_is_created_once():
+    cache = make_cache(LRUBackend(10))
+    calls = []
+
+    def create():
+        calls.append(1)
+        return "fragment"
+
+    assert cache.fragment("f", ["posts"], create) == "fragment"
+    assert cache.fragment("f", ["posts"], create) == "fragment"
+    assert len(calls) == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = make_cache(None)
+    cache.set("home", ["events"], "<html>")
+    assert cache.get("home", ["events"]) is None
+
+
+def test_series_update_invalidates_cached_pages(eventum):
+    """Updating every event in a series at once sends no signals, so the
+    helper has to invalidate the cached pages itself.
+    """
+    client = eventum.app.test_client()
+    series = EventSeries(slug='cached-series')
+    series.save()
+    event = Event(id=ObjectId(), title='Before', slug='cached-series',
+                  creator=User(id=ObjectId(), name='Ada'),
+                  is_recurring=True, parent_series=series,
+                  start_date=date.today(), start_time=time(12, 0))
+    Event.objects.insert([event], load_bulk=False)
+    try:
+        url = '/admin/api/events/this_week'
+        assert b'Before' in client.get(url).data
+        assert b'Before' in client.get(url).data  # Now served from cache
+
+        EventsHelper._update_series_events(series, event, {'title': 'After'})
+        body = client.get(url).data
+        assert b'After' in body and b'Before' not in body
+    finally:
+        Event.objects(parent_series=series).delete()
+        series.delete()
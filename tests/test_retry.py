@@ -0,0 +1,6 @@
+from eventum.lib.retry import backoff
+
+
+def test_backoff_doubles_up_to_limit():
+    delays = [backoff(n, 2, 60).total_seconds() for n in range(1, 7)]
+    assert delays == [2, 4, 8, 16, 32, 60]
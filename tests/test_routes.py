@@ -1,3 +1,8 @@
+import datetime as dt
+import importlib
+import os
+from io import BytesIO
+
 import pytest
 
 
@@ -28,3 +33,247 @@ def test_admin_routes_permissions(client):
 def test_admin_routes_redirect(client, admin_session):
     assert client.get("/admin").status_code == 301
     assert client.get("/admin/users/me").status_code == 302
+
+
+def test_events_this_week_not_modified(client):
+    response = client.get("/admin/api/events/this_week")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get("/admin/api/events/this_week",
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_events_this_week_not_modified_skips_loading(client, monkeypatch):
+    """An unchanged week should be answered before any event is loaded."""
+    from eventum.lib.response_cache import invalidate
+    # ``eventum.routes.api`` is also the name of the blueprint.
+    api = importlib.import_module("eventum.routes.api")
+
+    etag = client.get("/admin/api/events/this_week").headers["ETag"]
+    invalidate("events")
+
+    def fail(event):
+        raise AssertionError("Loaded an event for a 304")
+
+    monkeypatch.setattr(api, "_jsonifiable_event", fail)
+    response = client.get("/admin/api/events/this_week",
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize("query", [
+    "start=tomorrow", "published=yes", "limit=0", "cursor=2015-01-01.nope",
+])
+def test_events_api_bad_query(client, query):
+    assert client.get("/admin/api/events?" + query).status_code == 400
+
+
+@pytest.yield_fixture(scope="function")
+def drafts(eventum):
+    from eventum.models import Event
+    events = Event._get_collection()
+    ids = events.insert_many([
+        Event(title=title, slug=title, published=published,
+              start_date=dt.datetime(2015, 4, 1)).to_mongo()
+        for title, published in [("public", True), ("draft", False)]
+    ]).inserted_ids
+    yield
+    events.delete_many({"_id": {"$in": ids}})
+
+
+def _event_titles(response):
+    return sorted(e["title"] for e in response.get_json()["data"]["events"])
+
+
+def test_events_api_hides_drafts(eventum, client, drafts, monkeypatch):
+    """Unpublished events should only be sent to logged in users, and never
+    with a public cache policy.
+    """
+    monkeypatch.setitem(eventum.app.config, "EVENTUM_GOOGLE_AUTH_ENABLED",
+                        True)
+    response = client.get("/admin/api/events")
+    assert _event_titles(response) == ["public"]
+    assert response.headers["Cache-Control"] == "public, max-age=60"
+
+    assert client.get("/admin/api/events?published=false").status_code == 401
+
+    monkeypatch.setitem(eventum.app.config, "EVENTUM_GOOGLE_AUTH_ENABLED",
+                        False)
+    response = client.get("/admin/api/events")
+    assert _event_titles(response) == ["draft", "public"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    response = client.get("/admin/api/events?published=false")
+    assert _event_titles(response) == ["draft"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+
+def test_cache_policies(client, admin_session):
+    response = client.get("/admin/api/events?published=true")
+    assert response.headers["Cache-Control"] == "public, max-age=60"
+
+    response = client.get("/admin/events")
+    assert response.headers["Cache-Control"] == "public, max-age=0"
+
+    # The routes of the app Eventum is part of are left alone.
+    response = client.get("/not-eventum")
+    assert "Cache-Control" not in response.headers
+
+
+def test_media_upload_too_large(eventum, client, admin_session,
+                                monkeypatch):
+    """Uploads should be refused while they are read, without changing the
+    request size limit of the rest of the app.
+    """
+    monkeypatch.setitem(eventum.app.config, "EVENTUM_MAX_UPLOAD_SIZE", 1000)
+    folder = eventum.app.config["EVENTUM_UPLOAD_FOLDER"]
+    before = set(os.listdir(folder))
+
+    png = b"\x89PNG\r\n\x1a\n" + b"\0" * 2000
+    response = client.post("/admin/media/upload", data={
+        "filename": "big",
+        "extension": "png",
+        "image": (BytesIO(png), "big.png"),
+    })
+    assert response.status_code == 413
+    assert set(os.listdir(folder)) == before
+    assert eventum.app.config["MAX_CONTENT_LENGTH"] is None
+
+
+def test_media_file_offload(eventum, client):
+    folder = eventum.app.config["EVENTUM_UPLOAD_FOLDER"]
+    with open(os.path.join(folder, "offload.png"), "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+
+    eventum.app.config["EVENTUM_MEDIA_OFFLOAD"] = "x-accel-redirect"
+    try:
+        response = client.get("/admin/media/uploads/offload.png")
+    finally:
+        eventum.app.config["EVENTUM_MEDIA_OFFLOAD"] = None
+    assert response.headers["X-Accel-Redirect"] == \
+        "/eventum-uploads/offload.png"
+    assert response.data == b""
+
+    response = client.get("/admin/media/uploads/offload.png")
+    assert response.data == b"\x89PNG\r\n\x1a\n"
+    assert client.get("/admin/media/uploads/missing.png").status_code == 404
+
+
+def test_media_file_fingerprint(eventum, client):
+    """Only the fingerprint that was added to the URL of the same file should
+    make it immutable.
+    """
+    from eventum.models import Image
+
+    folder = eventum.app.config["EVENTUM_UPLOAD_FOLDER"]
+    path = os.path.join(folder, "print.png")
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+    image = Image(filename="print.png", default_path=path,
+                  sha256="0123456789abcdef" * 4)
+    with eventum.app.test_request_context():
+        assert image.url().endswith("?v=0123456789ab")
+
+    policies = eventum.app.config["EVENTUM_CACHE_POLICIES"]
+    for query, policy in [("", "media.file"),
+                          ("?v=1", "media.file"),
+                          ("?v=0123456789ab", "fingerprinted"),
+                          ("?v=ba9876543210", "media.file")]:
+        response = client.get("/admin/media/uploads/print.png" + query)
+        assert response.headers["Cache-Control"] == policies[policy]
+
+    # A file that is replaced under the same name isn't immutable anymore.
+    with open(path + ".new", "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\nnew")
+    os.rename(path + ".new", path)
+    response = client.get("/admin/media/uploads/print.png?v=0123456789ab")
+    assert response.headers["Cache-Control"] == policies["media.file"]
+
+
+def test_become_drops_the_cached_user(eventum, client, monkeypatch):
+    from eventum.lib.user_cache import user_cache
+    from eventum.routes.base import SUPER_USER_GPLUS_ID
+    monkeypatch.setitem(eventum.app.config, "DEBUG", True)
+    ttl = eventum.app.config["EVENTUM_USER_CACHE_TTL"]
+
+    # Logs in (and caches) the super user, since auth is disabled.
+    client.get("/admin/users")
+    try:
+        assert client.get("/admin/become/1").status_code == 302
+        user = user_cache.get(SUPER_USER_GPLUS_ID, ttl)
+        assert user.can("edit") and not user.can("publish")
+    finally:
+        client.get("/admin/become/3")
+    assert user_cache.get(SUPER_USER_GPLUS_ID, ttl).can("admin")
+
+
+def test_events_not_modified(client, admin_session):
+    etag = client.get("/admin/events").headers["ETag"]
+    response = client.get("/admin/events", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+@pytest.yield_fixture(scope="function")
+def past_weeks(eventum):
+    """Two events in each of the last 26 weeks, with the same creator."""
+    from bson import ObjectId
+    from eventum.models import Event, User
+    creator = User(id=ObjectId(), name="Ada")
+    today = dt.date.today()
+    last_sunday = today - dt.timedelta(days=today.isoweekday() % 7)
+    events = Event._get_collection()
+    ids = events.insert_many([
+        Event(title="%d.%d" % (week + 1, day), slug="week", creator=creator,
+              start_date=last_sunday - dt.timedelta(weeks=week, days=day))
+        .to_mongo()
+        for week in range(26) for day in (3, 6)
+    ]).inserted_ids
+    yield
+    events.delete_many({"_id": {"$in": ids}})
+
+
+def test_events_for_template_queries(eventum, past_weeks, monkeypatch):
+    """Rendering more weeks shouldn't take more queries, and the events of
+    past weeks should be newest first.
+    """
+    from eventum.models import Event
+    # ``eventum.routes.events`` is also the name of the blueprint.
+    events = importlib.import_module("eventum.routes.events")
+    collection_class = type(Event._get_collection())
+    find = collection_class.find
+    calls = []
+
+    def counting_find(self, *args, **kwargs):
+        calls.append(self.name)
+        return find(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_class, "find", counting_find)
+    counts = {}
+    for past in (1, 26):
+        del calls[:]
+        with eventum.app.test_request_context():
+            past_events, _, _, _ = events._get_events_for_template(past, 0)
+        counts[past] = len(calls)
+        assert len(past_events) == past
+
+    assert counts[1] == counts[26]
+    # Weeks are oldest first, and the events in them newest first.
+    assert [e.title for e in past_events[-1]["events"]] == ["1.3", "1.6"]
+    assert [e.title for e in past_events[0]["events"]] == ["26.3", "26.6"]
+
+
+@pytest.mark.parametrize("query", [
+    "limit=0", "limit=500", "before=123.nope", "before=soon.",
+])
+def test_media_images_bad_query(client, admin_session, query):
+    assert client.get("/admin/media/images?" + query).status_code == 400
+    assert client.get("/admin/media/image-view?mode=editor&" +
+                      query).status_code == 400
+
+
+def test_gcal_stats(client, admin_session):
+    response = client.get("/admin/stats/google-calendar")
+    assert response.status_code == 200
+    assert "pending" in response.get_data(as_text=True)
@@ -0,0 +1,73 @@
+import pymongo
+import pytest
+from pymongo.errors import BulkWriteError
+
+from eventum.models import Tag
+
+
+class RacingCollection(object):
+    """Wraps the tag collection.  Before the bulk upsert runs, another
+    request creates the ``raced`` tag, and the upsert of it fails with a
+    duplicate key error.
+    """
+
+    def __init__(self, collection, raced):
+        self.collection = collection
+        self.raced = raced
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, requests, ordered=True):
+        names = [request._filter['tagname'] for request in requests]
+        index = names.index(self.raced)
+        self.collection.insert_one(Tag(tagname=self.raced).to_mongo())
+
+        others = requests[:index] + requests[index + 1:]
+        result = self.collection.bulk_write(others, ordered=ordered)
+        upserted = [dict(upsert, index=upsert['index'] +
+                         (upsert['index'] >= index))
+                    for upsert in result.bulk_api_result['upserted']]
+        raise BulkWriteError({
+            'writeErrors': [{'code': 11000, 'index': index,
+                             'errmsg': 'E11000 duplicate key error'}],
+            'upserted': upserted
+        })
+
+
+@pytest.yield_fixture
+def tagnames(eventum):
+    names = ['tag-test-a', 'tag-test-b', 'tag-test-c']
+    yield names
+    Tag.objects(tagname__in=names).delete()
+
+
+def test_tags_keep_their_order(tagnames):
+    a, b, c = tagnames
+    existing = Tag(tagname=a)
+    existing.save()
+
+    tags = Tag.get_or_create_tags([b, a, c, b])
+    assert [tag.tagname for tag in tags] == [b, a, c, b]
+    assert tags[1].id == existing.id
+    assert tags[0] is tags[3]
+
+    # The new tags have the IDs of the documents the upsert inserted.
+    for tag in tags:
+        assert tag.id == Tag.objects.get(tagname=tag.tagname).id
+    assert Tag.get_or_create_tags([]) == []
+
+
+@pytest.mark.skipif(not hasattr(pymongo, 'UpdateOne'),
+                    reason='PyMongo 2 uses the older bulk API.')
+def test_tags_created_by_a_race_are_fetched(tagnames, monkeypatch):
+    a, b, c = tagnames
+    collection = RacingCollection(Tag._get_collection(), raced=b)
+    monkeypatch.setattr(Tag, '_get_collection',
+                        classmethod(lambda cls: collection))
+
+    tags = Tag.get_or_create_tags([a, b, c])
+    assert [tag.tagname for tag in tags] == [a, b, c]
+    monkeypatch.undo()
+    for tag in tags:
+        assert tag.id == Tag.objects.get(tagname=tag.tagname).id
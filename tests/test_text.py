@@ -1,6 +1,7 @@
 import pytest
 
-from eventum.lib.text import clean_markdown
+from eventum.lib.text import (MAX_TAG_LENGTH, clean_markdown, snippet,
+                              snippet_key, truncate_html)
 
 
 @pytest.mark.parametrize(["markdown", "output"], [
@@ -17,3 +18,75 @@ from eventum.lib.text import clean_markdown
 ])
 def test_clean_markdown(markdown, output):
     assert clean_markdown(markdown) == output
+
+
+def test_snippet():
+    html = '<p>One <em>two</em>\nthree <img src="a.png" /> four.</p>'
+    assert snippet(html, length=2) == '<p>One <em>two...</em></p>'
+    assert snippet(html, newlines=False, tags=False) == \
+        ' One  two  three   four. '
+    assert snippet(html, images=True) == html
+
+
+def test_snippet_key():
+    assert snippet_key() == snippet_key(100, "...", True, True, False)
+    assert snippet_key(length=40) != snippet_key()
+    assert snippet_key(truncate_text="") != snippet_key()
+    assert "." not in snippet_key() and "$" not in snippet_key()
+
+
+@pytest.mark.parametrize(["html", "length", "output"], [
+    ('<p>One two</p>', 2, '<p>One two</p>'),
+    ('<p>One <b>two</b> three</p>', 2, '<p>One <b>two...</b></p>'),
+    ('<div><p>One<br>two three', 1, '<div><p>One...</p></div>'),
+    ('<ul><li>One<li>two</ul> three four', 3,
+     '<ul><li>One<li>two</ul> three...'),
+    ('AT&amp;T rocks', 1, 'AT&amp;T...'),
+    ('AT&T; rocks', 1, 'AT&T;...'),
+    ('A & B; C', 2, 'A & B...'),
+    ('One two', 0, ''),
+])
+def test_truncate_html(html, length, output):
+    assert truncate_html(html, length, '...') == output
+
+
+def test_truncate_html_chunks():
+    html = '<p>One <b>t' + 'wo</b> th' + 'ree four</p>'
+    chunks = iter(['<p>One <b>t', 'wo</b> th', 'ree four</p>', 'unread'])
+    assert truncate_html(chunks, 2, '...') == '<p>One <b>two...</b></p>'
+    assert list(chunks) == ['unread']
+    assert truncate_html(iter(html), 10, '...') == html
+
+
+@pytest.mark.parametrize("first", ["<p>AT&T ", "<p>1 < 2 "])
+def test_truncate_html_unclosed_chunks(first):
+    """A ``&`` or ``<`` that is never closed is text, so it shouldn't make
+    the chunks after the truncation point be read.
+    """
+    def chunks():
+        yield first
+        for _ in range(1000):
+            yield "word " * 1000
+        yield "unread"
+
+    html = chunks()
+    assert truncate_html(html, 3, '...') == first + 'word...</p>'
+    assert len(list(html)) > 990
+
+
+def test_truncate_html_long_tags():
+    title = 'x' * (MAX_TAG_LENGTH - len('a title=""'))
+    tag = '<a title="%s">' % title
+    chunks = ['<p>One ', tag[:100], tag[100:], 'two</a> three</p>']
+    assert truncate_html(iter(chunks), 2, '...') == \
+        '<p>One ' + tag + 'two...</a></p>'
+
+    # Longer tags are text.
+    assert truncate_html('<p>One <a title="x%s">two</a></p>' % title, 2,
+                         '...') == '<p>One <a...</p>'
+
+
+def test_truncate_html_deeply_nested():
+    html = '<div>word ' * 2000 + '</div>' * 2000
+    assert truncate_html(html, 3, '') == \
+        '<div>word <div>word <div>word' + '</div>' * 3
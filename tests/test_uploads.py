@@ -0,0 +1,71 @@
+import hashlib
+import os
+from io import BytesIO
+
+import pytest
+from werkzeug.formparser import parse_form_data
+from werkzeug.test import EnvironBuilder
+
+from eventum.lib.error import EventumError
+from eventum.lib.uploads import save_upload, upload_stream_factory
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\0' * 100
+
+
+def test_upload_is_hashed(tmpdir):
+    path = str(tmpdir.join("a.png"))
+    upload = save_upload(BytesIO(PNG), path, 1000)
+    assert upload.sha256 == hashlib.sha256(PNG).hexdigest()
+    assert upload.size == len(PNG)
+    assert os.listdir(str(tmpdir)) == ["a.png"]
+
+
+@pytest.mark.parametrize("name,data,error", [
+    ("big.png", PNG, EventumError.Upload.TooLarge),
+    ("fake.jpg", PNG, EventumError.Upload.WrongType),
+])
+def test_rejected_uploads_leave_no_files(eventum, tmpdir, name, data, error):
+    with pytest.raises(error):
+        save_upload(BytesIO(data), str(tmpdir.join(name)), 50)
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_duplicate_uploads_share_a_file(tmpdir):
+    first = str(tmpdir.join("a.png"))
+    second = str(tmpdir.join("b.png"))
+    save_upload(BytesIO(PNG), first, 1000)
+    save_upload(BytesIO(PNG), second, 1000,
+                existing_path=lambda sha256: first)
+    assert os.path.samefile(first, second)
+
+
+def _parse_upload(tmpdir, data, max_size, upload_files):
+    environ = EnvironBuilder(method="POST", data={
+        "filename": "a",
+        "image": (BytesIO(data), "a.png"),
+    }).get_environ()
+    factory = upload_stream_factory(str(tmpdir), max_size, upload_files)
+    return parse_form_data(environ, stream_factory=factory)
+
+
+def test_uploads_are_written_while_the_form_is_parsed(tmpdir):
+    upload_files = []
+    stream, form, files = _parse_upload(tmpdir, PNG, 1000, upload_files)
+    assert files["image"].stream is upload_files[0]
+    assert upload_files[0].size == len(PNG)
+
+    path = str(tmpdir.join("a.png"))
+    upload = upload_files[0].save(path)
+    assert upload.sha256 == hashlib.sha256(PNG).hexdigest()
+    assert os.listdir(str(tmpdir)) == ["a.png"]
+
+
+def test_large_uploads_are_refused_while_the_form_is_parsed(eventum,
+                                                            tmpdir):
+    upload_files = []
+    with pytest.raises(EventumError.Upload.TooLarge):
+        _parse_upload(tmpdir, PNG + b'\0' * 10000, 1000, upload_files)
+    assert os.path.getsize(upload_files[0].path) <= 1000
+
+    upload_files[0].discard()
+    assert os.listdir(str(tmpdir)) == []
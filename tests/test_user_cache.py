@@ -0,0 +1,94 @@
+import importlib
+
+import pytest
+from flask import g, session
+
+from eventum.lib.user_cache import UserCache, user_cache
+from eventum.models import User
+
+# ``eventum.lib.user_cache`` is also the name of the cache.
+user_cache_module = importlib.import_module("eventum.lib.user_cache")
+
+
+class Clock(object):
+    now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.yield_fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(user_cache_module, "time", clock)
+    yield clock
+
+
+@pytest.yield_fixture
+def user(eventum):
+    user = User(name="Ada Cache", email="ada@example.com",
+                gplus_id="ada-cache")
+    user.save()
+    yield user
+    User.objects(gplus_id=user.gplus_id).delete()
+
+
+def test_users_are_cached_until_they_expire(user, clock):
+    cache = UserCache()
+    assert cache.get(user.gplus_id, 60).name == "Ada Cache"
+
+    # Updates don't send signals, so the cached user is kept.
+    User.objects(id=user.id).update(set__name="Changed")
+    clock.now += 59
+    assert cache.get(user.gplus_id, 60).name == "Ada Cache"
+
+    clock.now += 2
+    assert cache.get(user.gplus_id, 60).name == "Changed"
+    assert cache.stats() == {"hits": 1, "misses": 2, "size": 1}
+
+
+def test_no_ttl_bypasses_the_cache(user, clock):
+    cache = UserCache()
+    cache.get(user.gplus_id, 0)
+    cache.get(user.gplus_id, 0)
+    assert cache.stats() == {"hits": 0, "misses": 2, "size": 0}
+
+
+def test_cached_users_are_copies(user, clock):
+    cache = UserCache()
+    first = cache.get(user.gplus_id, 60)
+    first.name = "Changed during a request"
+    assert cache.get(user.gplus_id, 60).name == "Ada Cache"
+
+
+def test_saving_or_deleting_a_user_drops_it(user, clock):
+    user_cache.get(user.gplus_id, 60)
+    user.name = "Saved"
+    user.save()
+    assert user_cache.get(user.gplus_id, 60).name == "Saved"
+
+    user.delete()
+    assert user_cache.get(user.gplus_id, 60) is None
+
+
+def test_current_user_is_looked_up_once_per_request(eventum, user,
+                                                    monkeypatch):
+    base = importlib.import_module("eventum.routes.base")
+    monkeypatch.setitem(eventum.app.config, "EVENTUM_GOOGLE_AUTH_ENABLED",
+                        True)
+    get = user_cache.get
+    lookups = []
+
+    def counting_get(gplus_id, ttl):
+        lookups.append(gplus_id)
+        return get(gplus_id, ttl)
+
+    monkeypatch.setattr(user_cache, "get", counting_get)
+    for _ in range(2):
+        with eventum.app.test_request_context():
+            session["gplus_id"] = user.gplus_id
+            base.lookup_current_user()
+            base.lookup_current_user()
+            assert g.user.gplus_id == user.gplus_id
+
+    assert lookups == [user.gplus_id] * 2